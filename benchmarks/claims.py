@@ -0,0 +1,105 @@
+""" Compares authenticated requests with and without the user's claims embedded in the access token.
+
+    Seeds a throwaway `<MONGODB_DATABASE>_benchmark` database on `MONGODB_URL` with `--users`
+    users, then runs `core.main:app` in-process and sends `--requests` requests to `GET /auth/user/`
+    from `--concurrency` clients, once with tokens issued while `JWT_EMBED_USER_CLAIMS` is off, which
+    load the user on every request, and once with tokens carrying the claims.  It reports the
+    throughput, the latency and the MongoDB commands each request sent.  The database is dropped
+    afterwards.
+
+    Run with `python -m benchmarks.claims`.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from core import db, metrics
+from core.main import app
+from core.models import User, UserInDB
+from core.routers.auth.utils import create_access_token
+from core.settings import settings
+
+
+async def seed(users: int) -> list[User]:
+    documents = [
+        UserInDB(
+            username=f'user{i}',
+            given_name='Bench',
+            family_name='Mark',
+            email=f'user{i}@benchmark.test',
+            password='',
+        ) for i in range(users)
+    ]
+    await UserInDB.insert_many(documents)
+
+    return [User.from_db(user) for user in await UserInDB.find_all().to_list()]
+
+
+def route_commands(route: str) -> float:
+    return sum(
+        sample.value
+        for metric in metrics.MONGODB_COMMANDS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total') and sample.labels['route'] == route
+    )
+
+
+async def measure(client: httpx.AsyncClient, tokens: list[str], requests: int, concurrency: int) -> list[float]:
+    pending = iter(range(requests))
+    timings = []
+
+    async def send():
+        for i in pending:
+            start = time.perf_counter()
+            response = await client.get('/auth/user/', headers={'Authorization': f'Bearer {tokens[i % len(tokens)]}'})
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    await asyncio.gather(*[send() for _ in range(concurrency)])
+
+    return timings
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    settings.MONGODB_DATABASE = f'{settings.MONGODB_DATABASE}_benchmark'
+
+    async with app.router.lifespan_context(app):
+        try:
+            users = await seed(args.users)
+
+            print(f'{"tokens":<16} {"requests/s":>11} {"p50 ms":>8} {"p99 ms":>8} {"queries":>8}')
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+                for name, embed in (('without claims', False), ('with claims', True)):
+                    settings.JWT_EMBED_USER_CLAIMS = embed
+                    tokens = [create_access_token({'sub': user.email}, user=user)[0] for user in users]
+
+                    commands = route_commands('/auth/user/')
+                    start = time.perf_counter()
+                    timings = await measure(client, tokens, args.requests, args.concurrency)
+                    seconds = time.perf_counter() - start
+                    queries = (route_commands('/auth/user/') - commands) / args.requests
+
+                    print(
+                        f'{name:<16} {args.requests / seconds:>11.0f} {percentile(timings, 0.5):>8.2f} '
+                        f'{percentile(timings, 0.99):>8.2f} {queries:>8.2f}'
+                    )
+
+        finally:
+            await db._write_client.drop_database(settings.MONGODB_DATABASE)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+""" Compares payload sizes and query latency of whole documents against sparse fieldsets.
+
+    Seeds a throwaway database next to `MONGODB_DATABASE` on `MONGODB_URL`, then reads pages of
+    comments and products with each projection, as the list endpoints do for `?fields=`.  The
+    database is dropped afterwards.
+
+    Run with `python -m benchmarks.fieldsets`.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from statistics import median
+
+import bson
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.models import COMMENT_FIELDS, PRODUCT_FIELDS
+from core.responses import fast_response
+from core.settings import settings
+
+FIELDSETS = {
+    'Comment': {
+        'whole': COMMENT_FIELDS,
+        'message,user_id,created_at': {'_id': 1, 'message': 1, 'user_id': 1, 'created_at': 1},
+    },
+    'Product': {
+        'whole': PRODUCT_FIELDS,
+        'external_id': {'_id': 1, 'external_id': 1},
+    },
+}
+
+
+async def seed(database, count: int):
+    product_ids = [ObjectId() for _ in range(max(1, count // 100))]
+    now = datetime.now(tz=timezone.utc)
+
+    await database['Product'].insert_many(
+        [
+            {
+                '_id': product_id,
+                'external_id': f'plugin-{i}',
+                'affiliate_links': [f'https://shop{n}.example.com/plugins/plugin-{i}?ref=vst-realm' for n in range(8)],
+            }
+            for i, product_id in enumerate(product_ids)
+        ]
+    )
+    await database['Comment'].insert_many(
+        [
+            {
+                'message': f'Comment number {i} about this plugin, long enough to look like a real one.',
+                'user_id': ObjectId(),
+                'product_id': product_ids[i % len(product_ids)],
+                'created_at': now - timedelta(seconds=i),
+                'updated_at': None,
+                'is_reply': False,
+                'parent_id': None,
+                'reply_count': i % 7,
+                'upvotes': i % 13,
+                'downvotes': i % 5,
+                'score': i % 13 - i % 5,
+            }
+            for i in range(count)
+        ]
+    )
+
+
+async def measure(collection, projection: dict, limit: int, repeat: int) -> tuple[float, int, int]:
+    """ Returns the median latency in milliseconds, and the BSON and JSON sizes of one page. """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        documents = await collection.find({}, projection, limit=limit).to_list(None)
+        timings.append(time.perf_counter() - start)
+
+    bson_bytes = sum(len(bson.encode(document)) for document in documents)
+    json_bytes = len(fast_response(documents).body)
+
+    return median(timings) * 1000, bson_bytes, json_bytes
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10_000)
+    parser.add_argument('--limit', type=int, default=1_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    database = client[f'{settings.MONGODB_DATABASE}_benchmark']
+
+    try:
+        await seed(database, args.documents)
+
+        print(f'{"collection":<10} {"fields":<28} {"ms":>8} {"BSON bytes":>11} {"JSON bytes":>11}')
+        for collection, fieldsets in FIELDSETS.items():
+            for name, projection in fieldsets.items():
+                latency, bson_bytes, json_bytes = await measure(
+                    database[collection], projection, args.limit, args.repeat
+                )
+                print(f'{collection:<10} {name:<28} {latency:>8.2f} {bson_bytes:>11} {json_bytes:>11}')
+
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
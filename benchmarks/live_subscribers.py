@@ -0,0 +1,82 @@
+""" Holds many idle live feed subscribers on one hub and measures what they cost.
+
+    Every subscriber is a task draining `LiveHub.stream`, as a connected client's response would,
+    without the HTTP layer.  Reports the memory per subscriber, the CPU spent on heartbeats while
+    idle, and how long one event takes to reach every subscriber.
+
+    Run with `python -m benchmarks.live_subscribers`.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+from core.live import HEARTBEAT, LiveHub, LocalBackplane
+from core.settings import settings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=10_000)
+    parser.add_argument('--products', type=int, default=1)
+    parser.add_argument('--heartbeat', type=float, default=1.0)
+    parser.add_argument('--idle', type=float, default=5.0)
+    args = parser.parse_args()
+
+    hub = LiveHub(
+        LocalBackplane(),
+        queue_size=settings.LIVE_QUEUE_SIZE,
+        replay_size=settings.LIVE_REPLAY_SIZE,
+        heartbeat=args.heartbeat,
+        linger=settings.LIVE_CHANNEL_LINGER_SECONDS,
+    )
+    product_ids = [ObjectId() for _ in range(args.products)]
+    received = asyncio.Event()
+    remaining = args.subscribers
+
+    async def listen(product_id):
+        nonlocal remaining
+
+        async for frame in hub.stream(product_id):
+            if frame is not HEARTBEAT:
+                remaining -= 1
+                if not remaining:
+                    received.set()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    listeners = [asyncio.create_task(listen(product_ids[i % len(product_ids)])) for i in range(args.subscribers)]
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    subscribe_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    cpu = time.process_time()
+    await asyncio.sleep(args.idle)
+    idle_cpu = time.process_time() - cpu
+
+    start = time.perf_counter()
+    for product_id in product_ids:
+        await hub.publish(product_id, 'comment', {'_id': ObjectId(), 'message': 'Hello'})
+    await received.wait()
+    fan_out = time.perf_counter() - start
+
+    for listener in listeners:
+        listener.cancel()
+    await asyncio.gather(*listeners, return_exceptions=True)
+
+    print(f'subscribers:            {args.subscribers} on {args.products} product(s)')
+    print(f'subscribe time:         {subscribe_seconds * 1000:.1f} ms')
+    print(f'memory per subscriber:  {memory / args.subscribers / 1024:.2f} KiB')
+    print(f'idle CPU:               {idle_cpu / args.idle * 100:.1f}% with a {args.heartbeat}s heartbeat')
+    print(f'fan-out of one event:   {fan_out * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,157 @@
+""" Compares looking up users one query per user, one query per request and through the batch loader.
+
+    Seeds a throwaway `<MONGODB_DATABASE>_benchmark` database on `MONGODB_URL` with `--users`
+    users, then runs `core.main:app` in-process and sends `--requests` requests to
+    `GET /user/batch/` from `--concurrency` clients, each asking for `--ids` users picked from a
+    small set of popular ones, the way comment listings ask for their authors.  The endpoint
+    resolves them with a `find_one` per user, with a single `$in` query per request, and with
+    `user_loader` merging the lookups of concurrent requests.  It reports the throughput, the
+    latency, the MongoDB commands per request and the mean batch the loader sent.  The database
+    is dropped afterwards.
+
+    Run with `python -m benchmarks.loaders`.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+from beanie.odm.fields import PydanticObjectId
+from pymongo.read_concern import ReadConcern
+
+from core import db, metrics
+from core.db import read_one
+from core.loaders import load_public_users
+from core.main import app
+from core.models import PublicUser, UserInDB
+from core.routers import user
+from core.settings import settings
+
+
+class PerUser:
+    """ Fetches every user with its own query, the way lookups worked before the loader. """
+
+    async def load_many(self, ids: list[PydanticObjectId]) -> list[PublicUser | None]:
+        return await asyncio.gather(
+            *[
+                read_one(UserInDB, {'_id': id}, projection_model=PublicUser, read_concern=ReadConcern('local'))
+                for id in ids
+            ]
+        )
+
+
+class PerRequest:
+    """ Fetches each request's users with one `$in` query, without merging concurrent requests. """
+
+    async def load_many(self, ids: list[PydanticObjectId]) -> list[PublicUser | None]:
+        users = await load_public_users(ids)
+        return [users.get(id) for id in ids]
+
+
+async def seed(users: int) -> list[str]:
+    await UserInDB.get_motor_collection().insert_many(
+        [
+            {
+                'username': f'user{i}',
+                'given_name': 'Bench',
+                'family_name': 'Mark',
+                'email': f'user{i}@benchmark.test',
+                'email_verified': True,
+                'password': '',
+                'image': '',
+            } for i in range(users)
+        ]
+    )
+
+    return [str(user['_id']) async for user in UserInDB.get_motor_collection().find({}, {'_id': 1})]
+
+
+def command_count() -> float:
+    return sum(
+        sample.value
+        for metric in metrics.MONGODB_COMMANDS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total')
+    )
+
+
+def batch_sizes() -> tuple[float, float]:
+    samples = {
+        sample.name: sample.value
+        for metric in metrics.LOADER_BATCH_SIZE.collect()
+        for sample in metric.samples
+        if sample.labels['loader'] == 'user'
+    }
+
+    return samples.get('loader_batch_size_sum', 0.0), samples.get('loader_batch_size_count', 0.0)
+
+
+async def measure(client: httpx.AsyncClient, lookups: list[list[str]], concurrency: int) -> list[float]:
+    pending = iter(lookups)
+    timings = []
+
+    async def send():
+        for ids in pending:
+            start = time.perf_counter()
+            response = await client.get('/user/batch/', params={'ids': ','.join(ids)})
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    await asyncio.gather(*[send() for _ in range(concurrency)])
+
+    return timings
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000)
+    parser.add_argument('--popular', type=int, default=100)
+    parser.add_argument('--ids', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=5_000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    settings.MONGODB_DATABASE = f'{settings.MONGODB_DATABASE}_benchmark'
+    loader = user.user_loader
+
+    async with app.router.lifespan_context(app):
+        try:
+            ids = await seed(args.users)
+            rng = random.Random(0)
+            popular = ids[:args.popular]
+            lookups = [rng.sample(popular, min(args.ids, len(popular))) for _ in range(args.requests)]
+
+            print(
+                f'{"lookups":<12} {"requests/s":>11} {"p50 ms":>8} {"p99 ms":>8} {"commands":>9} {"batch":>7}'
+            )
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+                for name, lookup in (('per user', PerUser()), ('per request', PerRequest()), ('batched', loader)):
+                    user.user_loader = lookup
+
+                    commands = command_count()
+                    keys, batches = batch_sizes()
+                    start = time.perf_counter()
+                    timings = await measure(client, lookups, args.concurrency)
+                    seconds = time.perf_counter() - start
+                    commands = (command_count() - commands) / args.requests
+                    keys, batches = batch_sizes()[0] - keys, batch_sizes()[1] - batches
+
+                    print(
+                        f'{name:<12} {args.requests / seconds:>11.0f} {percentile(timings, 0.5):>8.2f} '
+                        f'{percentile(timings, 0.99):>8.2f} {commands:>9.2f} '
+                        f'{keys / batches if batches else 0:>7.1f}'
+                    )
+
+        finally:
+            user.user_loader = loader
+            await db._write_client.drop_database(settings.MONGODB_DATABASE)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,683 @@
+""" Drives mixed workloads through the API's routers and reports throughput, latency and queries.
+
+    `core.main:app` runs in-process behind httpx's ASGI transport, so the timings cover the
+    middleware, validation, serialization and MongoDB, but not the network.  It runs against the
+    MongoDB on `MONGODB_URL`, in the `--database` database which is dropped and re-seeded on every
+    run, or with `--memory` against mongomock-motor.  The in-memory stand-in lacks part of the
+    query language: text search, index hints and the thread and page aggregations fail there.  No
+    commands are counted and its timings mean little, so it is only good for trying the harness out.
+
+    The seeded data is skewed the way real traffic is: a few products hold most of the comments,
+    some comments have long reply chains and most votes go to a few comments.  Queries per request
+    come from the `mongodb_commands` metric, which is kept per route path template, so operations
+    sharing a template within a mix share its average.
+
+    `--save results.json` stores the results and `--baseline results.json` compares the run with
+    stored ones, exiting with status 1 on a regression larger than `--tolerance`.
+
+    Run with `python -m benchmarks.loadtest`.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from typing import Awaitable, Callable
+
+import httpx
+from beanie import init_beanie
+from beanie.odm.utils.dump import get_dict
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core import db, metrics
+from core.constants import CommentAction
+from core.db import DOCUMENT_MODELS, read_session
+from core.main import app
+from core.models import (
+    Comment,
+    CommentVote,
+    Product,
+    UserInDB,
+)
+from core.ranking import ranking_stages
+from core.routers.auth.passwords import password_hasher
+from core.settings import settings
+
+PASSWORD = 'load-test-password'
+INSERT_BATCH_SIZE = 10_000
+
+# Query counts do not depend on timing, so they are held to a much tighter tolerance.
+QUERY_TOLERANCE = 0.05
+
+MESSAGES = (
+    'This compressor plugin is the warmest one I have tried on a mix bus.',
+    'The reverb tails are lovely but the plugin eats a lot of CPU.',
+    'Does anyone know whether this synth plugin runs on Apple silicon?',
+    'The preset browser crashes the host whenever I search for a patch.',
+)
+SEARCH_TERMS = ('reverb', 'preset crashes', 'compressor', 'silicon')
+
+
+@dataclass
+class Dataset:
+    user_ids: list[str]
+    emails: list[str]
+    tokens: list[str]
+    product_ids: list[str]
+    product_weights: list[float]
+    comment_ids: list[str]
+    comment_weights: list[float]
+    comment_products: dict[str, str]
+    thread_ids: list[str]
+
+    def product(self, rng: random.Random) -> str:
+        return rng.choices(self.product_ids, self.product_weights)[0]
+
+    def comment(self, rng: random.Random) -> str:
+        return rng.choices(self.comment_ids, self.comment_weights)[0]
+
+    def new_comment(self, rng: random.Random) -> dict:
+        return {'message': rng.choice(MESSAGES), 'user_id': rng.choice(self.user_ids), 'product_id': self.product(rng)}
+
+
+@dataclass
+class Stats:
+    """ Throughput and queries are per item, which is a request except for bulk imports. """
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    queries: float | None
+
+
+def zipf_weights(count: int, exponent: float) -> list[float]:
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+async def insert(model, documents: list[dict]):
+    for start in range(0, len(documents), INSERT_BATCH_SIZE):
+        await model.get_motor_collection().insert_many(documents[start:start + INSERT_BATCH_SIZE], ordered=False)
+
+
+def new_comment(rng: random.Random, user_ids: list[ObjectId], product_id: ObjectId, created_at: datetime) -> Comment:
+    return Comment(
+        id=ObjectId(),
+        message=rng.choice(MESSAGES),
+        user_id=rng.choice(user_ids),
+        product_id=product_id,
+        created_at=created_at,
+    )
+
+
+async def seed(args, rng: random.Random) -> tuple[list[ObjectId], list[str], list[ObjectId], dict[ObjectId, Comment]]:
+    """ Writes the users, products, comments, reply chains and votes straight to the collections. """
+    now = datetime.now(tz=timezone.utc)
+    password = await password_hasher.hash(PASSWORD)
+
+    user_ids = [ObjectId() for _ in range(args.users)]
+    emails = [f'load-test-{i}@example.com' for i in range(args.users)]
+    await insert(
+        UserInDB,
+        [
+            {
+                '_id': user_id,
+                'username': f'load-test-{i}',
+                'given_name': 'Load',
+                'family_name': f'Test {i}',
+                'email': email,
+                'email_verified': True,
+                'password': password,
+                'image': '',
+            }
+            for i, (user_id, email) in enumerate(zip(user_ids, emails))
+        ],
+    )
+
+    product_ids = [ObjectId() for _ in range(args.products)]
+    await insert(
+        Product,
+        [
+            {'_id': product_id, 'external_id': f'load-test-{i}', 'affiliate_links': [f'https://example.com/{i}']}
+            for i, product_id in enumerate(product_ids)
+        ],
+    )
+
+    # A handful of products get most of the comments.
+    comments = {}
+    for product_id in rng.choices(product_ids, zipf_weights(args.products, 1.0), k=args.comments):
+        comment = new_comment(rng, user_ids, product_id, now - timedelta(minutes=rng.uniform(0, 30 * 24 * 60)))
+        comments[comment.id] = comment
+
+    roots = list(comments.values())
+    for root in rng.sample(roots, min(args.chains, len(roots))):
+        parent = root
+        for depth in range(args.chain_depth):
+            reply = new_comment(rng, user_ids, root.product_id, parent.created_at + timedelta(minutes=depth + 1))
+            reply.is_reply, reply.parent_id = True, parent.id
+            parent.reply_count += 1
+            comments[reply.id] = reply
+            parent = reply
+
+    # Most votes go to a few comments, and most of them are upvotes.
+    ranked = rng.sample(list(comments), len(comments))
+    votes = {}
+    for comment_id in rng.choices(ranked, zipf_weights(len(ranked), 1.2), k=args.votes):
+        action = CommentAction.UPVOTE if rng.random() < 0.8 else CommentAction.DOWNVOTE
+        votes[comment_id, rng.choice(user_ids)] = action
+
+    for (comment_id, _), action in votes.items():
+        comment = comments[comment_id]
+        if action == CommentAction.UPVOTE:
+            comment.upvotes += 1
+        else:
+            comment.downvotes += 1
+        comment.score = comment.upvotes - comment.downvotes
+
+    await insert(Comment, [get_dict(comment, to_db=True) for comment in comments.values()])
+    await insert(
+        CommentVote,
+        [
+            {'_id': ObjectId(), 'action': action.value, 'comment_id': comment_id, 'user_id': user_id}
+            for (comment_id, user_id), action in votes.items()
+        ],
+    )
+
+    await Comment.get_motor_collection().update_many({}, ranking_stages())
+
+    return user_ids, emails, product_ids, comments
+
+
+async def prepare(args, rng: random.Random, client: httpx.AsyncClient) -> Dataset:
+    user_ids, emails, product_ids, comments = await seed(args, rng)
+
+    tokens = []
+    for email in emails[:args.sessions]:
+        response = await client.post('/auth/local/login/', data={'username': email, 'password': PASSWORD})
+        response.raise_for_status()
+        tokens.append(response.json()['access_token'])
+
+    roots = [comment for comment in comments.values() if not comment.is_reply]
+    comment_weights = zipf_weights(len(roots), 1.0)
+    rng.shuffle(comment_weights)
+
+    return Dataset(
+        user_ids=[str(user_id) for user_id in user_ids],
+        emails=emails,
+        tokens=tokens,
+        product_ids=[str(product_id) for product_id in product_ids],
+        product_weights=zipf_weights(len(product_ids), 1.0),
+        comment_ids=[str(comment.id) for comment in roots],
+        comment_weights=comment_weights,
+        comment_products={str(comment.id): str(comment.product_id) for comment in roots},
+        thread_ids=[str(comment.id) for comment in comments.values() if comment.reply_count],
+    )
+
+
+Operation = Callable[[httpx.AsyncClient, Dataset, random.Random], Awaitable[httpx.Response]]
+
+# Operations by name, with the path template their MongoDB commands are counted under.
+OPERATIONS: dict[str, tuple[str, Operation]] = {}
+
+
+def operation(name: str, route: str):
+
+    def register(fn: Operation) -> Operation:
+        OPERATIONS[name] = (route, fn)
+        return fn
+
+    return register
+
+
+@operation('list users', '/user/')
+async def list_users(client, data, rng):
+    return await client.get('/user/', params={'fields': 'username,image'})
+
+
+@operation('user batch', '/user/batch/')
+async def user_batch(client, data, rng):
+    return await client.get('/user/batch/', params={'ids': ','.join(rng.sample(data.user_ids, 10))})
+
+
+@operation('get user', '/user/{id}/')
+async def get_user(client, data, rng):
+    return await client.get(f'/user/{rng.choice(data.user_ids)}/')
+
+
+@operation('create user', '/user/')
+async def create_user(client, data, rng):
+    name = f'load-test-{ObjectId()}'
+    return await client.post(
+        '/user/',
+        json={
+            'username': name,
+            'given_name': 'Load',
+            'family_name': 'Test',
+            'email': f'{name}@example.com',
+            'password': PASSWORD,
+        },
+    )
+
+
+@operation('list comments', '/comment/')
+async def list_comments(client, data, rng):
+    return await client.get('/comment/', params={'product_id': data.product(rng)})
+
+
+@operation('top comments', '/comment/')
+async def top_comments(client, data, rng):
+    return await client.get('/comment/', params={'product_id': data.product(rng), 'is_reply': False, 'order_by': 'top'})
+
+
+@operation('hot comments', '/comment/')
+async def hot_comments(client, data, rng):
+    return await client.get('/comment/', params={'product_id': data.product(rng), 'is_reply': False, 'order_by': 'hot'})
+
+
+@operation('sparse comments', '/comment/')
+async def sparse_comments(client, data, rng):
+    return await client.get('/comment/', params={'product_id': data.product(rng), 'fields': 'message,upvotes'})
+
+
+@operation('search comments', '/comment/search/')
+async def search_comments(client, data, rng):
+    return await client.get(
+        '/comment/search/',
+        params={'q': rng.choice(SEARCH_TERMS), 'product_id': data.product(rng)},
+    )
+
+
+@operation('get comment', '/comment/{id}/')
+async def get_comment(client, data, rng):
+    return await client.get(f'/comment/{data.comment(rng)}/')
+
+
+@operation('create comment', '/comment/')
+async def create_comment(client, data, rng):
+    return await client.post('/comment/', json=data.new_comment(rng))
+
+
+@operation('list replies', '/replies/{parent_id}/')
+async def list_replies(client, data, rng):
+    return await client.get(f'/replies/{rng.choice(data.thread_ids)}/')
+
+
+@operation('create reply', '/replies/{parent_id}/')
+async def create_reply(client, data, rng):
+    parent_id = data.comment(rng)
+    return await client.post(
+        f'/replies/{parent_id}/',
+        json={
+            'message': rng.choice(MESSAGES),
+            'user_id': rng.choice(data.user_ids),
+            'product_id': data.comment_products[parent_id],
+        },
+    )
+
+
+@operation('vote', '/comment-vote/')
+async def vote(client, data, rng):
+    return await client.post(
+        '/comment-vote/',
+        json={
+            'action': CommentAction.UPVOTE.value if rng.random() < 0.8 else CommentAction.DOWNVOTE.value,
+            'comment_id': data.comment(rng),
+            'user_id': rng.choice(data.user_ids),
+        },
+    )
+
+
+@operation('list products', '/product/')
+async def list_products(client, data, rng):
+    return await client.get('/product/')
+
+
+@operation('get product', '/product/{id}/')
+async def get_product(client, data, rng):
+    return await client.get(f'/product/{data.product(rng)}/')
+
+
+@operation('product thread', '/product/{id}/thread/')
+async def product_thread(client, data, rng):
+    return await client.get(f'/product/{data.product(rng)}/thread/', params={'depth': 5})
+
+
+@operation('product page', '/product/{id}/page/')
+async def product_page(client, data, rng):
+    return await client.get(f'/product/{data.product(rng)}/page/')
+
+
+@operation('login', '/auth/local/login/')
+async def login(client, data, rng):
+    return await client.post('/auth/local/login/', data={'username': rng.choice(data.emails), 'password': PASSWORD})
+
+
+@operation('current user', '/auth/user/')
+async def current_user(client, data, rng):
+    return await client.get('/auth/user/', headers={'Authorization': f'Bearer {rng.choice(data.tokens)}'})
+
+
+@operation('email exists', '/auth/exists/')
+async def email_exists(client, data, rng):
+    email = rng.choice(data.emails) if rng.random() < 0.5 else f'unknown-{ObjectId()}@example.com'
+    return await client.get('/auth/exists/', params={'email': email})
+
+
+# The relative weight of each operation in a mix.
+MIXES = {
+    'browse': {
+        'list comments': 25,
+        'top comments': 10,
+        'hot comments': 10,
+        'get comment': 10,
+        'list replies': 10,
+        'product page': 10,
+        'product thread': 5,
+        'get product': 5,
+        'list products': 2,
+        'list users': 1,
+        'user batch': 7,
+        'get user': 5,
+    },
+    'engage': {
+        'vote': 40,
+        'create comment': 10,
+        'create reply': 10,
+        'list comments': 20,
+        'sparse comments': 10,
+        'get comment': 10,
+    },
+    'search': {
+        'search comments': 70,
+        'list comments': 30,
+    },
+    'auth': {
+        'current user': 50,
+        'email exists': 35,
+        'login': 10,
+        'create user': 5,
+    },
+}
+
+
+def command_counts() -> Counter:
+    counts = Counter()
+
+    for metric in metrics.MONGODB_COMMANDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith('_total'):
+                counts[sample.labels['route']] += sample.value
+
+    return counts
+
+
+def summarize(latencies: list[float], errors: int, items: int, seconds: float, queries: float | None) -> Stats:
+    ordered = sorted(latencies)
+
+    def percentile(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return Stats(
+        requests=len(ordered),
+        errors=errors,
+        throughput=items / seconds,
+        p50_ms=percentile(0.50),
+        p95_ms=percentile(0.95),
+        p99_ms=percentile(0.99),
+        queries=queries,
+    )
+
+
+async def run_mix(
+    client: httpx.AsyncClient,
+    data: Dataset,
+    rng: random.Random,
+    weights: dict[str, int],
+    requests: int,
+    concurrency: int,
+    count_queries: bool,
+) -> dict[str, Stats]:
+    """ Sends `requests` requests drawn from `weights` with `concurrency` clients at once. """
+    plan = rng.choices(list(weights), list(weights.values()), k=requests)
+    latencies, errors = defaultdict(list), Counter()
+
+    async def worker():
+        while plan:
+            name = plan.pop()
+            started = time.perf_counter()
+
+            try:
+                response = await OPERATIONS[name][1](client, data, rng)
+                failed = response.status_code >= 400
+
+            except Exception:
+                failed = True
+
+            latencies[name].append(time.perf_counter() - started)
+            errors[name] += failed
+
+    before = command_counts()
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    seconds = time.perf_counter() - started
+    commands = command_counts() - before
+
+    route_requests = Counter()
+    for name, values in latencies.items():
+        route_requests[OPERATIONS[name][0]] += len(values)
+
+    stats = {
+        name: summarize(
+            values,
+            errors[name],
+            len(values),
+            seconds,
+            commands[OPERATIONS[name][0]] / route_requests[OPERATIONS[name][0]] if count_queries else None,
+        )
+        for name, values in sorted(latencies.items())
+    }
+    stats['total'] = summarize(
+        [value for values in latencies.values() for value in values],
+        sum(errors.values()),
+        requests,
+        seconds,
+        sum(commands.values()) / requests if count_queries else None,
+    )
+
+    return stats
+
+
+async def run_ingest(
+    client: httpx.AsyncClient,
+    data: Dataset,
+    rng: random.Random,
+    items: int,
+    concurrency: int,
+    count_queries: bool,
+) -> dict[str, Stats]:
+    """ Writes `items` comments one request at a time, then the same number with one bulk import. """
+    stats = await run_mix(client, data, rng, {'create comment': 1}, items, concurrency, count_queries)
+    per_request = stats['create comment']
+
+    body = '\n'.join(json.dumps(data.new_comment(rng)) for _ in range(items))
+
+    before = command_counts()
+    started = time.perf_counter()
+    response = await client.post('/import/comments/', content=body, headers={'Content-Type': 'application/x-ndjson'})
+    seconds = time.perf_counter() - started
+    commands = command_counts() - before
+
+    failed = response.json()['failed'] if response.status_code < 400 else items
+    bulk = summarize([seconds], failed, items, seconds, sum(commands.values()) / items if count_queries else None)
+
+    return {'per request': per_request, 'bulk import': bulk}
+
+
+@asynccontextmanager
+async def database(args):
+    settings.MONGODB_DATABASE = args.database
+
+    if args.memory:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+
+        except ImportError:
+            sys.exit('--memory needs mongomock-motor, which is installed with the dev dependencies.')
+
+        db._write_client = db._read_client = AsyncMongoMockClient()
+        await init_beanie(database=db._write_client[args.database], document_models=DOCUMENT_MODELS)
+
+        # mongomock has no sessions, and with a single copy of the data the listings need none.
+        app.dependency_overrides[read_session] = lambda: None
+
+        try:
+            yield
+
+        finally:
+            app.dependency_overrides.pop(read_session, None)
+            db._write_client = db._read_client = None
+            password_hasher.shutdown()
+
+        return
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    await client.drop_database(args.database)
+    client.close()
+
+    async with app.router.lifespan_context(app):
+        yield
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ Lists how the results regressed from the baseline.
+
+        Latency and throughput are compared for each mix as a whole, where there are enough
+        requests for them to be stable, and for each ingest strategy; errors and queries for
+        every operation.
+    """
+    regressions = []
+
+    for mix, operations in baseline.items():
+        if mix not in results:
+            continue
+
+        for name in ['total'] if 'total' in operations else list(operations):
+            if (current := results[mix].get(name)) is None:
+                continue
+
+            previous = operations[name]
+            if current['throughput'] < previous['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f'{mix} / {name}: throughput fell from {previous["throughput"]:.1f}/s '
+                    f'to {current["throughput"]:.1f}/s'
+                )
+
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{mix} / {name}: p95 rose from {previous["p95_ms"]:.2f}ms to {current["p95_ms"]:.2f}ms'
+                )
+
+        for name, previous in operations.items():
+            if (current := results[mix].get(name)) is None:
+                continue
+
+            if current['errors'] > previous['errors']:
+                regressions.append(f'{mix} / {name}: errors rose from {previous["errors"]} to {current["errors"]}')
+
+            if None not in (current['queries'], previous['queries']) and (
+                current['queries'] > previous['queries'] * (1 + QUERY_TOLERANCE) + 0.01
+            ):
+                regressions.append(
+                    f'{mix} / {name}: queries rose from {previous["queries"]:.2f} to {current["queries"]:.2f}'
+                )
+
+    return regressions
+
+
+def report(mix: str, stats: dict[str, Stats]):
+    print(f'\n{mix}')
+    print(f'{"operation":<18} {"requests":>8} {"errors":>6} {"per sec":>9} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"queries":>7}')
+
+    for name, row in stats.items():
+        queries = '-' if row.queries is None else f'{row.queries:.2f}'
+        print(f'{name:<18} {row.requests:>8} {row.errors:>6} {row.throughput:>9.1f} {row.p50_ms:>8.2f} '
+              f'{row.p95_ms:>8.2f} {row.p99_ms:>8.2f} {queries:>7}')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--memory', action='store_true', help='use mongomock-motor instead of MongoDB')
+    parser.add_argument('--database', default='vst_realm_load_test', help='dropped and re-seeded on every run')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--comments', type=int, default=20_000)
+    parser.add_argument('--chains', type=int, default=20, help='number of long reply chains')
+    parser.add_argument('--chain-depth', type=int, default=50)
+    parser.add_argument('--votes', type=int, default=100_000)
+    parser.add_argument('--sessions', type=int, default=20, help='users logged in for authenticated requests')
+    parser.add_argument('--mixes', nargs='+', choices=[*MIXES, 'ingest'], default=[*MIXES, 'ingest'])
+    parser.add_argument('--requests', type=int, default=2_000, help='requests per mix')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--ingest', type=int, default=1_000, help='comments written per ingest strategy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    if not args.memory and args.database == settings.MONGODB_DATABASE:
+        parser.error('--database would drop the application database.')
+
+    rng = random.Random(args.seed)
+    results = {}
+
+    async with database(args):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+        async with httpx.AsyncClient(transport=transport, base_url='http://load-test') as client:
+            started = time.perf_counter()
+            data = await prepare(args, rng, client)
+            print(f'Seeded in {time.perf_counter() - started:.1f}s.')
+
+            for mix in args.mixes:
+                if mix == 'ingest':
+                    stats = await run_ingest(client, data, rng, args.ingest, args.concurrency, not args.memory)
+                else:
+                    stats = await run_mix(
+                        client, data, rng, MIXES[mix], args.requests, args.concurrency, not args.memory
+                    )
+
+                report(mix, stats)
+                results[mix] = {name: asdict(row) for name, row in stats.items()}
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+        for regression in regressions:
+            print(f'Regression: {regression}')
+
+        if regressions:
+            sys.exit(1)
+
+        print('\nNo regressions against the baseline.')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+""" Compares the keyset-paginated comment listing with the unpaginated listing it replaced.
+
+    Seeds a throwaway database next to `MONGODB_DATABASE` on `MONGODB_URL` with one product holding
+    `--comments` comments, then serves `GET /comment/?product_id=` through `core.main:app` in a
+    fresh process per listing and reports the latency percentiles and the process's peak resident
+    memory.  The keyset listing walks the pages by `next_cursor`, so deep pages are measured as
+    well as the first.  The old listing, restored under `/legacy/`, loads and serializes every
+    comment of the product on each request, so it is only requested `--legacy-requests` times.
+    The database is dropped afterwards.  Seeding a million comments takes a while.
+
+    Run with `python -m benchmarks.pagination`.
+"""
+import argparse
+import asyncio
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+
+import httpx
+from beanie.odm.fields import PydanticObjectId
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.models import Comment
+from core.settings import settings
+
+
+async def seed(collection, comments: int) -> ObjectId:
+    product_id = ObjectId()
+    now = datetime.now(tz=timezone.utc)
+
+    for start in range(0, comments, 10_000):
+        await collection.insert_many(
+            [
+                {
+                    'message': f'comment {i} ' * 8,
+                    'user_id': ObjectId(),
+                    'product_id': product_id,
+                    'created_at': now - timedelta(seconds=i),
+                    'updated_at': None,
+                    'is_reply': i % 5 == 0,
+                    'parent_id': None,
+                    'reply_count': 0,
+                    'upvotes': 0,
+                    'downvotes': 0,
+                    'score': 0,
+                    'top_score': 0.0,
+                    'hot_score': 0.0,
+                }
+                for i in range(start, min(start + 10_000, comments))
+            ],
+            ordered=False,
+        )
+
+    await collection.create_indexes(Comment.Settings.indexes)
+    return product_id
+
+
+def peak_rss_mb() -> float:
+    # `ru_maxrss` is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def serve(listing: str, database: str, product_id: str, requests: int, limit: int) -> tuple[list[float], float]:
+    from fastapi import APIRouter
+
+    from core.main import app
+
+    legacy = APIRouter()
+
+    @legacy.get('/comment/')
+    async def list_comments(product_id: PydanticObjectId) -> list[Comment]:
+        return await Comment.find({'product_id': product_id}).sort('-created_at').to_list()
+
+    app.include_router(legacy, prefix='/legacy')
+    settings.MONGODB_DATABASE = database
+
+    url = '/legacy/comment/' if listing == 'legacy' else '/comment/'
+    timings, cursor = [], None
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+            for _ in range(requests):
+                params = {'product_id': product_id}
+                if listing == 'keyset':
+                    params['limit'] = limit
+                    if cursor is not None:
+                        params['cursor'] = cursor
+
+                start = time.perf_counter()
+                response = await client.get(url, params=params)
+                timings.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+                if listing == 'keyset':
+                    cursor = response.json()['next_cursor']
+
+    return timings, peak_rss_mb()
+
+
+def run(*args) -> tuple[list[float], float]:
+    return asyncio.run(serve(*args))
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--comments', type=int, default=1_000_000)
+    parser.add_argument('--limit', type=int, default=settings.PAGINATION_DEFAULT_LIMIT)
+    parser.add_argument('--requests', type=int, default=1_000)
+    parser.add_argument('--legacy-requests', type=int, default=5)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    database = client[f'{settings.MONGODB_DATABASE}_benchmark']
+
+    try:
+        start = time.perf_counter()
+        product_id = await seed(database['Comment'], args.comments)
+        print(f'seeded {args.comments} comments in {time.perf_counter() - start:.1f}s')
+
+        print(f'{"listing":<10} {"requests":>9} {"p50 ms":>10} {"p99 ms":>10} {"peak RSS MB":>12}')
+        for listing, requests in (('keyset', args.requests), ('legacy', args.legacy_requests)):
+            # A process of its own for each listing, so the peak memory of one does not hide the other's.
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                timings, rss = await asyncio.get_running_loop().run_in_executor(
+                    executor, run, listing, database.name, str(product_id), requests, args.limit
+                )
+
+            print(
+                f'{listing:<10} {requests:>9} {percentile(timings, 0.5):>10.2f} {percentile(timings, 0.99):>10.2f} '
+                f'{rss:>12.0f}'
+            )
+
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+""" Measures how logins saturating the password hasher affect the latency of every other request.
+
+    Seeds a throwaway `<MONGODB_DATABASE>_benchmark` database on `MONGODB_URL` with `--users`
+    local users, then runs `core.main:app` in-process while `--concurrency` clients list comments
+    for `--seconds`.  The listing's latency is taken alone, then with `--logins` clients logging in
+    as fast as they can, once with bcrypt running on the event loop as it used to and once in the
+    password hasher's worker pool.  Logins the pool turns away with a 503 are counted, not retried
+    sooner.  The database is dropped afterwards.
+
+    Run with `python -m benchmarks.passwords`.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+from bson import ObjectId
+
+from core import db
+from core.main import app
+from core.models import UserInDB
+from core.routers.auth import utils
+from core.routers.auth.passwords import PasswordHasher, pwd_context
+from core.settings import settings
+
+PASSWORD = 'benchmark-password'
+
+
+class InlineHasher(PasswordHasher):
+    """ Hashes on the event loop, the way logins worked before the worker pool. """
+
+    async def _run(self, fn, *args):
+        return fn(*args)
+
+
+async def seed(users: int) -> list[str]:
+    hashed = pwd_context.hash(PASSWORD)
+    emails = [f'user{i}@benchmark.test' for i in range(users)]
+    await UserInDB.get_motor_collection().insert_many(
+        [
+            {
+                'username': f'user{i}',
+                'given_name': 'Bench',
+                'family_name': 'Mark',
+                'email': email,
+                'email_verified': True,
+                'password': hashed,
+                'image': '',
+            } for i, email in enumerate(emails)
+        ]
+    )
+
+    return emails
+
+
+async def measure(client: httpx.AsyncClient, emails: list[str], args, logins: int) -> tuple[list[float], int, int]:
+    deadline = time.perf_counter() + args.seconds
+    timings = []
+    logged_in = rejected = 0
+
+    async def list_comments():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get('/comment/', params={'product_id': str(ObjectId())})
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async def log_in(offset: int):
+        nonlocal logged_in, rejected
+
+        for i in itertools.count(offset, logins):
+            if time.perf_counter() >= deadline:
+                return
+
+            response = await client.post(
+                '/auth/local/login/',
+                data={
+                    'username': emails[i % len(emails)],
+                    'password': PASSWORD
+                }
+            )
+            if response.status_code == 503:
+                rejected += 1
+                await asyncio.sleep(float(response.headers['Retry-After']))
+                continue
+
+            response.raise_for_status()
+            logged_in += 1
+
+    await asyncio.gather(
+        *[list_comments() for _ in range(args.concurrency)],
+        *[log_in(offset) for offset in range(logins)],
+    )
+
+    return timings, logged_in, rejected
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    settings.MONGODB_DATABASE = f'{settings.MONGODB_DATABASE}_benchmark'
+    pool = utils.password_hasher
+
+    async with app.router.lifespan_context(app):
+        try:
+            emails = await seed(args.users)
+
+            print(
+                f'{"hashing":<18} {"p50 ms":>8} {"p99 ms":>8} {"requests":>9} {"logins/s":>9} {"rejected":>9}'
+            )
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+                for name, hasher, logins in (
+                    ('no logins', pool, 0),
+                    ('on the event loop', InlineHasher('thread', 0, 0), args.logins),
+                    ('worker pool', pool, args.logins),
+                ):
+                    utils.password_hasher = hasher
+                    timings, logged_in, rejected = await measure(client, emails, args, logins)
+
+                    print(
+                        f'{name:<18} {percentile(timings, 0.5):>8.2f} {percentile(timings, 0.99):>8.2f} '
+                        f'{len(timings):>9} {logged_in / args.seconds:>9.1f} {rejected:>9}'
+                    )
+
+        finally:
+            utils.password_hasher = pool
+            await db._write_client.drop_database(settings.MONGODB_DATABASE)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+""" Measures the time the rate limiter adds to each request.
+
+    Requests are passed straight to the ASGI middleware around an app which answers immediately,
+    so the difference with the bare app is the limiter's own cost.  No server or database is needed.
+
+    Run with `python -m benchmarks.ratelimit`.
+"""
+import argparse
+import asyncio
+import time
+
+from core.ratelimit import RateLimitMiddleware
+from core.routers.auth.utils import create_access_token
+from core.settings import RateLimit
+
+# Generous enough that no request is rejected, so every one goes through the whole check.
+LIMIT = RateLimit(rate=1e9, burst=10**9, concurrency=1_000)
+
+
+async def app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def send(message):
+    pass
+
+
+def make_scope(path: str, client: str, token: str | None = None) -> dict:
+    headers = [(b'host', b'localhost')]
+    if token is not None:
+        headers.append((b'authorization', f'Bearer {token}'.encode()))
+
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'headers': headers,
+        'client': (client, 50000),
+    }
+
+
+async def measure(handler, scopes: list[dict]) -> float:
+    """ Returns the mean time per request, in microseconds. """
+    start = time.perf_counter()
+    for scope in scopes:
+        await handler(scope, receive, send)
+
+    return (time.perf_counter() - start) / len(scopes) * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100_000)
+    args = parser.parse_args()
+
+    limiter = RateLimitMiddleware(app, limits={'GET /product/': LIMIT, 'GET /product/{id}/thread/': LIMIT})
+    token = create_access_token({'sub': 'user@example.com'})[0]
+    n = args.requests
+
+    scenarios = {
+        'no limiter': (app, [make_scope('/product/', '10.0.0.1')] * n),
+        'unlimited route': (limiter, [make_scope('/comment/', '10.0.0.1')] * n),
+        'one IP': (limiter, [make_scope('/product/', '10.0.0.1')] * n),
+        'distinct IPs': (
+            limiter,
+            [make_scope('/product/', f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}') for i in range(n)],
+        ),
+        'path template': (limiter, [make_scope('/product/6ad4d4c0c80a07b3b266ed69/thread/', '10.0.0.1')] * n),
+        'bearer token': (limiter, [make_scope('/product/', '10.0.0.1', token)] * n),
+    }
+
+    baseline = None
+    print(f'{"scenario":<16} {"us/request":>11} {"overhead":>9}')
+    for name, (handler, scopes) in scenarios.items():
+        per_request = await measure(handler, scopes)
+        baseline = per_request if baseline is None else baseline
+        print(f'{name:<16} {per_request:>11.2f} {per_request - baseline:>9.2f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
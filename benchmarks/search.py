@@ -0,0 +1,130 @@
+""" Compares the comment search's text index with the case-insensitive `$regex` scans it replaces.
+
+    Seeds a throwaway database next to `MONGODB_DATABASE` on `MONGODB_URL` with a synthetic corpus
+    and the `Comment` indexes, then times both ways of finding one product's comments that mention
+    a word.  The database is dropped afterwards.  Seeding millions of comments takes a while.
+
+    Run with `python -m benchmarks.search`.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from statistics import median
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.models import COMMENT_FIELDS, Comment
+from core.settings import settings
+
+WORDS = (
+    'synth pad bass lead warm analog digital filter resonance envelope oscillator preset patch '
+    'reverb delay chorus compressor limiter eq saturation tape vintage modern crisp muddy bright '
+    'dark huge thin lush glitchy buggy stable crash cpu latency update license price bundle demo '
+    'mix master vocals drums guitar piano strings cinematic ambient techno house trap lofi'
+).split()
+
+QUERIES = ('reverb', 'crash', 'cinematic', 'lofi')
+
+
+async def seed(collection, comments: int, products: int) -> list[ObjectId]:
+    product_ids = [ObjectId() for _ in range(products)]
+    now = datetime.now(tz=timezone.utc)
+    rng = random.Random(0)
+
+    for start in range(0, comments, 10_000):
+        await collection.insert_many(
+            [
+                {
+                    'message': ' '.join(rng.choices(WORDS, k=rng.randint(5, 40))),
+                    'user_id': ObjectId(),
+                    'product_id': product_ids[i % products],
+                    'created_at': now - timedelta(seconds=i),
+                    'is_reply': False,
+                    'reply_count': 0,
+                    'upvotes': 0,
+                    'downvotes': 0,
+                    'score': 0,
+                }
+                for i in range(start, min(start + 10_000, comments))
+            ],
+            ordered=False,
+        )
+
+    await collection.create_indexes(Comment.Settings.indexes)
+    return product_ids
+
+
+async def text_search(collection, product_id: ObjectId, word: str, limit: int) -> list:
+    return await collection.aggregate(
+        [
+            {'$match': {'product_id': product_id, '$text': {'$search': word}}},
+            {'$project': {**COMMENT_FIELDS, 'text_score': {'$meta': 'textScore'}}},
+            {'$sort': {'text_score': -1, '_id': -1}},
+            {'$limit': limit},
+        ]
+    ).to_list(None)
+
+
+async def regex_search(collection, product_id: ObjectId, word: str, limit: int) -> list:
+    return await collection.find(
+        {'product_id': product_id, 'message': {'$regex': word, '$options': 'i'}},
+        COMMENT_FIELDS,
+        limit=limit,
+    ).to_list(None)
+
+
+async def regex_scan(collection, product_id: ObjectId, word: str, limit: int) -> list:
+    # Without a product, as the moderation tooling searched.
+    return await collection.find(
+        {'message': {'$regex': word, '$options': 'i'}},
+        COMMENT_FIELDS,
+        limit=limit,
+    ).to_list(None)
+
+
+async def measure(search, collection, product_ids: list[ObjectId], limit: int, repeat: int) -> float:
+    timings = []
+    for i in range(repeat):
+        word = QUERIES[i % len(QUERIES)]
+        start = time.perf_counter()
+        await search(collection, product_ids[i % len(product_ids)], word, limit)
+        timings.append(time.perf_counter() - start)
+
+    return median(timings) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--comments', type=int, default=2_000_000)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    database = client[f'{settings.MONGODB_DATABASE}_benchmark']
+
+    try:
+        start = time.perf_counter()
+        product_ids = await seed(database['Comment'], args.comments, args.products)
+        print(f'seeded {args.comments} comments over {args.products} products in {time.perf_counter() - start:.1f}s')
+
+        print(f'{"search":<28} {"median ms":>10}')
+        for name, search in (
+            ('$text, one product', text_search),
+            ('$regex, one product', regex_search),
+            ('$regex, whole collection', regex_scan),
+        ):
+            latency = await measure(search, database['Comment'], product_ids, args.limit, args.repeat)
+            print(f'{name:<28} {latency:>10.2f}')
+
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
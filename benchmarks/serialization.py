@@ -0,0 +1,114 @@
+""" Compares the CPU time spent turning a page of comments into a response body.
+
+    The standard path builds `Comment` models from the driver's documents, then lets FastAPI
+    validate them against the `Page[Comment]` annotation and encode them to JSON.  The fast path
+    hands the documents straight to `FastJSONResponse`.  Beanie needs to reach MongoDB on
+    `MONGODB_URL` to initialize, but nothing is read or written.
+
+    Run with `python -m benchmarks.serialization`.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from statistics import median
+
+from beanie import init_beanie
+from beanie.odm.utils.parsing import parse_obj
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.models import COMMENT_FIELDS, Comment
+from core.pagination import Page, paginate
+from core.db import DOCUMENT_MODELS
+from core.responses import fast_response
+from core.settings import settings
+
+SIZES = (10, 100, 1_000, 10_000)
+
+
+def make_documents(count: int) -> list[dict]:
+    """ Builds comments shaped like the documents Motor returns for `COMMENT_FIELDS`. """
+    product_id, now = ObjectId(), datetime.now().replace(tzinfo=None)
+
+    return [
+        {
+            '_id': ObjectId(),
+            'message': f'Comment number {i} about this plugin, long enough to look like a real one.',
+            'user_id': ObjectId(),
+            'product_id': product_id,
+            'created_at': now - timedelta(seconds=i),
+            'updated_at': None,
+            'is_reply': False,
+            'parent_id': None,
+            'reply_count': i % 7,
+            'upvotes': i % 13,
+            'downvotes': i % 5,
+            'score': i % 13 - i % 5,
+            'top_score': (i % 13) / (i % 13 + i % 5 + 1),
+            'hot_score': (i % 13 - i % 5) / (i / 3600 + 2) ** 1.8,
+        }
+        for i in range(count)
+    ]
+
+
+async def standard(documents: list[dict], field) -> bytes:
+    page = paginate([parse_obj(Comment, document) for document in documents], len(documents), '-created_at')
+    content = await serialize_response(field=field, response_content=page)
+
+    return JSONResponse(content).body
+
+
+def fast(documents: list[dict]) -> bytes:
+    page = paginate(documents, len(documents), '-created_at')
+
+    return fast_response({'items': page.items, 'next_cursor': page.next_cursor}).body
+
+
+def measure(run, repeat: int) -> float:
+    """ Returns the median CPU time of `repeat` runs, in milliseconds. """
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        run()
+        timings.append(time.process_time() - start)
+
+    return median(timings) * 1000
+
+
+def main():
+    import asyncio
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    assert set(make_documents(1)[0]) == set(COMMENT_FIELDS)
+    field = create_model_field('Response', Page[Comment], mode='serialization')
+    loop = asyncio.new_event_loop()
+
+    # Models can only be built once Beanie is initialized.
+    client = AsyncIOMotorClient(settings.MONGODB_URL, io_loop=loop)
+    loop.run_until_complete(
+        init_beanie(database=client[settings.MONGODB_DATABASE], document_models=DOCUMENT_MODELS, skip_indexes=True)
+    )
+
+    print(f'{"items":>8} {"standard ms":>12} {"fast ms":>10} {"speedup":>8}')
+    for size in SIZES:
+        documents = make_documents(size)
+        # Large pages are repeated fewer times to keep the run short.
+        repeat = max(3, args.repeat * 100 // max(size, 100))
+
+        standard_ms = measure(lambda: loop.run_until_complete(standard(documents, field)), repeat)
+        fast_ms = measure(lambda: fast(documents), repeat)
+
+        print(f'{size:>8} {standard_ms:>12.3f} {fast_ms:>10.3f} {standard_ms / fast_ms:>7.1f}x')
+
+    client.close()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
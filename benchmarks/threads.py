@@ -0,0 +1,164 @@
+""" Compares loading a comment thread with one request to the thread endpoint and one request per level.
+
+    Seeds a throwaway `<MONGODB_DATABASE>_benchmark` database on `MONGODB_URL` with a product whose
+    `--roots` root comments each carry a tree of replies `--branching` wide and `--depth` deep,
+    and one root with `--hot-replies` direct replies to show the node cap at work.  `core.main:app`
+    runs in-process and each way loads the first page of roots with their replies `--depth`
+    levels down, `--repeat` times: through `GET /product/{id}/thread/`, and the way clients did
+    before it, listing the roots and then `GET /replies/{id}/` for every comment of each level.
+    It reports the latency of loading the page, the HTTP requests and the MongoDB commands it took.
+    The database is dropped afterwards.
+
+    Run with `python -m benchmarks.threads`.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from bson import ObjectId
+
+from core import db, metrics
+from core.main import app
+from core.models import Comment
+from core.settings import settings
+
+
+async def seed(args) -> ObjectId:
+    collection = Comment.get_motor_collection()
+    product_id = ObjectId()
+    now = datetime.now(tz=timezone.utc)
+    documents = []
+
+    def add(parent_id: ObjectId | None, age: int) -> ObjectId:
+        id = ObjectId()
+        documents.append(
+            {
+                '_id': id,
+                'message': 'comment',
+                'user_id': ObjectId(),
+                'product_id': product_id,
+                'created_at': now - timedelta(seconds=age),
+                'is_reply': parent_id is not None,
+                'parent_id': parent_id,
+                'reply_count': 0,
+                'upvotes': 0,
+                'downvotes': 0,
+                'score': 0,
+                'top_score': 0.0,
+                'hot_score': 0.0,
+            }
+        )
+        return id
+
+    def grow(parent_id: ObjectId, depth: int):
+        if depth < args.depth:
+            for i in range(args.branching):
+                grow(add(parent_id, i), depth + 1)
+
+    for i in range(args.roots):
+        grow(add(None, i + 1), 0)
+
+    hot = add(None, 0)
+    for i in range(args.hot_replies):
+        add(hot, i)
+
+    for start in range(0, len(documents), 10_000):
+        await collection.insert_many(documents[start:start + 10_000], ordered=False)
+
+    return product_id
+
+
+async def thread(client: httpx.AsyncClient, product_id: ObjectId, args) -> int:
+    response = await client.get(
+        f'/product/{product_id}/thread/',
+        params={
+            'depth': args.depth,
+            'limit': args.limit
+        }
+    )
+    response.raise_for_status()
+
+    return 1
+
+
+async def per_level(client: httpx.AsyncClient, product_id: ObjectId, args) -> int:
+    response = await client.get(
+        '/comment/',
+        params={
+            'product_id': str(product_id),
+            'is_reply': 'false',
+            'limit': args.limit
+        }
+    )
+    response.raise_for_status()
+    level = [comment['_id'] for comment in response.json()['items']]
+    requests = 1
+
+    for _ in range(args.depth):
+        responses = await asyncio.gather(
+            *[
+                client.get(f'/replies/{id}/', params={
+                    'order_by': 'created_at',
+                    'limit': settings.PAGINATION_MAX_LIMIT
+                }) for id in level
+            ]
+        )
+        requests += len(responses)
+        level = [reply['_id'] for response in responses for reply in response.raise_for_status().json()['items']]
+
+    return requests
+
+
+def commands() -> float:
+    return sum(
+        sample.value
+        for metric in metrics.MONGODB_COMMANDS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total')
+    )
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--roots', type=int, default=200)
+    parser.add_argument('--branching', type=int, default=3)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--hot-replies', type=int, default=20_000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    settings.MONGODB_DATABASE = f'{settings.MONGODB_DATABASE}_benchmark'
+
+    async with app.router.lifespan_context(app):
+        try:
+            product_id = await seed(args)
+
+            print(f'{"loading":<10} {"p50 ms":>8} {"p99 ms":>8} {"requests":>9} {"commands":>9}')
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+                for name, load in (('thread', thread), ('per level', per_level)):
+                    timings, requests, sent = [], 0, commands()
+
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        requests += await load(client, product_id, args)
+                        timings.append(time.perf_counter() - start)
+
+                    print(
+                        f'{name:<10} {percentile(timings, 0.5):>8.2f} {percentile(timings, 0.99):>8.2f} '
+                        f'{requests / args.repeat:>9.1f} {(commands() - sent) / args.repeat:>9.1f}'
+                    )
+
+        finally:
+            await db._write_client.drop_database(settings.MONGODB_DATABASE)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
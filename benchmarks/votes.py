@@ -0,0 +1,168 @@
+""" Compares casting votes one write per request with the write-behind vote buffer.
+
+    Seeds a throwaway database next to `MONGODB_DATABASE` on `MONGODB_URL` with `--comments`
+    comments, then posts `--votes` votes to `POST /comment-vote/` through `core.main:app` from
+    `--concurrency` clients, once with `VOTE_BUFFER_ENABLED` off and once with it on, each in a
+    fresh process against freshly seeded comments.  Most votes go to a few comments, as on the
+    site.  It reports the request latency, the throughput up to the last vote being written,
+    buffer drain included, the MongoDB commands sent and whether the tallies on the comments
+    match the votes stored.  The database is dropped afterwards.
+
+    Run with `python -m benchmarks.votes`.
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import httpx
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core.settings import settings
+
+
+async def seed(database, comments: int) -> list[ObjectId]:
+    await database['Comment'].delete_many({})
+    await database['CommentVote'].delete_many({})
+
+    comment_ids = [ObjectId() for _ in range(comments)]
+    await database['Comment'].insert_many(
+        [
+            {
+                '_id': comment_id,
+                'message': 'comment',
+                'user_id': ObjectId(),
+                'product_id': ObjectId(),
+                'created_at': datetime.now(tz=timezone.utc),
+                'is_reply': False,
+                'parent_id': None,
+                'reply_count': 0,
+                'upvotes': 0,
+                'downvotes': 0,
+                'score': 0,
+                'top_score': 0.0,
+                'hot_score': 0.0,
+            } for comment_id in comment_ids
+        ]
+    )
+
+    return comment_ids
+
+
+def make_votes(comment_ids: list[ObjectId], votes: int, users: int) -> list[dict]:
+    rng = random.Random(0)
+    user_ids = [str(ObjectId()) for _ in range(users)]
+    weights = [1 / (rank + 1) for rank in range(len(comment_ids))]
+
+    return [
+        {
+            'comment_id': str(comment_id),
+            'user_id': rng.choice(user_ids),
+            'action': rng.choice(('upvote', 'upvote', 'upvote', 'downvote')),
+        } for comment_id in rng.choices(comment_ids, weights=weights, k=votes)
+    ]
+
+
+async def cast(buffered: bool, database: str, votes: list[dict], concurrency: int) -> tuple[list[float], float, float]:
+    from core import metrics
+    from core.main import app
+
+    settings.MONGODB_DATABASE = database
+    settings.VOTE_BUFFER_ENABLED = buffered
+
+    pending = iter(votes)
+    timings = []
+
+    async def client_loop(client: httpx.AsyncClient):
+        for vote in pending:
+            start = time.perf_counter()
+            response = await client.post('/comment-vote/', json=vote)
+            timings.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    async with app.router.lifespan_context(app):
+        start = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://benchmark') as client:
+            await asyncio.gather(*[client_loop(client) for _ in range(concurrency)])
+
+    # The lifespan drains the buffer on the way out, so this includes writing the last votes.
+    seconds = time.perf_counter() - start
+    commands = sum(
+        sample.value
+        for metric in metrics.MONGODB_COMMANDS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total')
+    )
+
+    return timings, seconds, commands
+
+
+def run(*args) -> tuple[list[float], float, float]:
+    return asyncio.run(cast(*args))
+
+
+async def tallies_match(database) -> bool:
+    stored = {
+        (count['_id']['comment_id'], count['_id']['action']): count['count']
+        async for count in database['CommentVote'].aggregate(
+            [{'$group': {'_id': {'comment_id': '$comment_id', 'action': '$action'}, 'count': {'$sum': 1}}}]
+        )
+    }
+
+    async for comment in database['Comment'].find({}, {'upvotes': 1, 'downvotes': 1}):
+        if (
+            comment['upvotes'] != stored.get((comment['_id'], 'upvote'), 0)
+            or comment['downvotes'] != stored.get((comment['_id'], 'downvote'), 0)
+        ):
+            return False
+
+    return True
+
+
+def percentile(timings: list[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--comments', type=int, default=1_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--votes', type=int, default=20_000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    database = client[f'{settings.MONGODB_DATABASE}_benchmark']
+
+    try:
+        print(
+            f'{"writes":<12} {"p50 ms":>8} {"p99 ms":>8} {"votes/s":>9} {"commands":>9} '
+            f'{"per vote":>9} {"tallies":>8}'
+        )
+        for name, buffered in (('per request', False), ('buffered', True)):
+            comment_ids = await seed(database, args.comments)
+            votes = make_votes(comment_ids, args.votes, args.users)
+
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                timings, seconds, commands = await asyncio.get_running_loop().run_in_executor(
+                    executor, run, buffered, database.name, votes, args.concurrency
+                )
+
+            print(
+                f'{name:<12} {percentile(timings, 0.5):>8.2f} {percentile(timings, 0.99):>8.2f} '
+                f'{len(votes) / seconds:>9.0f} {commands:>9.0f} {commands / len(votes):>9.2f} '
+                f'{"match" if await tallies_match(database) else "drifted":>8}'
+            )
+
+    finally:
+        await client.drop_database(database.name)
+        client.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import hashlib
+from math import ceil, log
+
+
+class BloomFilter:
+    """ A set of strings which can answer "definitely absent" or "probably present".
+
+        Sized for `capacity` items at a false-positive rate of `error_rate`; items cannot be
+        removed, so the filter has to be rebuilt to forget them.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, ceil(-capacity * log(error_rate) / log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * log(2)))
+        self.count = 0
+
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str) -> list[int]:
+        # Double hashing derives every position from the two halves of a single digest.
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value: str) -> bool:
+        """ Adds `value`, returning whether it was absent before. """
+        added = False
+
+        for position in self._positions(value):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+
+        self.count += added
+        return added
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position // 8] & (1 << position % 8) for position in self._positions(value))
+
+    def estimated_error_rate(self) -> float:
+        """ The false-positive rate at the filter's current fill. """
+        return (int.from_bytes(self._bits).bit_count() / self.size) ** self.hashes
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    TypeVar,
+)
+
+from core import metrics
+from core.settings import settings
+
+T = TypeVar('T')
+
+MISSING = object()
+
+
+class CacheBackend(ABC):
+    """ Where cached documents are kept.
+
+        Backends shared between workers have to serialize the values themselves; the in-process
+        backend keeps the objects as they are.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Any:
+        """ Returns the value, or `MISSING` if it is not cached or has expired. """
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """ An in-process LRU cache; the least recently used entry is evicted once `max_entries` is reached. """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Any:
+        if (entry := self._entries.get(key)) is None:
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return MISSING
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            metrics.CACHE_EVICTIONS.inc()
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class DocumentCache:
+    """ A read-through cache of documents keyed by model name and `_id`.
+
+        Concurrent misses on the same key share a single load.  Writes must call `invalidate`;
+        other workers only see the change once their copy expires, after the model's TTL.  Loaders
+        have to read from the primary: a secondary which has not caught up with a write yet would
+        otherwise put the document from before it back in the cache for the whole TTL.
+    """
+
+    def __init__(self, backend: CacheBackend, ttls: dict[str, float], enabled: bool = True):
+        self.backend = backend
+        self.ttls = ttls
+        self.enabled = enabled
+
+        self._loading: dict[str, asyncio.Future] = {}
+        self._invalidated: set[str] = set()
+
+    async def get_or_load(self, model: str, id: Any, loader: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await loader()
+
+        key = f'{model}:{id}'
+
+        if (value := await self.backend.get(key)) is not MISSING:
+            metrics.CACHE_HITS.labels(model).inc()
+            return value
+
+        metrics.CACHE_MISSES.labels(model).inc()
+
+        if (loading := self._loading.get(key)) is not None:
+            return await asyncio.shield(loading)
+
+        self._loading[key] = loading = asyncio.ensure_future(loader())
+        try:
+            value = await asyncio.shield(loading)
+
+            # A write which landed while loading may not be reflected in the value, so it is not kept.
+            if value is not None and key not in self._invalidated:
+                await self.backend.set(key, value, self.ttls.get(model, settings.CACHE_DEFAULT_TTL_SECONDS))
+
+        finally:
+            self._loading.pop(key, None)
+            self._invalidated.discard(key)
+
+        return value
+
+    async def invalidate(self, model: str, *ids: Any):
+        if not self.enabled:
+            return
+
+        for id in ids:
+            key = f'{model}:{id}'
+            await self.backend.delete(key)
+
+            if key in self._loading:
+                self._invalidated.add(key)
+
+
+document_cache = DocumentCache(
+    backend=MemoryCacheBackend(max_entries=settings.CACHE_MAX_ENTRIES),
+    ttls=settings.CACHE_TTL_SECONDS,
+    enabled=settings.CACHE_ENABLED,
+)
@@ -2,6 +2,10 @@ from enum import Enum
 
 from core.settings import settings
 
+# Bumped whenever the user claims embedded in access tokens change shape.  Tokens carrying another
+# version fall back to loading the user from the database.
+USER_CLAIMS_VERSION = 1
+
 
 class Provider(str, Enum):
     LOCAL = settings.LOCAL_PROVIDER_NAME
@@ -0,0 +1,189 @@
+from typing import Any, AsyncIterator, TypeVar
+
+from beanie import Document, init_beanie
+from beanie.odm.utils.parsing import parse_obj
+from beanie.odm.utils.projection import get_projection
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorClientSession,
+    AsyncIOMotorCollection,
+)
+from pydantic import BaseModel
+from pymongo import ReadPreference
+from pymongo.read_concern import ReadConcern
+
+from core import models
+from core.metrics import mongo_command_listener
+from core.settings import settings
+
+DOCUMENT_MODELS = [
+    models.UserInDB,
+    models.Account,
+    models.Comment,
+    models.CommentVote,
+    models.Product,
+    models.RevokedToken,
+    models.CollectionVersion,
+]
+
+ModelType = TypeVar('ModelType', bound=BaseModel)
+
+_write_client: AsyncIOMotorClient | None = None
+_read_client: AsyncIOMotorClient | None = None
+
+
+def get_client_options() -> dict:
+    options = {
+        'maxPoolSize': settings.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGODB_MIN_POOL_SIZE,
+        'maxIdleTimeMS': settings.MONGODB_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'event_listeners': [mongo_command_listener],
+    }
+
+    # zstd and snappy need the optional `zstandard` and `python-snappy` packages.
+    if settings.MONGODB_COMPRESSORS:
+        options['compressors'] = ','.join(settings.MONGODB_COMPRESSORS)
+
+    return {key: value for key, value in options.items() if value is not None}
+
+
+async def init_db():
+    """ Connects to MongoDB and initializes Beanie with every document model.
+
+        Beanie, and so every write, goes through the primary on `MONGODB_URL`.  Listing and
+        retrieving read through `get_read_collection`, which prefers secondaries on `MONGODB_READ_URL`.
+    """
+    global _write_client, _read_client
+
+    _write_client = AsyncIOMotorClient(settings.MONGODB_URL, **get_client_options())
+    _read_client = AsyncIOMotorClient(
+        settings.MONGODB_READ_URL,
+        read_preference=ReadPreference.SECONDARY_PREFERRED,
+        **get_client_options(),
+    )
+
+    await init_beanie(database=_write_client[settings.MONGODB_DATABASE], document_models=DOCUMENT_MODELS)
+
+
+def close_db():
+    global _write_client, _read_client
+
+    for client in (_write_client, _read_client):
+        if client is not None:
+            client.close()
+
+    _write_client = _read_client = None
+
+
+def get_read_collection(
+    model: type[Document],
+    read_concern: ReadConcern,
+    primary: bool = False,
+) -> AsyncIOMotorCollection:
+    """ Returns the collection to read `model` from, on the primary when `primary` is set. """
+    client = _write_client if primary else _read_client
+    if client is None:
+        raise RuntimeError('The database has not been initialized.')
+
+    return client[settings.MONGODB_DATABASE].get_collection(
+        model.get_collection_name(),
+        read_concern=read_concern,
+    )
+
+
+async def read_session() -> AsyncIterator[AsyncIOMotorClientSession]:
+    """ A dependency opening a causally consistent session on the read client for the request.
+
+        Each read in the session sees at least the data the previous ones saw, even when they are
+        served by different secondaries, so a listing read after its ETag's version is never older.
+    """
+    if _read_client is None:
+        raise RuntimeError('The database has not been initialized.')
+
+    async with await _read_client.start_session(causal_consistency=True) as session:
+        yield session
+
+
+async def read_one(
+    model: type[Document],
+    filter: dict,
+    *,
+    read_concern: ReadConcern,
+    projection_model: type[ModelType] | None = None,
+    primary: bool = False,
+    session: AsyncIOMotorClientSession | None = None,
+) -> ModelType | None:
+    """ Reads one document, from the primary with `primary`, e.g. to fill a cache no lagging secondary may go stale. """
+    projection_model = projection_model or model
+    document = await get_read_collection(model, read_concern, primary).find_one(
+        filter,
+        get_projection(projection_model),
+        session=session,
+    )
+
+    return None if document is None else parse_obj(projection_model, document)
+
+
+async def read_many(
+    model: type[Document],
+    filter: dict,
+    *,
+    read_concern: ReadConcern,
+    sort: list[tuple[str, int]] | None = None,
+    limit: int = 0,
+    projection_model: type[ModelType] | None = None,
+    session: AsyncIOMotorClientSession | None = None,
+) -> list[ModelType]:
+    projection_model = projection_model or model
+    cursor = get_read_collection(model, read_concern).find(
+        filter,
+        get_projection(projection_model),
+        sort=sort,
+        limit=limit,
+        session=session,
+    )
+
+    return [parse_obj(projection_model, document) async for document in cursor]
+
+
+async def read_raw(
+    model: type[Document],
+    filter: dict,
+    *,
+    read_concern: ReadConcern,
+    projection: dict[str, int],
+    sort: list[tuple[str, int]] | None = None,
+    limit: int = 0,
+    session: AsyncIOMotorClientSession | None = None,
+) -> list[dict]:
+    """ Like `read_many`, but returns the documents as decoded by the driver, without building models.
+
+        Documents come back as stored, so fields missing from older documents are left out rather
+        than filled with their defaults.
+    """
+    cursor = get_read_collection(model, read_concern).find(filter, projection, sort=sort, limit=limit, session=session)
+
+    return await cursor.to_list(None)
+
+
+async def read_raw_one(
+    model: type[Document],
+    filter: dict,
+    *,
+    read_concern: ReadConcern,
+    projection: dict[str, int],
+    session: AsyncIOMotorClientSession | None = None,
+) -> dict | None:
+    return await get_read_collection(model, read_concern).find_one(filter, projection, session=session)
+
+
+async def read_exists(
+    model: type[Document],
+    filter: dict[str, Any],
+    *,
+    read_concern: ReadConcern,
+    session: AsyncIOMotorClientSession | None = None,
+) -> bool:
+    return await get_read_collection(model, read_concern).find_one(filter, {'_id': 1}, session=session) is not None
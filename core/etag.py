@@ -0,0 +1,86 @@
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response, status
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from pymongo import UpdateOne
+from pymongo.read_concern import ReadConcern
+
+from core.db import get_read_collection
+from core.models import CollectionVersion
+from core.settings import settings
+
+
+def product_scope() -> str:
+    return 'Product'
+
+
+def product_comments_scope(product_id: Any) -> str:
+    return f'Comment:product:{product_id}'
+
+
+def replies_scope(parent_id: Any) -> str:
+    return f'Comment:parent:{parent_id}'
+
+
+def comment_scopes(comment: Any) -> list[str]:
+    """ The listings a comment appears in: its product's comments and, for replies, its parent's replies. """
+    if isinstance(comment, dict):
+        product_id, parent_id = comment.get('product_id'), comment.get('parent_id')
+    else:
+        product_id, parent_id = comment.product_id, comment.parent_id
+
+    scopes = [product_comments_scope(product_id)]
+    if parent_id is not None:
+        scopes.append(replies_scope(parent_id))
+
+    return scopes
+
+
+async def bump(*scopes: str):
+    """ Marks the listings in `scopes` as changed, so the ETags handed out for them stop matching. """
+    if not scopes:
+        return
+
+    await CollectionVersion.get_motor_collection().bulk_write(
+        [UpdateOne({'scope': scope}, {'$inc': {'version': 1}}, upsert=True) for scope in set(scopes)],
+        ordered=False,
+    )
+
+
+async def conditional_response(
+    request: Request,
+    response: Response,
+    scope: str,
+    session: AsyncIOMotorClientSession | None,
+) -> Response | None:
+    """ Answers with `304 Not Modified` when the client's copy of the listing is still current.
+
+        The ETag only depends on the scope's change counter and the request URL, so it is computed
+        without loading or serializing any of the listed documents.  Returns `None` when the full
+        response has to be sent; its ETag and Cache-Control headers are then already set.
+
+        The counter is read like the listing, on the read client, and the listing must then be read
+        in the same causally consistent `session` so it is at least as recent as the counter.  A
+        lagging secondary would otherwise serve a stale listing under the current ETag.
+    """
+    version = await get_read_collection(CollectionVersion, ReadConcern('local')).find_one(
+        {'scope': scope},
+        {'version': 1},
+        session=session,
+    )
+    version = (version['_id'], version['version']) if version else (None, 0)
+
+    query = sorted(request.query_params.multi_items())
+    etag = '"' + hashlib.sha1(f'{scope}:{version}:{request.url.path}:{query}'.encode()).hexdigest() + '"'
+    headers = {
+        'ETag': etag,
+        'Cache-Control': settings.HTTP_CACHE_CONTROL,
+    }
+
+    if_none_match = request.headers.get('if-none-match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,37 @@
+from typing import Annotated, Callable
+
+from fastapi import (
+    HTTPException,
+    Query,
+    status,
+)
+
+
+def sparse_fields(allowed: dict[str, int]) -> Callable[..., dict[str, int] | None]:
+    """ Builds a dependency which turns the `fields` query parameter into a MongoDB projection.
+
+        `fields` is a comma-separated list of the response fields to return, checked against
+        `allowed`; `_id` is always returned.  The dependency returns `None` when the parameter is
+        not given, in which case endpoints return whole documents.
+    """
+
+    def dependency(
+        fields: Annotated[
+            str | None,
+            Query(description=f'Comma-separated subset of: {", ".join(allowed)}.'),
+        ] = None,
+    ) -> dict[str, int] | None:
+        if fields is None:
+            return None
+
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+
+        if unknown := [name for name in names if name not in allowed]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Unknown field(s): {", ".join(unknown)}.',
+            )
+
+        return {'_id': 1, **{name: 1 for name in names}}
+
+    return dependency
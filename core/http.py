@@ -0,0 +1,47 @@
+from importlib.util import find_spec
+
+import httpx
+
+from core.settings import settings
+
+_client: httpx.AsyncClient | None = None
+
+
+def start_http_client():
+    """ Creates the HTTP client shared by every outbound call, with pooled keep-alive connections.
+
+        HTTP/2 is only negotiated when the `h2` package is installed.  Retries only cover failures
+        to connect, so a request which reached the server is never sent twice.
+    """
+    global _client
+
+    if _client is None:
+        _client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                http2=settings.HTTP_CLIENT_HTTP2 and find_spec('h2') is not None,
+                retries=settings.HTTP_CLIENT_RETRIES,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_CLIENT_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            ),
+            timeout=httpx.Timeout(
+                settings.HTTP_CLIENT_READ_TIMEOUT_SECONDS,
+                connect=settings.HTTP_CLIENT_CONNECT_TIMEOUT_SECONDS,
+            ),
+        )
+
+
+async def close_http_client():
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError('The HTTP client has not been started.')
+
+    return _client
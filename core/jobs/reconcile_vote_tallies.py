@@ -0,0 +1,101 @@
+""" Recomputes every comment's vote tallies from `CommentVote` and fixes any that drifted.
+
+    Run with `python -m core.jobs.reconcile_vote_tallies`.
+"""
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+from core.constants import CommentAction
+from core.db import close_db, init_db
+from core.models import Comment, CommentVote
+from core.ranking import ranking_stages
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _count(action: CommentAction) -> dict:
+    return {'$sum': {'$cond': [{'$eq': ['$action', action.value]}, 1, 0]}}
+
+
+async def reconcile_vote_tallies(batch_size: int = BATCH_SIZE) -> int:
+    """ Returns the number of comments whose tallies were corrected.
+
+        Comments voted on while the job runs are skipped; the next run picks them up if they still drifted.
+    """
+    drifted = Comment.get_motor_collection().aggregate(
+        [
+            {
+                '$lookup': {
+                    'from': CommentVote.get_collection_name(),
+                    'localField': '_id',
+                    'foreignField': 'comment_id',
+                    'pipeline': [
+                        {
+                            '$group': {
+                                '_id': None,
+                                'upvotes': _count(CommentAction.UPVOTE),
+                                'downvotes': _count(CommentAction.DOWNVOTE),
+                            }
+                        }
+                    ],
+                    'as': 'tally',
+                }
+            },
+            {'$set': {'tally': {'$ifNull': [{'$first': '$tally'}, {'upvotes': 0, 'downvotes': 0}]}}},
+            {
+                '$match': {
+                    '$expr': {
+                        '$or': [
+                            {'$ne': ['$upvotes', '$tally.upvotes']},
+                            {'$ne': ['$downvotes', '$tally.downvotes']},
+                            {'$ne': ['$score', {'$subtract': ['$tally.upvotes', '$tally.downvotes']}]},
+                        ]
+                    }
+                }
+            },
+            {'$project': {'tally': 1, 'upvotes': 1, 'downvotes': 1}},
+        ]
+    )
+
+    corrected = 0
+    batch = []
+    async for comment in drifted:
+        upvotes, downvotes = comment['tally']['upvotes'], comment['tally']['downvotes']
+        batch.append(
+            UpdateOne(
+                # Only if the tallies are still the ones compared, so votes applied since are not overwritten.
+                {'_id': comment['_id'], 'upvotes': comment.get('upvotes'), 'downvotes': comment.get('downvotes')},
+                [
+                    {'$set': {'upvotes': upvotes, 'downvotes': downvotes, 'score': upvotes - downvotes}},
+                    *ranking_stages(),
+                ],
+            )
+        )
+
+        if len(batch) >= batch_size:
+            corrected += (await Comment.get_motor_collection().bulk_write(batch, ordered=False)).modified_count
+            batch = []
+
+    if batch:
+        corrected += (await Comment.get_motor_collection().bulk_write(batch, ordered=False)).modified_count
+
+    return corrected
+
+
+async def main():
+    await init_db()
+
+    try:
+        logger.info(f'Corrected the vote tallies of {await reconcile_vote_tallies()} comments.')
+
+    finally:
+        close_db()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+""" Recomputes the time-decayed `hot_score` of recent comments.
+
+    Comments older than `HOT_SCORE_WINDOW_DAYS` are left with their last score, which has decayed
+    to a negligible value by then.  Run it on a schedule with `python -m core.jobs.refresh_hot_scores`,
+    or set `HOT_SCORE_REFRESH_INTERVAL_SECONDS` on one API worker to have it refresh them itself.
+"""
+import asyncio
+import logging
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
+from bson import ObjectId
+
+from core.db import close_db, init_db
+from core.etag import bump, comment_scopes
+from core.models import Comment
+from core.ranking import hot_score_expression
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+async def refresh_hot_scores(batch_size: int = BATCH_SIZE) -> int:
+    """ Returns the number of comments refreshed.
+
+        Comments are walked in `_id` order, whose timestamp stands in for `created_at`, one batch
+        and one `update_many` at a time, so the server computes the scores.  Every batch is scored
+        at the time the refresh started, and the listings of its comments are bumped, as their
+        `hot` order may have changed.
+    """
+    collection = Comment.get_motor_collection()
+    now = datetime.now(tz=timezone.utc)
+    bound = {'$gte': ObjectId.from_datetime(now - timedelta(days=settings.HOT_SCORE_WINDOW_DAYS))}
+    refreshed = 0
+
+    while comments := await collection.find(
+        {'_id': bound},
+        {'_id': 1, 'product_id': 1, 'parent_id': 1},
+        sort=[('_id', 1)],
+        limit=batch_size,
+    ).to_list(None):
+        ids = [comment['_id'] for comment in comments]
+        await collection.update_many({'_id': {'$in': ids}}, [{'$set': {'hot_score': hot_score_expression(now)}}])
+        await bump(*[scope for comment in comments for scope in comment_scopes(comment)])
+        refreshed += len(ids)
+        bound = {'$gt': ids[-1]}
+
+    return refreshed
+
+
+class HotScoreRefresher:
+
+    def __init__(self, interval: float | None):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self.interval and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+
+            try:
+                await refresh_hot_scores()
+
+            except Exception:
+                logger.exception('Could not refresh the hot scores.')
+
+
+hot_score_refresher = HotScoreRefresher(interval=settings.HOT_SCORE_REFRESH_INTERVAL_SECONDS)
+
+
+async def main():
+    await init_db()
+
+    try:
+        logger.info(f'Refreshed the hot scores of {await refresh_hot_scores()} comments.')
+
+    finally:
+        close_db()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
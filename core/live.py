@@ -0,0 +1,211 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+)
+
+import orjson
+from bson import ObjectId
+
+from core import metrics
+from core.settings import settings
+
+HEARTBEAT = b': heartbeat\n\n'
+RESET = b'event: reset\ndata: {}\n\n'
+
+# Put on a subscriber's queue to end its stream; the client reconnects and resumes from its last event.
+_DROPPED = object()
+
+
+@dataclass(frozen=True)
+class LiveEvent:
+    id: str
+    type: str
+    data: dict[str, Any]
+
+    def encode(self) -> bytes:
+        """ Formats the event as a Server-Sent Events frame. """
+        data = orjson.dumps(self.data, default=str)
+        return b'id: %s\nevent: %s\ndata: %s\n\n' % (self.id.encode(), self.type.encode(), data)
+
+
+class Backplane(ABC):
+    """ Carries published events to the hub of every worker with listeners on the channel. """
+
+    @abstractmethod
+    async def publish(self, channel: str, event: LiveEvent):
+        ...
+
+    @abstractmethod
+    async def subscribe(self, channel: str, deliver: Callable[[LiveEvent], None]):
+        ...
+
+    @abstractmethod
+    async def unsubscribe(self, channel: str):
+        ...
+
+
+class LocalBackplane(Backplane):
+    """ Delivers events within this process only, so listeners only see writes made by their own worker. """
+
+    def __init__(self):
+        self._channels: dict[str, Callable[[LiveEvent], None]] = {}
+
+    async def publish(self, channel: str, event: LiveEvent):
+        if (deliver := self._channels.get(channel)) is not None:
+            deliver(event)
+
+    async def subscribe(self, channel: str, deliver: Callable[[LiveEvent], None]):
+        self._channels[channel] = deliver
+
+    async def unsubscribe(self, channel: str):
+        self._channels.pop(channel, None)
+
+
+@dataclass(eq=False)
+class Subscription:
+    channel: str
+    queue: asyncio.Queue
+
+
+@dataclass(eq=False)
+class Channel:
+    replay: deque[tuple[str, bytes]]
+    subscribers: set[Subscription] = field(default_factory=set)
+    linger: asyncio.TimerHandle | None = None
+
+
+class LiveHub:
+    """ Fans the events of each product out to the clients listening to it.
+
+        A product's channel is subscribed to on the backplane once, when its first listener
+        arrives, and kept for `linger` seconds after its last one leaves so that reconnecting
+        clients can resume.  Each event is encoded once and put on every listener's queue; a
+        listener whose queue is full is dropped rather than slowing the others down.  The last
+        `replay_size` events are kept to resume clients from their `Last-Event-ID`.
+
+        Heartbeats come from a single task which tops up idle queues every `heartbeat` seconds, so
+        an idle listener costs no timer of its own.
+    """
+
+    def __init__(self, backplane: Backplane, queue_size: int, replay_size: int, heartbeat: float, linger: float):
+        self.backplane = backplane
+        self.queue_size = queue_size
+        self.replay_size = replay_size
+        self.heartbeat = heartbeat
+        self.linger = linger
+
+        self._channels: dict[str, Channel] = {}
+        self._heartbeats: asyncio.Task | None = None
+
+    async def publish(self, product_id: Any, type: str, data: dict[str, Any]):
+        await self.backplane.publish(str(product_id), LiveEvent(id=str(ObjectId()), type=type, data=data))
+
+    def _deliver(self, name: str, event: LiveEvent):
+        if (channel := self._channels.get(name)) is None:
+            return
+
+        frame = event.encode()
+        channel.replay.append((event.id, frame))
+
+        for subscription in list(channel.subscribers):
+            try:
+                subscription.queue.put_nowait(frame)
+
+            except asyncio.QueueFull:
+                self._drop(subscription)
+
+    def _drop(self, subscription: Subscription):
+        metrics.LIVE_DROPPED.inc()
+        self._remove(subscription)
+
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+
+        subscription.queue.put_nowait(_DROPPED)
+
+    async def subscribe(self, product_id: Any, last_event_id: str | None = None) -> Subscription:
+        name = str(product_id)
+
+        if (channel := self._channels.get(name)) is None:
+            channel = self._channels[name] = Channel(replay=deque(maxlen=self.replay_size))
+            await self.backplane.subscribe(name, lambda event: self._deliver(name, event))
+
+        if channel.linger is not None:
+            channel.linger.cancel()
+            channel.linger = None
+
+        subscription = Subscription(channel=name, queue=asyncio.Queue(self.queue_size))
+        channel.subscribers.add(subscription)
+        metrics.LIVE_SUBSCRIBERS.inc()
+
+        if self._heartbeats is None or self._heartbeats.done():
+            self._heartbeats = asyncio.create_task(self._send_heartbeats())
+
+        if last_event_id is not None:
+            ids = [id for id, _ in channel.replay]
+
+            # Events older than the replay buffer, or sent before this worker had the channel, are
+            # lost; the client is told to reload instead.
+            if last_event_id in ids and len(ids) - ids.index(last_event_id) <= self.queue_size:
+                for _, frame in list(channel.replay)[ids.index(last_event_id) + 1:]:
+                    subscription.queue.put_nowait(frame)
+            else:
+                subscription.queue.put_nowait(RESET)
+
+        return subscription
+
+    def _remove(self, subscription: Subscription):
+        if (channel := self._channels.get(subscription.channel)) is None:
+            return
+
+        if subscription not in channel.subscribers:
+            return
+
+        channel.subscribers.discard(subscription)
+        metrics.LIVE_SUBSCRIBERS.dec()
+
+        if not channel.subscribers:
+            channel.linger = asyncio.get_running_loop().call_later(
+                self.linger, lambda: asyncio.ensure_future(self._close(subscription.channel))
+            )
+
+    async def _close(self, name: str):
+        channel = self._channels.get(name)
+
+        if channel is not None and not channel.subscribers:
+            del self._channels[name]
+            await self.backplane.unsubscribe(name)
+
+    async def _send_heartbeats(self):
+        while self._channels:
+            await asyncio.sleep(self.heartbeat)
+
+            for channel in list(self._channels.values()):
+                for subscription in channel.subscribers:
+                    if subscription.queue.empty():
+                        subscription.queue.put_nowait(HEARTBEAT)
+
+    async def stream(self, product_id: Any, last_event_id: str | None = None) -> AsyncIterator[bytes]:
+        """ Yields the product's events as Server-Sent Events frames, with a comment line as heartbeat. """
+        subscription = await self.subscribe(product_id, last_event_id)
+
+        try:
+            while (frame := await subscription.queue.get()) is not _DROPPED:
+                yield frame
+
+        finally:
+            self._remove(subscription)
+
+
+live_hub = LiveHub(
+    LocalBackplane(),
+    queue_size=settings.LIVE_QUEUE_SIZE,
+    replay_size=settings.LIVE_REPLAY_SIZE,
+    heartbeat=settings.LIVE_HEARTBEAT_SECONDS,
+    linger=settings.LIVE_CHANNEL_LINGER_SECONDS,
+)
@@ -0,0 +1,89 @@
+import asyncio
+from typing import (
+    Awaitable,
+    Callable,
+    Generic,
+    Hashable,
+    Iterable,
+    TypeVar,
+)
+
+from beanie.odm.fields import PydanticObjectId
+from pymongo.read_concern import ReadConcern
+
+from core import metrics
+from core.db import read_many
+from core.models import PublicUser, UserInDB
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class BatchLoader(Generic[K, V]):
+    """ Coalesces the lookups made during one event loop iteration into a single batch.
+
+        Every `load` issued before the loop gets back to its scheduled callbacks, from any request,
+        lands in the same call to `load_batch` with duplicate keys removed.  Each caller then gets
+        its own result back, or `None` for a key the batch did not return.
+    """
+
+    def __init__(self, name: str, load_batch: Callable[[list[K]], Awaitable[dict[K, V]]]):
+        self.name = name
+        self.load_batch = load_batch
+
+        self._pending: dict[K, list[asyncio.Future]] = {}
+
+    async def load(self, key: K) -> V | None:
+        return await self._enqueue(key)
+
+    async def load_many(self, keys: Iterable[K]) -> list[V | None]:
+        # The keys are queued right away rather than from tasks of their own, which would only start
+        # on the next loop iteration and miss the batch of the loads made alongside this one.
+        return await asyncio.gather(*[self._enqueue(key) for key in keys])
+
+    def _enqueue(self, key: K) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+
+        self._pending.setdefault(key, []).append(future)
+
+        return future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending: dict[K, list[asyncio.Future]]):
+        metrics.LOADER_BATCH_SIZE.labels(self.name).observe(len(pending))
+
+        try:
+            results = await self.load_batch(list(pending))
+
+        except Exception as exc:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+
+        for key, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+async def load_public_users(ids: list[PydanticObjectId]) -> dict[PydanticObjectId, PublicUser]:
+    users = await read_many(
+        UserInDB,
+        {'_id': {'$in': ids}},
+        projection_model=PublicUser,
+        read_concern=ReadConcern('local'),
+    )
+
+    return {user.id: user for user in users}
+
+
+user_loader: BatchLoader[PydanticObjectId, PublicUser] = BatchLoader('user', load_public_users)
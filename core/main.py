@@ -1,30 +1,54 @@
 from contextlib import asynccontextmanager
 
-from beanie import init_beanie
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
-from motor.motor_asyncio import AsyncIOMotorClient
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from core import (
     PROJECT_VERSION,
+    metrics,
     models,
     routers,
 )
+from core.db import close_db, init_db
+from core.http import close_http_client, start_http_client
+from core.jobs.refresh_hot_scores import hot_score_refresher
+from core.metrics import MetricsMiddleware
+from core.ratelimit import RateLimitMiddleware
+from core.routers.auth.passwords import password_hasher
+from core.routers.auth.registered_emails import registered_emails
+from core.routers.auth.revocation import revocation_list
 from core.settings import settings
+from core.votes import vote_buffer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    client = AsyncIOMotorClient(settings.MONGODB_READ_URL)
-    await init_beanie(
-        database=client[settings.MONGODB_DATABASE],
-        document_models=[models.UserInDB, models.Account, models.Comment, models.CommentVote, models.Product],
-    )
+    await init_db()
+    start_http_client()
+    await revocation_list.start()
+
+    if settings.EMAIL_FILTER_ENABLED:
+        await registered_emails.start()
+
+    if settings.VOTE_BUFFER_ENABLED:
+        vote_buffer.start()
+
+    hot_score_refresher.start()
 
     yield
 
+    await hot_score_refresher.close()
+
+    await revocation_list.close()
+    await registered_emails.close()
+    await vote_buffer.close()
+    password_hasher.shutdown()
+    await close_http_client()
+    close_db()
+
 
 templates = Jinja2Templates(directory='core/templates')
 
@@ -36,6 +60,10 @@ app = FastAPI(
     redoc_url='/redoc/',
 )
 
+# Added first so it runs inside CORS, which then also decorates the 429 responses.
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CSRF_ALLOWED_ORIGINS,
@@ -43,6 +71,7 @@ app.add_middleware(
     allow_methods=['*'],
     allow_headers=['*'],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get('/docs/', include_in_schema=False, response_class=HTMLResponse)
@@ -54,15 +83,31 @@ async def get_docs_ui(request: Request):
     )
 
 
+@app.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.get('/auth/exists/')
 async def check_email_exists(email: str) -> dict:
-    user = await models.UserInDB.find_one(models.UserInDB.email == email)
+    if not registered_emails.might_exist(email):
+        metrics.EMAIL_FILTER_LOOKUPS.labels('absent').inc()
+        return {'exists': False, 'is_local': False}
+
+    # Covered by the (email, password) index, so neither the document nor the hash is read.
+    user = await models.UserInDB.get_motor_collection().find_one(
+        {'email': email},
+        {'_id': 0, 'is_local': {'$gt': ['$password', '']}},
+        hint=models.EMAIL_PASSWORD_INDEX,
+    )
     exists = user is not None
-    is_local = bool(user.password) if exists else False
+
+    if settings.EMAIL_FILTER_ENABLED:
+        metrics.EMAIL_FILTER_LOOKUPS.labels('present' if exists else 'false_positive').inc()
 
     return {
         'exists': exists,
-        'is_local': is_local,
+        'is_local': bool(user['is_local']) if exists else False,
     }
 
 
@@ -71,6 +116,8 @@ app.include_router(routers.comment_router, prefix='/comment')
 app.include_router(routers.replies_router, prefix='/replies')
 app.include_router(routers.comment_vote_router, prefix='/comment-vote')
 app.include_router(routers.product_router, prefix='/product')
+app.include_router(routers.export_router, prefix='/export')
+app.include_router(routers.import_router, prefix='/import')
 app.include_router(routers.base_auth_router, prefix='/auth')
 app.include_router(routers.local_auth_router, prefix='/auth/local')
 app.include_router(routers.google_auth_router, prefix='/auth/google')
@@ -0,0 +1,186 @@
+import logging
+import time
+from contextvars import ContextVar
+
+import bson
+from prometheus_client import (
+    Counter,
+    Gauge,
+    Histogram,
+)
+from pymongo import monitoring
+
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# The ASGI scope of the request being handled.  Motor runs commands on its executor with a copy of
+# the caller's context, so command events can be attributed to the route which issued them.
+current_scope: ContextVar[dict | None] = ContextVar('current_scope', default=None)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_seconds',
+    'Time spent handling a request.',
+    ['route', 'method', 'status'],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled.')
+
+MONGODB_COMMANDS = Counter('mongodb_commands', 'MongoDB commands sent.', ['route', 'command'])
+MONGODB_COMMAND_FAILURES = Counter('mongodb_command_failures', 'MongoDB commands which failed.', ['route', 'command'])
+MONGODB_COMMAND_SECONDS = Histogram(
+    'mongodb_command_seconds',
+    'Time spent on a MongoDB command.',
+    ['route', 'command'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+MONGODB_DOCUMENTS_RETURNED = Counter('mongodb_documents_returned', 'Documents returned by MongoDB.', ['route'])
+MONGODB_REPLY_BYTES = Counter('mongodb_reply_bytes', 'Size of the MongoDB replies.', ['route'])
+
+CACHE_HITS = Counter('cache_hits', 'Document cache hits.', ['model'])
+CACHE_MISSES = Counter('cache_misses', 'Document cache misses.', ['model'])
+CACHE_EVICTIONS = Counter('cache_evictions', 'Documents evicted from the in-process cache to make room.')
+
+LOADER_BATCH_SIZE = Histogram(
+    'loader_batch_size',
+    'Distinct keys fetched per batch loader query.',
+    ['loader'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+
+VOTE_BUFFER_PENDING = Gauge('vote_buffer_pending', 'Votes waiting in the ingestion buffer.')
+VOTE_BUFFER_FLUSH_SIZE = Histogram(
+    'vote_buffer_flush_size',
+    'Votes written per buffer flush.',
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+VOTE_BUFFER_FLUSH_SECONDS = Histogram('vote_buffer_flush_seconds', 'Time spent writing one buffer flush.')
+VOTE_BUFFER_FLUSH_FAILURES = Counter('vote_buffer_flush_failures', 'Buffer flushes which raised an error.')
+VOTE_BUFFER_REJECTED = Counter('vote_buffer_rejected', 'Votes rejected because the buffer stayed full.')
+
+EMAIL_FILTER_LOOKUPS = Counter(
+    'email_filter_lookups',
+    'Email existence checks, by whether the Bloom filter answered or the database had to.',
+    ['result'],
+)
+EMAIL_FILTER_ERROR_RATE = Gauge('email_filter_error_rate', 'Estimated false-positive rate of the email Bloom filter.')
+EMAIL_FILTER_REBUILD_SECONDS = Histogram(
+    'email_filter_rebuild_seconds',
+    'Time spent building the email Bloom filter.',
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
+)
+
+RATE_LIMITED = Counter('rate_limited', 'Requests rejected by admission control.', ['route', 'reason'])
+
+LIVE_SUBSCRIBERS = Gauge('live_subscribers', 'Clients listening to a live product feed.')
+LIVE_DROPPED = Counter('live_dropped', 'Live feed clients dropped for falling behind.')
+
+
+def route_name(scope: dict | None) -> str:
+    """ The path template of the matched route, so label values stay bounded. """
+    if scope is None:
+        return 'background'
+
+    route = scope.get('route')
+    return getattr(route, 'path', 'unmatched')
+
+
+def query_shape(value):
+    """ Replaces every value in a filter or pipeline with `?`, keeping only its structure. """
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        # Lists of clauses keep their structure, lists of values (e.g. for `$in`) collapse into one.
+        if value and all(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+
+        return ['?']
+
+    return '?'
+
+
+def _documents_returned(reply: dict) -> int:
+    if (cursor := reply.get('cursor')) is not None:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', ())))
+
+    if 'value' in reply:
+        return int(reply['value'] is not None)
+
+    return 0
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """ Records every MongoDB command against the route which sent it and logs the slow ones. """
+
+    def __init__(self):
+        self._shapes = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        self._shapes[event.request_id] = {
+            key: command[key] for key in ('filter', 'sort', 'pipeline', 'updates', 'deletes') if key in command
+        }
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        route = self._record(event)
+        reply = event.reply
+
+        MONGODB_DOCUMENTS_RETURNED.labels(route).inc(_documents_returned(reply))
+        if settings.MONGODB_METRICS_REPLY_BYTES:
+            MONGODB_REPLY_BYTES.labels(route).inc(len(bson.encode(reply)))
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        MONGODB_COMMAND_FAILURES.labels(self._record(event), event.command_name).inc()
+
+    def _record(self, event) -> str:
+        route = route_name(current_scope.get())
+        shape = self._shapes.pop(event.request_id, None)
+        seconds = event.duration_micros / 1_000_000
+
+        MONGODB_COMMANDS.labels(route, event.command_name).inc()
+        MONGODB_COMMAND_SECONDS.labels(route, event.command_name).observe(seconds)
+
+        if seconds * 1000 >= settings.MONGODB_SLOW_COMMAND_MS:
+            logger.warning(
+                f'Slow MongoDB command on {route}: {event.command_name} took {seconds * 1000:.1f}ms.  '
+                f'Shape: {query_shape(shape)}'
+            )
+
+        return route
+
+
+mongo_command_listener = MongoCommandListener()
+
+
+class MetricsMiddleware:
+    """ Times every request and makes its scope available to the MongoDB command listener. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        token = current_scope.set(scope)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            HTTP_REQUEST_SECONDS.labels(route_name(scope), scope['method'], status_code).observe(
+                time.perf_counter() - started
+            )
+            current_scope.reset(token)
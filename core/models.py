@@ -13,6 +13,10 @@ from pydantic import BaseModel, Field
 from pymongo import IndexModel
 
 from core.constants import CommentAction, Provider
+from core.pagination import Page
+
+# Covers lookups which only need a user's email and whether they have a password.
+EMAIL_PASSWORD_INDEX = 'email__password'
 
 
 class User(BaseModel):
@@ -33,10 +37,16 @@ class User(BaseModel):
             family_name=user.family_name,
             email=user.email,
             email_verified=user.email_verified,
-            image=user.email
+            image=user.image
         )
 
 
+USER_FIELDS = {
+    field: 1
+    for field in ('_id', 'username', 'given_name', 'family_name', 'email', 'email_verified', 'image')
+}
+
+
 class PublicUser(BaseModel):
     id: PydanticObjectId = Field(alias='_id')
     username: str
@@ -44,7 +54,7 @@ class PublicUser(BaseModel):
 
     @classmethod
     def from_db(cls, user: UserInDB):
-        return cls(_id=user.id, username=user.username, image=user.email)
+        return cls(_id=user.id, username=user.username, image=user.image)
 
 
 class UserInDB(Document):
@@ -59,6 +69,12 @@ class UserInDB(Document):
 
     class Settings:
         name = 'User'
+        indexes = [
+            IndexModel(
+                [('email', pymongo.ASCENDING), ('password', pymongo.ASCENDING)],
+                name=EMAIL_PASSWORD_INDEX,
+            )
+        ]
 
 
 class Account(Document):
@@ -87,6 +103,23 @@ class CommentVote(Document):
     comment_id: PydanticObjectId
     user_id: PydanticObjectId
 
+    class Settings:
+        name = 'CommentVote'
+        indexes = [
+            IndexModel(
+                [('comment_id', pymongo.ASCENDING), ('user_id', pymongo.ASCENDING)],
+                name='comment_id__user_id__unique_together',
+                unique=True,
+            )
+        ]
+
+
+class CommentCreate(BaseModel):
+    """ What a client sends to post a comment or a reply; tallies, rankings and replies are the server's. """
+    message: str
+    user_id: PydanticObjectId
+    product_id: PydanticObjectId
+
 
 class Comment(Document):
     message: str
@@ -95,14 +128,100 @@ class Comment(Document):
     created_at: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
     updated_at: datetime | None = None
     is_reply: bool = False
-    replies: list[PydanticObjectId] = []
+    parent_id: PydanticObjectId | None = None
+    reply_count: int = 0
+    upvotes: int = 0
+    downvotes: int = 0
+    score: int = 0
+    top_score: float = 0.0
+    hot_score: float = 0.0
 
     class Settings:
         name = 'Comment'
+        indexes = [
+            IndexModel(
+                [
+                    ('product_id', pymongo.ASCENDING),
+                    ('is_reply', pymongo.ASCENDING),
+                    ('created_at', pymongo.DESCENDING),
+                    ('_id', pymongo.DESCENDING),
+                ],
+                name='product_id__is_reply__created_at__id',
+            ),
+            IndexModel(
+                [
+                    ('product_id', pymongo.ASCENDING),
+                    ('is_reply', pymongo.ASCENDING),
+                    ('updated_at', pymongo.DESCENDING),
+                    ('_id', pymongo.DESCENDING),
+                ],
+                name='product_id__is_reply__updated_at__id',
+            ),
+            IndexModel(
+                [
+                    ('product_id', pymongo.ASCENDING),
+                    ('is_reply', pymongo.ASCENDING),
+                    ('top_score', pymongo.DESCENDING),
+                    ('_id', pymongo.DESCENDING),
+                ],
+                name='product_id__is_reply__top_score__id',
+            ),
+            IndexModel(
+                [
+                    ('product_id', pymongo.ASCENDING),
+                    ('is_reply', pymongo.ASCENDING),
+                    ('hot_score', pymongo.DESCENDING),
+                    ('_id', pymongo.DESCENDING),
+                ],
+                name='product_id__is_reply__hot_score__id',
+            ),
+            IndexModel(
+                [('parent_id', pymongo.ASCENDING), ('created_at', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+                name='parent_id__created_at__id',
+            ),
+            IndexModel(
+                [('parent_id', pymongo.ASCENDING), ('updated_at', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+                name='parent_id__updated_at__id',
+            ),
+            IndexModel(
+                [('parent_id', pymongo.ASCENDING), ('top_score', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+                name='parent_id__top_score__id',
+            ),
+            IndexModel(
+                [('parent_id', pymongo.ASCENDING), ('hot_score', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+                name='parent_id__hot_score__id',
+            ),
+            # Text searches must match one product, which keeps them to that product's part of the index.
+            IndexModel(
+                [('product_id', pymongo.ASCENDING), ('message', pymongo.TEXT)],
+                name='product_id__message_text',
+            ),
+        ]
+
+
+COMMENT_FIELDS = {
+    field: 1
+    for field in (
+        '_id',
+        'message',
+        'user_id',
+        'product_id',
+        'created_at',
+        'updated_at',
+        'is_reply',
+        'parent_id',
+        'reply_count',
+        'upvotes',
+        'downvotes',
+        'score',
+        'top_score',
+        'hot_score',
+    )
+}
 
 
 class Product(Document):
-    external_id: str
+    external_id: Indexed(str, unique=True)
     affiliate_links: list[str]
     comments: list[BackLink['Comment']] = Field(list(), original_field='product')
 
@@ -110,6 +229,84 @@ class Product(Document):
         name = 'Product'
 
 
+PRODUCT_FIELDS = {'_id': 1, 'external_id': 1, 'affiliate_links': 1}
+
+
+class ThreadComment(BaseModel):
+    id: PydanticObjectId = Field(alias='_id')
+    message: str
+    user_id: PydanticObjectId
+    product_id: PydanticObjectId
+    parent_id: PydanticObjectId | None = None
+    created_at: datetime
+    updated_at: datetime | None = None
+    reply_count: int = 0
+    upvotes: int = 0
+    downvotes: int = 0
+    score: int = 0
+    children: list[ThreadComment] = []
+
+
+class Thread(Page[ThreadComment]):
+    # Set when the node cap cut off part of the requested depth.
+    truncated: bool = False
+
+
+class ProductPageComment(BaseModel):
+    id: PydanticObjectId = Field(alias='_id')
+    message: str
+    user_id: PydanticObjectId
+    created_at: datetime
+    updated_at: datetime | None = None
+    reply_count: int = 0
+    upvotes: int = 0
+    downvotes: int = 0
+    score: int = 0
+    author: PublicUser | None = None
+
+
+class CommentSearchResult(BaseModel):
+    id: PydanticObjectId = Field(alias='_id')
+    message: str
+    user_id: PydanticObjectId
+    product_id: PydanticObjectId
+    created_at: datetime
+    updated_at: datetime | None = None
+    is_reply: bool = False
+    parent_id: PydanticObjectId | None = None
+    reply_count: int = 0
+    upvotes: int = 0
+    downvotes: int = 0
+    score: int = 0
+    text_score: float
+
+
+class ProductPage(BaseModel):
+    product: Product
+    comments: Page[ProductPageComment]
+
+
+class CollectionVersion(Document):
+    """ A change counter for a set of documents, bumped on every write to them and used to build ETags. """
+    scope: Indexed(str, unique=True)
+    version: int = 0
+
+    class Settings:
+        name = 'collection_versions'
+
+
+class RevokedToken(Document):
+    """ Revokes a single token by `jti`, or every token of a user issued before `issued_before`. """
+    jti: str | None = None
+    user_id: PydanticObjectId | None = None
+    issued_before: datetime | None = None
+    expires_at: datetime
+
+    class Settings:
+        name = 'revoked_tokens'
+        indexes = [IndexModel([('expires_at', pymongo.ASCENDING)], name='expires_at__ttl', expireAfterSeconds=0)]
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,92 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from typing import (
+    Any,
+    Generic,
+    Sequence,
+    TypeVar,
+)
+
+import pymongo
+from bson import ObjectId, json_util
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+T = TypeVar('T')
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(value: Any, id: ObjectId) -> str:
+    """ Encodes the sort key of the last item of a page into an opaque cursor. """
+    return urlsafe_b64encode(json_util.dumps([value, id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[Any, ObjectId]:
+    try:
+        value, id = json_util.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(id, ObjectId):
+            raise ValueError
+
+    except (BinasciiError, UnicodeDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor.') from None
+
+    return value, id
+
+
+def keyset_sort(order_by: str) -> list[tuple[str, int]]:
+    """ Builds the sort for `order_by`, with `_id` as the tie-breaker in the same direction. """
+    field = order_by.lstrip('-')
+    direction = pymongo.DESCENDING if order_by.startswith('-') else pymongo.ASCENDING
+
+    if field == '_id':
+        return [('_id', direction)]
+
+    return [(field, direction), ('_id', direction)]
+
+
+def keyset_filter(order_by: str, cursor: str) -> dict:
+    """ Builds the filter which selects the items sorted after the given cursor.
+
+        Missing or null values sort before every other value in MongoDB, so they come last
+        in a descending scan and first in an ascending one.
+    """
+    field = order_by.lstrip('-')
+    value, id = decode_cursor(cursor)
+
+    if field == '_id':
+        return {'_id': {'$lt' if order_by.startswith('-') else '$gt': id}}
+
+    if order_by.startswith('-'):
+        if value is None:
+            return {field: None, '_id': {'$lt': id}}
+
+        return {'$or': [{field: {'$lt': value}}, {field: value, '_id': {'$lt': id}}, {field: None}]}
+
+    if value is None:
+        return {'$or': [{field: None, '_id': {'$gt': id}}, {field: {'$ne': None}}]}
+
+    return {'$or': [{field: {'$gt': value}}, {field: value, '_id': {'$gt': id}}]}
+
+
+def paginate(items: Sequence[Any], limit: int, order_by: str) -> Page:
+    """ Builds a page from a query which fetched `limit + 1` items.
+
+        The extra item only tells whether there is a next page; it is never returned.
+    """
+    if len(items) <= limit:
+        return Page(items=list(items))
+
+    items = list(items[:limit])
+    field = order_by.lstrip('-')
+    last = items[-1]
+
+    if isinstance(last, dict):
+        next_cursor = encode_cursor(last.get(field), last['_id'])
+    else:
+        next_cursor = encode_cursor(last.id if field == '_id' else getattr(last, field), last.id)
+
+    return Page(items=items, next_cursor=next_cursor)
@@ -0,0 +1,90 @@
+""" Ranking scores stored on `Comment` and the MongoDB expressions which compute them.
+
+    Both scores are computed by the server from the document's own fields, so they can be updated
+    in the same pipeline update as the vote tallies they derive from.
+"""
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from core.models import Comment
+from core.settings import settings
+
+# The confidence of the Wilson interval, as a standard normal quantile (95%).
+WILSON_Z = 1.96
+
+# The `order_by` values for the rankings, and the stored field each one sorts by.
+RANKINGS = {
+    'top': '-top_score',
+    'hot': '-hot_score',
+}
+
+
+def resolve_order_by(order_by: str) -> str:
+    return RANKINGS.get(order_by, order_by)
+
+
+def top_score_expression() -> dict:
+    """ The lower bound of the Wilson score interval for the share of upvotes.
+
+        It ranks a comment by how confident we can be that it is liked, so a few votes count for
+        less than many with the same ratio.
+    """
+    z2 = WILSON_Z ** 2
+    n, p = '$$n', '$$p'
+
+    # (p + z²/2n - z·sqrt((p(1 - p) + z²/4n) / n)) / (1 + z²/n)
+    variance = {'$add': [{'$multiply': [p, {'$subtract': [1, p]}]}, {'$divide': [z2 / 4, n]}]}
+    centre = {'$add': [p, {'$divide': [z2 / 2, n]}]}
+    spread = {'$multiply': [WILSON_Z, {'$sqrt': {'$divide': [variance, n]}}]}
+    bound = {'$divide': [{'$subtract': [centre, spread]}, {'$add': [1, {'$divide': [z2, n]}]}]}
+
+    return {
+        '$let': {
+            'vars': {'n': {'$add': ['$upvotes', '$downvotes']}},
+            'in': {
+                '$cond': [
+                    {'$eq': [n, 0]},
+                    0.0,
+                    {'$let': {'vars': {'p': {'$divide': ['$upvotes', n]}}, 'in': bound}},
+                ]
+            },
+        }
+    }
+
+
+def hot_score_expression(now: datetime | None = None) -> dict:
+    """ The vote score divided by the comment's age in hours, plus two, to the power of the gravity.
+
+        The age is taken at `now`, the current time by default, sent as a literal rather than read
+        from `$$NOW` so a refresh can score all of its batches at the same time.  The score decays as
+        time passes, so it has to be recomputed periodically; `core.jobs.refresh_hot_scores` does
+        it for the comments young enough for it to matter.
+    """
+    now = now or datetime.now(tz=timezone.utc)
+    age_hours = {'$divide': [{'$subtract': [{'$literal': now}, '$created_at']}, 3_600_000]}
+
+    return {'$divide': ['$score', {'$pow': [{'$add': [age_hours, 2]}, settings.HOT_SCORE_GRAVITY]}]}
+
+
+def ranking_stages() -> list[dict]:
+    return [{'$set': {'top_score': top_score_expression(), 'hot_score': hot_score_expression()}}]
+
+
+async def store_rankings(comment: Comment):
+    """ Computes the rankings of a newly inserted `comment` in the database and copies them onto it. """
+    scores = await Comment.get_motor_collection().find_one_and_update(
+        {'_id': comment.id},
+        ranking_stages(),
+        projection={'_id': 0, 'top_score': 1, 'hot_score': 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    comment.top_score, comment.hot_score = scores['top_score'], scores['hot_score']
+
+
+def tally_update(delta: dict[str, int]) -> list[dict]:
+    """ A pipeline update applying `delta` to the vote tallies and recomputing the rankings from them. """
+    return [
+        {'$set': {field: {'$add': [{'$ifNull': [f'${field}', 0]}, change]} for field, change in delta.items()}},
+        *ranking_stages(),
+    ]
@@ -0,0 +1,158 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from math import ceil
+from re import Pattern
+
+from fastapi import HTTPException
+from starlette.routing import compile_path
+
+from core import metrics
+from core.routers.auth.utils import decode_access_token
+from core.settings import RateLimit, settings
+
+
+class RateLimitBackend(ABC):
+    """ Stores the token buckets.  A backend on a shared store would apply limits across workers. """
+
+    @abstractmethod
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        """ Takes a token from the bucket of `key`, returning 0 or the seconds until one is available. """
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """ Keeps the buckets of this worker in memory, spread over `shards` LRU-ordered dicts.
+
+        Buckets refill lazily when they are next used, so an idle one costs nothing.  Every
+        `acquire` evicts the least recently used buckets of its shard once they have been idle for
+        `idle_seconds`, by which time they are full again anyway, and always when a shard holds
+        more than `max_keys`; sharding keeps each eviction pass short.
+    """
+
+    def __init__(self, shards: int, max_keys: int, idle_seconds: float):
+        self.idle_seconds = idle_seconds
+        self.max_keys_per_shard = max(1, max_keys // shards)
+
+        self._shards: list[OrderedDict[str, tuple[float, float]]] = [OrderedDict() for _ in range(shards)]
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        now = time.monotonic()
+        shard = self._shards[hash(key) % len(self._shards)]
+
+        tokens, updated_at = shard.pop(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+        if tokens >= 1:
+            shard[key] = (tokens - 1, now)
+            retry_after = 0.0
+        else:
+            shard[key] = (tokens, now)
+            retry_after = (1 - tokens) / limit.rate
+
+        while len(shard) > self.max_keys_per_shard or now - next(iter(shard.values()))[1] > self.idle_seconds:
+            shard.popitem(last=False)
+
+        return retry_after
+
+
+class RateLimitMiddleware:
+    """ Admits requests to the routes in `limits` per client, with a token bucket and a concurrency cap.
+
+        `limits` is keyed by route path, optionally prefixed with the method (`POST /auth/local/login/`).
+        Clients are told apart by the subject of their access token, or by their IP address without
+        a valid one.  Rejected requests get `429 Too Many Requests` with a `Retry-After` header.
+    """
+
+    def __init__(self, app, limits: dict[str, RateLimit] | None = None, backend: RateLimitBackend | None = None):
+        self.app = app
+        self.backend = backend or MemoryRateLimitBackend(
+            shards=settings.RATE_LIMIT_SHARDS,
+            max_keys=settings.RATE_LIMIT_MAX_KEYS,
+            idle_seconds=settings.RATE_LIMIT_IDLE_SECONDS,
+        )
+
+        self._rules: list[tuple[str | None, Pattern, str, RateLimit]] = []
+        for route, limit in (settings.RATE_LIMITS if limits is None else limits).items():
+            method, _, path = route.rpartition(' ')
+            self._rules.append((method.upper() or None, compile_path(path)[0], route, limit))
+
+        self._in_flight: dict[str, int] = {}
+        # Decoding a JWT costs far more than the rest of the check, so recent tokens are remembered.
+        self._subjects: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def _match(self, scope) -> tuple[str, RateLimit] | None:
+        for method, pattern, route, limit in self._rules:
+            if (method is None or method == scope['method']) and pattern.match(scope['path']):
+                return route, limit
+
+        return None
+
+    def _subject(self, token: str) -> str | None:
+        if (cached := self._subjects.get(token)) is not None and cached[1] > time.time():
+            self._subjects.move_to_end(token)
+            return cached[0]
+
+        try:
+            payload = decode_access_token(token)
+
+        except HTTPException:
+            return None
+
+        self._subjects[token] = (payload['sub'], payload.get('exp', 0))
+        if len(self._subjects) > settings.RATE_LIMIT_MAX_KEYS:
+            self._subjects.popitem(last=False)
+
+        return payload['sub']
+
+    def _client(self, scope) -> str:
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                scheme, _, token = value.decode('latin-1').partition(' ')
+                if scheme.lower() == 'bearer' and token and (subject := self._subject(token)) is not None:
+                    return f'user:{subject}'
+
+                break
+
+        return f'ip:{scope["client"][0] if scope.get("client") else "unknown"}'
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or (match := self._match(scope)) is None:
+            return await self.app(scope, receive, send)
+
+        route, limit = match
+        key = f'{route}|{self._client(scope)}'
+
+        if limit.concurrency is not None and self._in_flight.get(key, 0) >= limit.concurrency:
+            return await self._reject(send, route, 'concurrency', 1.0)
+
+        if (retry_after := await self.backend.acquire(key, limit)) > 0:
+            return await self._reject(send, route, 'rate', retry_after)
+
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+
+        finally:
+            if (in_flight := self._in_flight[key] - 1) > 0:
+                self._in_flight[key] = in_flight
+            else:
+                del self._in_flight[key]
+
+    @staticmethod
+    async def _reject(send, route: str, reason: str, retry_after: float):
+        metrics.RATE_LIMITED.labels(route, reason).inc()
+        body = json.dumps({'detail': 'Too many requests.'}).encode()
+
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': 429,
+                'headers': [
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'retry-after', str(ceil(retry_after)).encode()),
+                ],
+            }
+        )
+        await send({'type': 'http.response.body', 'body': body})
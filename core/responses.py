@@ -0,0 +1,30 @@
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+class FastJSONResponse(JSONResponse):
+    """ Serializes raw MongoDB documents with orjson.
+
+        Returned as is from an endpoint, it bypasses the validation and `jsonable_encoder` pass
+        FastAPI gives the return annotation, so the documents must already have the response's
+        shape; `datetime`s are encoded by orjson and `ObjectId`s as strings.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default)
+
+
+def fast_response(content: Any, response: Response | None = None) -> FastJSONResponse:
+    """ Wraps `content`, keeping the headers already set on the endpoint's `response`, such as its ETag. """
+    return FastJSONResponse(content, headers=None if response is None else dict(response.headers))
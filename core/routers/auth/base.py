@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from typing import Annotated
 
 from fastapi import (
@@ -9,7 +10,12 @@ from fastapi import (
 
 from core.constants import Provider
 from core.models import Account, User
-from core.routers.auth.utils import get_current_user
+from core.routers.auth.revocation import revocation_list
+from core.routers.auth.utils import (
+    decode_access_token,
+    get_current_user,
+    oauth2_scheme,
+)
 
 router = APIRouter(tags=['Auth'])
 
@@ -37,3 +43,20 @@ async def retrieve_active_account(
         )
 
     return account
+
+
+@router.post('/logout/', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: Annotated[str, Depends(oauth2_scheme)]):
+    """ Revokes the access token used to make this request.
+
+        Tokens issued before they carried a `jti` cannot be revoked on their own, so for those
+        every token issued to the user so far is revoked instead.
+    """
+    payload = decode_access_token(token)
+
+    if (jti := payload.get('jti')) is None:
+        user = await get_current_user(token)
+        await revocation_list.revoke_user(user.id)
+        return
+
+    await revocation_list.revoke_token(jti, datetime.fromtimestamp(payload['exp'], tz=timezone.utc))
@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import re
+import time
 from datetime import (
     datetime,
     timedelta,
@@ -8,14 +11,15 @@ from http import HTTPStatus
 from json import JSONDecodeError
 from uuid import uuid4
 
-import requests
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordBearer
+from httpx import HTTPError
+from jose import JWTError, jwt
 from pydantic import BaseModel
-from requests.exceptions import RequestException
 
 from core.constants import Provider
+from core.http import get_http_client
 from core.models import Token, User
 from core.routers.auth.utils import (
     create_access_token,
@@ -40,18 +44,22 @@ async def login():
     """ The authentication endpoint to be used if authenticating with Google. """
     return {
         'url':
-            f'https://accounts.google.com/o/oauth2/auth?response_type=code&client_id={settings.GOOGLE_CLIENT_ID}&redirect_uri={settings.GOOGLE_REDIRECT_URI}&scope=openid%20profile%20email&access_type=offline'
+            f'{settings.GOOGLE_AUTH_URL}?response_type=code&client_id={settings.GOOGLE_CLIENT_ID}&redirect_uri={settings.GOOGLE_REDIRECT_URI}&scope=openid%20profile%20email&access_type=offline'
     }
 
 
 @router.get('/authenticate/', summary='Google: Authentication Redirect')
 async def auth_google(code: str, redirect_uri: str | None = None) -> Token:
-    token_data = get_google_access_token(code)
+    token_data = await get_google_access_token(code) or {}
 
     if (google_access_token := token_data.get('access_token')) is None:
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail='No access token was provided.')
 
-    if (user_data := get_google_user_data(google_access_token)) is None:
+    # The ID token already carries the profile, so the userinfo round trip is only a fallback.
+    if (user_data := await verify_google_id_token(token_data.get('id_token'), google_access_token)) is None:
+        user_data = await get_google_user_data(google_access_token)
+
+    if user_data is None:
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail='Could not authenticate.')
 
     user = User.from_db(
@@ -80,7 +88,7 @@ async def auth_google(code: str, redirect_uri: str | None = None) -> Token:
 
     access_token, expires = create_access_token(data={
         'sub': user.email
-    })
+    }, user=user)
 
     token = Token(
         access_token=access_token,
@@ -95,8 +103,100 @@ async def auth_google(code: str, redirect_uri: str | None = None) -> Token:
     return RedirectResponse(redirect)
 
 
-def get_google_access_token(code: str) -> dict:
-    token_url = 'https://accounts.google.com/o/oauth2/token'
+class GoogleKeys:
+    """ Caches Google's ID token signing keys for as long as their `Cache-Control` header allows.
+
+        Keys are fetched again before they expire only when a token is signed with a key the cache
+        does not hold, as after Google rotates them, and at most once every `min_refresh_interval`
+        seconds so tokens with made-up key IDs cannot make every login call Google.
+    """
+
+    def __init__(self, min_refresh_interval: float):
+        self.min_refresh_interval = min_refresh_interval
+
+        self._keys: dict | None = None
+        self._expires_at = 0.0
+        self._fetched_at = float('-inf')
+        self._lock = asyncio.Lock()
+
+    def _has(self, kid: str | None) -> bool:
+        return any(key.get('kid') == kid for key in self._keys.get('keys', []))
+
+    async def get(self, kid: str | None = None) -> dict | None:
+        """ Returns the key set, which may not hold `kid` if it is unknown to Google too. """
+        async with self._lock:
+            stale = self._keys is None or time.monotonic() >= self._expires_at or not self._has(kid)
+
+            if stale and time.monotonic() - self._fetched_at >= self.min_refresh_interval:
+                await self._fetch()
+
+            return self._keys
+
+    async def _fetch(self):
+        # Failed attempts count towards the limit as well, so an outage is not hammered either.
+        self._fetched_at = time.monotonic()
+
+        try:
+            response = await get_http_client().get(settings.GOOGLE_CERTS_URL)
+            response.raise_for_status()
+            keys = response.json()
+
+        except (HTTPError, JSONDecodeError) as exc:
+            logger.error(f'Did not retrieve the signing keys from Google.  Exception: {exc}')
+            return
+
+        max_age = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+        self._keys = keys
+        self._expires_at = time.monotonic() + (int(max_age.group(1)) if max_age else 3600)
+
+
+google_keys = GoogleKeys(min_refresh_interval=settings.GOOGLE_CERTS_MIN_REFRESH_SECONDS)
+
+
+async def verify_google_id_token(id_token: str | None, access_token: str) -> dict | None:
+    """ Verifies the ID token against Google's cached signing keys and returns the user data it holds.
+
+        The user data has the same shape as the userinfo endpoint's response.  Returns `None`
+        when there is no ID token or it cannot be verified.
+    """
+    if not id_token:
+        return None
+
+    try:
+        kid = jwt.get_unverified_header(id_token).get('kid')
+
+    except JWTError as exc:
+        logger.warning(f'Could not read the ID token from Google.  Exception: {exc}')
+        return None
+
+    if (keys := await google_keys.get(kid)) is None:
+        return None
+
+    try:
+        claims = jwt.decode(
+            id_token,
+            keys,
+            algorithms=['RS256'],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=settings.GOOGLE_ISSUERS,
+            access_token=access_token,
+        )
+
+    except JWTError as exc:
+        logger.warning(f'Could not verify the ID token from Google.  Exception: {exc}')
+        return None
+
+    return {
+        'id': claims.get('sub'),
+        'email': claims.get('email'),
+        'verified_email': claims.get('email_verified', False),
+        'given_name': claims.get('given_name'),
+        'family_name': claims.get('family_name'),
+        'picture': claims.get('picture', ''),
+    }
+
+
+async def get_google_access_token(code: str) -> dict:
     data = {
         'code': code,
         'client_id': settings.GOOGLE_CLIENT_ID,
@@ -106,9 +206,9 @@ def get_google_access_token(code: str) -> dict:
     }
 
     try:
-        response = requests.post(token_url, data=data)
+        response = await get_http_client().post(settings.GOOGLE_TOKEN_URL, data=data)
 
-    except RequestException as exc:
+    except HTTPError as exc:
         logger.error(
             f'Did not retrieve access token from Google.  Reason: Encountered an error during the request.  Exception: {exc}'
         )
@@ -126,15 +226,15 @@ def get_google_access_token(code: str) -> dict:
     return token_data
 
 
-def get_google_user_data(access_token: str) -> dict:
+async def get_google_user_data(access_token: str) -> dict:
     try:
-        response = requests.get(
-            'https://www.googleapis.com/oauth2/v1/userinfo', headers={
+        response = await get_http_client().get(
+            settings.GOOGLE_USERINFO_URL, headers={
                 'Authorization': f'Bearer {access_token}'
             }
         )
 
-    except RequestException as exc:
+    except HTTPError as exc:
         logger.error(
             f'Did not retrieve user data from Google.  Reason: Encountered an error during the request.  Exception: {exc}'
         )
@@ -10,11 +10,7 @@ from fastapi import (
 from fastapi.security import OAuth2PasswordRequestForm
 
 from core.constants import Provider
-from core.models import (
-    Token,
-    User,
-    UserInDB,
-)
+from core.models import Token, User
 from core.routers.auth.utils import (
     authenticate_user,
     create_access_token,
@@ -37,11 +33,11 @@ async def login(data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
             }
         )
 
-    user = await UserInDB.find_one(UserInDB.id == user.id, projection_model=User)
+    user = User.from_db(user)
 
     access_token, expires = create_access_token(data={
         'sub': user.email
-    })
+    }, user=user)
 
     await update_or_create_account(
         user_id=user.id,
@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Literal
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from core.settings import settings
+
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """ Runs password hashing and verification in a worker pool, away from the event loop.
+
+        bcrypt releases the GIL, so threads are enough to hash in parallel; a process pool is
+        available for schemes which do not.  At most `workers + max_pending` operations are
+        accepted at once, past that requests fail fast with a 503 instead of queueing forever.
+    """
+
+    def __init__(self, executor: Literal['thread', 'process'], workers: int, max_pending: int):
+        self.executor_type = executor
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._executor: Executor | None = None
+        self._in_flight = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.workers + self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='The server is busy, try again shortly.',
+                headers={
+                    'Retry-After': '1'
+                }
+            )
+
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+        finally:
+            self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """ Checks the password against the hash.
+
+            Also returns a new hash when the stored one uses deprecated settings and should be
+            replaced, or `None` when it is current.
+        """
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor=settings.PASSWORD_HASHER_EXECUTOR,
+    workers=settings.PASSWORD_HASHER_WORKERS,
+    max_pending=settings.PASSWORD_HASHER_MAX_PENDING,
+)
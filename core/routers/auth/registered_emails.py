@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
+from bson import ObjectId
+
+from core import metrics
+from core.bloom import BloomFilter
+from core.models import EMAIL_PASSWORD_INDEX, UserInDB
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# ObjectIds generated by different workers are only roughly ordered, so every refresh re-reads
+# a short window before the previous one.
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class RegisteredEmails:
+    """ Keeps a Bloom filter of every user's email, so most unknown emails are answered from memory.
+
+        The filter is built by scanning the email index at startup.  Users created by this worker
+        are added immediately and the ones created by other workers every `refresh_interval`
+        seconds, so another worker's new user can look unregistered for that long.  Deleted users
+        stay in the filter, which only costs a database lookup, until the next rebuild: right
+        after a local delete, or every `rebuild_interval` seconds.
+    """
+
+    def __init__(self, error_rate: float, min_capacity: int, refresh_interval: float, rebuild_interval: float):
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+
+        self._filter: BloomFilter | None = None
+        self._stale = False
+        self._refreshed_at: datetime | None = None
+        self._rebuilt_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def might_exist(self, email: str) -> bool:
+        """ Returns `False` only for emails which are certainly not registered. """
+        return self._filter is None or email in self._filter
+
+    def add(self, email: str):
+        if self._filter is not None:
+            self._filter.add(email)
+
+    def remove(self, email: str):
+        """ Schedules a rebuild, the only way to take an email out of the filter. """
+        self._stale = True
+
+    async def rebuild(self):
+        start = time.perf_counter()
+        now = datetime.now(tz=timezone.utc)
+        collection = UserInDB.get_motor_collection()
+
+        # Twice the current users leaves room for sign-ups until the next rebuild.
+        capacity = max(self.min_capacity, 2 * await collection.estimated_document_count())
+        bloom = BloomFilter(capacity, self.error_rate)
+        self._stale = False
+
+        # Only `email` is projected, so the scan is answered from the index alone.
+        async for user in collection.find({}, {'_id': 0, 'email': 1}, hint=EMAIL_PASSWORD_INDEX, batch_size=10_000):
+            bloom.add(user['email'])
+
+        self._filter = bloom
+        self._refreshed_at = now
+        self._rebuilt_at = time.monotonic()
+        metrics.EMAIL_FILTER_REBUILD_SECONDS.observe(time.perf_counter() - start)
+
+        # Picks up the users created during the scan, including this worker's own.
+        await self.refresh()
+
+    async def refresh(self):
+        if self._filter is None or self._refreshed_at is None:
+            return
+
+        now = datetime.now(tz=timezone.utc)
+        users = UserInDB.get_motor_collection().find(
+            {'_id': {'$gte': ObjectId.from_datetime(self._refreshed_at - REFRESH_OVERLAP)}},
+            {'_id': 0, 'email': 1},
+        )
+
+        async for user in users:
+            self._filter.add(user['email'])
+
+        self._refreshed_at = now
+        metrics.EMAIL_FILTER_ERROR_RATE.set(self._filter.estimated_error_rate())
+
+    async def start(self):
+        await self.rebuild()
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+
+            try:
+                if (
+                    self._stale
+                    or self._filter is None
+                    or self._filter.count > self._filter.capacity
+                    or time.monotonic() - self._rebuilt_at > self.rebuild_interval
+                ):
+                    await self.rebuild()
+                else:
+                    await self.refresh()
+
+            except Exception:
+                logger.exception('Could not refresh the registered emails.')
+
+
+registered_emails = RegisteredEmails(
+    error_rate=settings.EMAIL_FILTER_ERROR_RATE,
+    min_capacity=settings.EMAIL_FILTER_MIN_CAPACITY,
+    refresh_interval=settings.EMAIL_FILTER_REFRESH_INTERVAL_SECONDS,
+    rebuild_interval=settings.EMAIL_FILTER_REBUILD_INTERVAL_SECONDS,
+)
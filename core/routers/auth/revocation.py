@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
+from beanie.odm.fields import PydanticObjectId
+from bson import ObjectId
+
+from core.models import RevokedToken
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# ObjectIds generated by different workers are only roughly ordered, so every refresh re-reads
+# a short window before the previous one.
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+
+class RevocationList:
+    """ Keeps the revoked tokens in memory so checking a token never touches the database.
+
+        Revocations made by this worker apply immediately; the ones made by other workers are
+        picked up from the `revoked_tokens` collection every `refresh_interval` seconds.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+
+        # Datetimes are kept as naive UTC, the way MongoDB returns them.
+        self._jtis: dict[str, datetime] = {}
+        self._users: dict[PydanticObjectId, tuple[datetime, datetime]] = {}
+        self._refreshed_at: datetime | None = None
+        self._task: asyncio.Task | None = None
+
+    def is_revoked(self, payload: dict, user_id: PydanticObjectId | None = None) -> bool:
+        if payload.get('jti') in self._jtis:
+            return True
+
+        if user_id is None or (revoked := self._users.get(user_id)) is None:
+            return False
+
+        issued_at = datetime.fromtimestamp(payload.get('iat', 0), tz=timezone.utc).replace(tzinfo=None)
+        return issued_at <= revoked[0]
+
+    async def revoke_token(self, jti: str, expires_at: datetime):
+        await self._add(RevokedToken(jti=jti, expires_at=expires_at))
+
+    async def revoke_user(self, user_id: PydanticObjectId):
+        """ Revokes every token issued to the user so far, e.g. once they are deleted or change password. """
+        now = datetime.now(tz=timezone.utc)
+        expires_at = now + timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
+
+        await self._add(RevokedToken(user_id=user_id, issued_before=now, expires_at=expires_at))
+
+    async def _add(self, revoked: RevokedToken):
+        await revoked.insert()
+        self._apply(revoked)
+
+    def _apply(self, revoked: RevokedToken):
+        expires_at = _naive(revoked.expires_at)
+
+        if revoked.jti is not None:
+            self._jtis[revoked.jti] = expires_at
+
+        if revoked.user_id is not None and revoked.issued_before is not None:
+            issued_before = _naive(revoked.issued_before)
+            previous = self._users.get(revoked.user_id)
+            if previous is None or previous[0] < issued_before:
+                self._users[revoked.user_id] = (issued_before, expires_at)
+
+    async def refresh(self):
+        now = datetime.now(tz=timezone.utc)
+        query = {}
+        if self._refreshed_at is not None:
+            query['_id'] = {'$gte': ObjectId.from_datetime(self._refreshed_at - REFRESH_OVERLAP)}
+
+        async for revoked in RevokedToken.find(query):
+            self._apply(revoked)
+
+        self._refreshed_at = now
+
+        # Entries past their expiry only guard tokens which are already expired.
+        naive_now = _naive(now)
+        self._jtis = {jti: expires_at for jti, expires_at in self._jtis.items() if expires_at > naive_now}
+        self._users = {user_id: entry for user_id, entry in self._users.items() if entry[1] > naive_now}
+
+    async def start(self):
+        await self.refresh()
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+
+            try:
+                await self.refresh()
+
+            except Exception:
+                logger.exception('Could not refresh the revoked tokens.')
+
+
+def _naive(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+revocation_list = RevocationList(refresh_interval=settings.REVOCATION_REFRESH_INTERVAL_SECONDS)
@@ -5,9 +5,12 @@ from datetime import (
 )
 from http import HTTPStatus
 from typing import Annotated, Iterable
+from uuid import uuid4
 
 from beanie.odm.fields import PydanticObjectId
 from beanie.odm.operators.update.general import Set
+from beanie.odm.utils.parsing import parse_obj
+from beanie.operators import Or
 from fastapi import (
     Depends,
     HTTPException,
@@ -15,17 +18,21 @@ from fastapi import (
 )
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
+from core.constants import USER_CLAIMS_VERSION
 from core.models import (
     Account,
     TokenData,
     User,
     UserInDB,
 )
+from core.routers.auth.passwords import password_hasher
+from core.routers.auth.registered_emails import registered_emails
+from core.routers.auth.revocation import revocation_list
 from core.settings import settings
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
 
@@ -38,36 +45,33 @@ async def update_or_create_account(
     token_type: str,
     refresh_token: str = '',
     image: str = ''
-) -> Account:
-
-    _account = Account(
-        user_id=user_id,
-        provider=provider,
-        provider_account_id=provider_account_id,
-        access_token=access_token,
-        expires_at=expires_at,
-        token_type=token_type,
-        refresh_token=refresh_token,
-        image=image
-    )
-
-    _set = Set(
-        {
-            Account.user_id: user_id,
-            Account.provider: provider,
-            Account.provider_account_id: provider_account_id,
-            Account.access_token: access_token,
-            Account.expires_at: expires_at,
-            Account.token_type: token_type,
-            Account.refresh_token: refresh_token,
-            Account.image: image
-        }
-    )
+):
+    """ Stores the latest tokens of the user's account with the provider, creating it on the first login.
 
-    return await Account.find_one(Account.user_id == user_id,
-                                  Account.provider_account_id == provider_account_id).upsert(
-                                      _set, on_insert=_account
-                                  )
+        A single upsert on the unique (user_id, provider_account_id) index does both, so it is one
+        round trip.  When two first logins race, the one which loses the insert retries as an update.
+    """
+    for attempt in range(2):
+        try:
+            await Account.get_motor_collection().update_one(
+                {'user_id': user_id, 'provider_account_id': provider_account_id},
+                {
+                    '$set': {
+                        'access_token': access_token,
+                        'expires_at': expires_at,
+                        'token_type': token_type,
+                        'refresh_token': refresh_token,
+                        'image': image,
+                    },
+                    '$setOnInsert': {'provider': provider},
+                },
+                upsert=True,
+            )
+            return
+
+        except DuplicateKeyError:
+            if attempt:
+                raise
 
 
 async def get_or_create_user(
@@ -79,40 +83,69 @@ async def get_or_create_user(
     password: str = '',
     image: str = '',
 ) -> UserInDB:
+    """ Returns the user with the given email, creating it in the same round trip if it does not exist. """
+    user = UserInDB(
+        username=username,
+        given_name=given_name,
+        family_name=family_name,
+        email=email,
+        email_verified=email_verified,
+        password=password,
+        image=image,
+    )
 
-    if (user := await UserInDB.find_one(UserInDB.email == email)) is None:
-        user = UserInDB(
-            username=username,
-            given_name=given_name,
-            family_name=family_name,
-            email=email,
-            email_verified=email_verified,
-            password=password,
-            image=image,
-        )
+    for attempt in range(2):
+        try:
+            document = await UserInDB.get_motor_collection().find_one_and_update(
+                {'email': email},
+                {'$setOnInsert': user.model_dump(exclude={'id', 'revision_id', 'comments'})},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
 
-        await user.save()
+        except DuplicateKeyError:
+            # A concurrent first login created the user between our match and insert.
+            if attempt:
+                raise
 
-    return user
+    registered_emails.add(email)
+
+    return parse_obj(UserInDB, document)
 
 
 async def authenticate_user(email_or_username: str, password: str) -> UserInDB | None:
     """ Attempts to authenticate the user from the given email/username.
     
-        Checks if a user exists with the given email, or with the given username, then
-        checks if the password hashes match.
+        Looks the user up by email or username in a single query, preferring the email match,
+        then checks if the password hashes match.  A hash using deprecated settings is replaced
+        with a fresh one once the password is known to be correct.
     """
-    if (user := await UserInDB.find_one(UserInDB.email == email_or_username)) is None:
-        if (user := await UserInDB.find_one(UserInDB.username == email_or_username)) is None:
-            return None
+    users = await UserInDB.find(
+        Or(UserInDB.email == email_or_username, UserInDB.username == email_or_username)
+    ).limit(2).to_list()
+
+    if not users:
+        return None
+
+    user = next((user for user in users if user.email == email_or_username), users[0])
 
-    if not pwd_context.verify(password, user.password):
+    # Users who only signed in through a provider have no password to check against.
+    if not user.password:
         return None
 
+    valid, new_password = await password_hasher.verify(password, user.password)
+    if not valid:
+        return None
+
+    if new_password is not None:
+        await UserInDB.find_one(UserInDB.id == user.id).update(Set({UserInDB.password: new_password}))
+        user.password = new_password
+
     return user
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+def decode_access_token(token: str) -> dict:
     CredentialsException = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -123,28 +156,69 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Use
 
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        if (email := payload.get('sub')) is None:
+        if payload.get('sub') is None:
             raise CredentialsException
 
     except JWTError:
         raise CredentialsException from None
 
-    token_data = TokenData(email=email)
-    if (user := await UserInDB.find_one(UserInDB.email == token_data.email, projection_model=User)) is None:
+    if revocation_list.is_revoked(payload):
+        raise CredentialsException
+
+    return payload
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> User:
+    """ Returns the user the access token was issued to.
+
+        Tokens carrying the user's claims are trusted as-is, without loading the user.
+    """
+    CredentialsException = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={
+            "WWW-Authenticate": "Bearer"
+        }
+    )
+
+    payload = decode_access_token(token)
+
+    if settings.JWT_EMBED_USER_CLAIMS and payload.get('ver') == USER_CLAIMS_VERSION and 'usr' in payload:
+        user = User.model_validate({**payload['usr'], 'email': payload['sub']})
+
+    else:
+        token_data = TokenData(email=payload['sub'])
+        if (user := await UserInDB.find_one(UserInDB.email == token_data.email, projection_model=User)) is None:
+            raise CredentialsException
+
+    if revocation_list.is_revoked(payload, user.id):
         raise CredentialsException
 
     return user
 
 
-def create_access_token(data: dict) -> tuple[str, datetime]:
+def create_access_token(data: dict, user: User | None = None) -> tuple[str, datetime]:
+    """ Creates an access token holding `data`.
+
+        With `JWT_EMBED_USER_CLAIMS` enabled, the given user's claims are embedded as well so the
+        token can be resolved without a database lookup.
+    """
     to_encode = data.copy()
-    expires_delta = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
-    expires = datetime.now(tz=timezone.utc) + expires_delta
+    issued_at = datetime.now(tz=timezone.utc)
+    expires = issued_at + timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({
-        'exp': expires
+        'exp': expires,
+        'iat': issued_at,
+        'jti': uuid4().hex,
     })
 
+    if settings.JWT_EMBED_USER_CLAIMS and user is not None:
+        to_encode.update({
+            'ver': USER_CLAIMS_VERSION,
+            'usr': user.model_dump(mode='json', by_alias=True, exclude={'email'}),
+        })
+
     access_token = jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
 
     return access_token, expires
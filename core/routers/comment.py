@@ -4,13 +4,49 @@ from beanie import WriteRules
 from beanie.odm.fields import PydanticObjectId
 from fastapi import (
     APIRouter,
+    Depends,
     HTTPException,
     Query,
+    Request,
+    Response,
     status,
 )
-from pydantic import BaseModel
-
-from core.models import Comment
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from pydantic import BaseModel, Field
+from pymongo.read_concern import ReadConcern
+
+from core.cache import document_cache
+from core.db import (
+    get_read_collection,
+    read_many,
+    read_one,
+    read_raw,
+    read_raw_one,
+    read_session,
+)
+from core.etag import (
+    bump,
+    comment_scopes,
+    conditional_response,
+    product_comments_scope,
+)
+from core.fieldsets import sparse_fields
+from core.live import live_hub
+from core.models import (
+    COMMENT_FIELDS,
+    Comment,
+    CommentCreate,
+    CommentSearchResult,
+)
+from core.pagination import (
+    Page,
+    keyset_filter,
+    keyset_sort,
+    paginate,
+)
+from core.ranking import resolve_order_by, store_rankings
+from core.responses import fast_response
+from core.settings import settings
 
 router = APIRouter(tags=['Comment'])
 
@@ -18,25 +54,138 @@ router = APIRouter(tags=['Comment'])
 class CommentQueryParams(BaseModel):
     product_id: PydanticObjectId | None = None
     is_reply: bool | None = None
-    order_by: Literal['created_at', '-created_at', 'updated_at', '-updated_at'] = '-created_at'
+    order_by: Literal['created_at', '-created_at', 'updated_at', '-updated_at', 'top', 'hot'] = '-created_at'
+    limit: int = Field(settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT)
+    cursor: str | None = None
 
 
-@router.get('/')
-async def list_comments(query: Annotated[CommentQueryParams, Query()]) -> list[Comment]:
-    query_params = query.model_dump(exclude_none=True, exclude_unset=True)
-    sort = query_params.pop('order_by', 'created_at')
+class CommentSearchParams(BaseModel):
+    q: str = Field(min_length=1, max_length=200)
+    product_id: PydanticObjectId
+    limit: int = Field(settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT)
+    cursor: str | None = None
+
 
-    return await Comment.find(query_params).sort(sort).to_list()
+@router.get('/')
+async def list_comments(
+    query: Annotated[CommentQueryParams, Query()],
+    fields: Annotated[dict[str, int] | None, Depends(sparse_fields(COMMENT_FIELDS))],
+    session: Annotated[AsyncIOMotorClientSession, Depends(read_session)],
+    request: Request,
+    response: Response,
+) -> Page[Comment]:
+    """ Lists comments one page at a time, ordered by `order_by` with `_id` as the tie-breaker.
+
+        Pass the returned `next_cursor` as `cursor` to fetch the following page.  Listings of a
+        single product's comments carry an ETag.  With `fields`, only those fields are returned,
+        along with `_id` and the `order_by` field the cursor is built from.  `top` and `hot` order
+        by the scores stored on each comment, highest first.
+    """
+    if query.product_id is not None:
+        scope = product_comments_scope(query.product_id)
+        if (not_modified := await conditional_response(request, response, scope, session)) is not None:
+            return not_modified
+
+    query_params = query.model_dump(exclude_none=True, exclude={'order_by', 'limit', 'cursor'})
+    order_by = resolve_order_by(query.order_by)
+
+    if query.product_id is not None and query.is_reply is None:
+        # Naming both values keeps the `(product_id, is_reply, ...)` indexes usable for the sort: the
+        # server scans the range of each value in order and merges them instead of sorting in memory.
+        query_params['is_reply'] = {'$in': [False, True]}
+
+    if query.cursor is not None:
+        query_params = {'$and': [query_params, keyset_filter(order_by, query.cursor)]}
+
+    fast = fields is not None or settings.FAST_RESPONSES
+
+    if fast:
+        comments = await read_raw(
+            Comment,
+            query_params,
+            projection=COMMENT_FIELDS if fields is None else {**fields, order_by.lstrip('-'): 1},
+            sort=keyset_sort(order_by),
+            limit=query.limit + 1,
+            read_concern=ReadConcern('local'),
+            session=session,
+        )
+    else:
+        comments = await read_many(
+            Comment,
+            query_params,
+            sort=keyset_sort(order_by),
+            limit=query.limit + 1,
+            read_concern=ReadConcern('local'),
+            session=session,
+        )
+
+    page = paginate(comments, query.limit, order_by)
+
+    if fast:
+        return fast_response({'items': page.items, 'next_cursor': page.next_cursor}, response)
+
+    return page
+
+
+@router.get('/search/')
+async def search_comments(query: Annotated[CommentSearchParams, Query()]) -> Page[CommentSearchResult]:
+    """ Searches a product's comments for the words in `q`, most relevant first.
+
+        `q` follows MongoDB's text search syntax: words match any of their forms, `"quoted phrases"`
+        must appear as is and `-word` excludes comments containing it.  Pages are cut by relevance
+        with `_id` as the tie-breaker, so `next_cursor` works as in the listing.
+    """
+    order_by = '-text_score'
+    pipeline = [
+        {'$match': {'product_id': query.product_id, '$text': {'$search': query.q}}},
+        {'$project': {**COMMENT_FIELDS, 'text_score': {'$meta': 'textScore'}}},
+    ]
+
+    if query.cursor is not None:
+        pipeline.append({'$match': keyset_filter(order_by, query.cursor)})
+
+    pipeline += [
+        {'$sort': dict(keyset_sort(order_by))},
+        {'$limit': query.limit + 1},
+    ]
+
+    results = await get_read_collection(Comment, ReadConcern('local')).aggregate(pipeline).to_list(None)
+    page = paginate(results, query.limit, order_by)
+
+    if settings.FAST_RESPONSES:
+        return fast_response({'items': page.items, 'next_cursor': page.next_cursor})
+
+    return Page[CommentSearchResult](items=page.items, next_cursor=page.next_cursor)
 
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
-async def create_comment(comment: Comment) -> Comment:
-    return await comment.save()
+async def create_comment(data: CommentCreate) -> Comment:
+    # Replies are created with `POST /replies/{parent_id}/`, which keeps the parent's count in step.
+    comment = Comment(**data.model_dump())
+    await comment.insert()
+    await store_rankings(comment)
+    await bump(*comment_scopes(comment))
+    await live_hub.publish(comment.product_id, 'comment', comment.model_dump(by_alias=True, exclude={'revision_id'}))
+
+    return comment
 
 
 @router.get('/{id}/')
-async def retrieve_comment(id: PydanticObjectId) -> Comment:
-    if (comment := await Comment.find_one(Comment.id == id)) is None:
+async def retrieve_comment(
+    id: PydanticObjectId, fields: Annotated[dict[str, int] | None, Depends(sparse_fields(COMMENT_FIELDS))]
+) -> Comment:
+    if fields is not None:
+        comment = await read_raw_one(Comment, {'_id': id}, projection=fields, read_concern=ReadConcern('majority'))
+        if comment is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Comment not found.')
+
+        return fast_response(comment)
+
+    comment = await document_cache.get_or_load(
+        'Comment', id, lambda: read_one(Comment, {'_id': id}, read_concern=ReadConcern('majority'), primary=True)
+    )
+
+    if comment is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Comment not found.')
 
     return comment
@@ -48,3 +197,21 @@ async def delete_comment(id: PydanticObjectId):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Comment not found.')
 
     await comment.delete(link_rule=WriteRules.WRITE)
+
+    await document_cache.invalidate('Comment', id)
+    scopes = comment_scopes(comment)
+
+    if comment.parent_id is not None:
+        # The parent's reply count changed too, which shows in the listings the parent is part of.
+        parent = await Comment.get_motor_collection().find_one_and_update(
+            {'_id': comment.parent_id},
+            {'$inc': {'reply_count': -1}},
+            projection={'product_id': 1, 'parent_id': 1},
+        )
+        await document_cache.invalidate('Comment', comment.parent_id)
+
+        if parent is not None:
+            scopes += comment_scopes(parent)
+
+    await bump(*scopes)
+    await live_hub.publish(comment.product_id, 'comment_deleted', {'_id': id, 'parent_id': comment.parent_id})
@@ -1,29 +1,83 @@
-from beanie import WriteRules
+from typing import Annotated
+
 from beanie.odm.fields import PydanticObjectId
 from fastapi import (
     APIRouter,
     HTTPException,
+    Query,
+    Response,
     status,
 )
+from pydantic import BaseModel, Field
+from pymongo.read_concern import ReadConcern
 
+from core.db import read_many, read_one
 from core.models import CommentVote
+from core.pagination import (
+    Page,
+    keyset_filter,
+    keyset_sort,
+    paginate,
+)
+from core.settings import settings
+from core.votes import (
+    VoteBufferFull,
+    cast_vote,
+    remove_vote,
+    vote_buffer,
+)
 
 router = APIRouter(tags=['CommentVote'])
 
 
+class CommentVoteQueryParams(BaseModel):
+    limit: int = Field(settings.PAGINATION_DEFAULT_LIMIT, ge=1, le=settings.PAGINATION_MAX_LIMIT)
+    cursor: str | None = None
+
+
 @router.get('/')
-async def list_comments() -> list[CommentVote]:
-    return CommentVote.find()
+async def list_comments(query: Annotated[CommentVoteQueryParams, Query()]) -> Page[CommentVote]:
+    """ Lists votes one page at a time, newest first.  Pass `next_cursor` as `cursor` for the next page. """
+    order_by = '-_id'
+
+    votes = await read_many(
+        CommentVote,
+        {} if query.cursor is None else keyset_filter(order_by, query.cursor),
+        sort=keyset_sort(order_by),
+        limit=query.limit + 1,
+        read_concern=ReadConcern('local'),
+    )
+
+    return paginate(votes, query.limit, order_by)
 
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
-async def create_comment(comment: CommentVote) -> CommentVote:
-    return await comment.save()
+async def create_comment(comment: CommentVote, response: Response) -> CommentVote:
+    """ Casts a vote.  With the vote buffer enabled, the vote is accepted and written shortly after. """
+    if not settings.VOTE_BUFFER_ENABLED:
+        return await cast_vote(comment.comment_id, comment.user_id, comment.action)
+
+    try:
+        await vote_buffer.submit(comment.comment_id, comment.user_id, comment.action)
+
+    except VoteBufferFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail='Too many votes are being processed, try again shortly.',
+            headers={
+                'Retry-After': '1'
+            }
+        ) from None
+
+    response.status_code = status.HTTP_202_ACCEPTED
+    comment.id = None
+
+    return comment
 
 
 @router.get('/{id}/')
 async def retrieve_comment(id: PydanticObjectId) -> CommentVote:
-    if (comment := await CommentVote.find_one(CommentVote.id == id)) is None:
+    if (comment := await read_one(CommentVote, {'_id': id}, read_concern=ReadConcern('majority'))) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='CommentVote not found.')
 
     return comment
@@ -31,7 +85,5 @@ async def retrieve_comment(id: PydanticObjectId) -> CommentVote:
 
 @router.delete('/{id}/', status_code=204)
 async def delete_comment(id: PydanticObjectId):
-    if (comment := await CommentVote.find_one(CommentVote.id == id)) is None:
+    if await remove_vote(id) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='CommentVote not found.')
-
-    await comment.delete(link_rule=WriteRules.WRITE)
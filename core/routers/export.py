@@ -0,0 +1,98 @@
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
+from beanie import Document
+from beanie.odm.fields import PydanticObjectId
+from beanie.odm.utils.projection import get_projection
+from bson import ObjectId
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from pymongo.read_concern import ReadConcern
+
+from core.db import get_read_collection
+from core.models import (
+    Comment,
+    CommentVote,
+    Product,
+    User,
+    UserInDB,
+)
+from core.settings import settings
+
+router = APIRouter(tags=['Export'])
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+async def export_documents(
+    model: type[Document],
+    projection: dict | None,
+    since: datetime | None,
+    after: PydanticObjectId | None,
+) -> AsyncIterator[str]:
+    """ Streams the collection as newline-delimited JSON, in `_id` order, one cursor batch per chunk.
+
+        Only one batch is held in memory at a time.  An interrupted export resumes by passing the
+        `_id` of the last line received as `after`; `since` starts from the documents created at
+        or after that time, as recorded in their `_id`.
+    """
+    bounds = {}
+    if since is not None:
+        bounds['$gte'] = ObjectId.from_datetime(since)
+    if after is not None:
+        bounds['$gt'] = after
+
+    cursor = get_read_collection(model, ReadConcern('local')).find(
+        {'_id': bounds} if bounds else {},
+        projection,
+        sort=[('_id', 1)],
+        batch_size=settings.EXPORT_BATCH_SIZE,
+    )
+
+    try:
+        lines = []
+        async for document in cursor:
+            lines.append(json.dumps(document, default=_json_default))
+
+            if len(lines) >= settings.EXPORT_BATCH_SIZE:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    finally:
+        await cursor.close()
+
+
+def ndjson_response(lines: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(lines, media_type='application/x-ndjson')
+
+
+@router.get('/comments/')
+async def export_comments(since: datetime | None = None, after: PydanticObjectId | None = None):
+    return ndjson_response(export_documents(Comment, None, since, after))
+
+
+@router.get('/votes/')
+async def export_votes(since: datetime | None = None, after: PydanticObjectId | None = None):
+    return ndjson_response(export_documents(CommentVote, None, since, after))
+
+
+@router.get('/users/')
+async def export_users(since: datetime | None = None, after: PydanticObjectId | None = None):
+    return ndjson_response(export_documents(UserInDB, get_projection(User), since, after))
+
+
+@router.get('/products/')
+async def export_products(since: datetime | None = None, after: PydanticObjectId | None = None):
+    return ndjson_response(export_documents(Product, None, since, after))
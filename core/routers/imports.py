@@ -0,0 +1,373 @@
+import codecs
+import json
+from collections import Counter
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    TypeVar,
+)
+
+from beanie.odm.fields import PydanticObjectId
+from beanie.odm.utils.dump import get_dict
+from bson import ObjectId
+from fastapi import APIRouter, Request
+from pydantic import BaseModel, Field, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from core.cache import document_cache
+from core.constants import CommentAction
+from core.etag import (
+    bump,
+    comment_scopes,
+    product_scope,
+)
+from core.models import Comment, Product
+from core.settings import settings
+from core.votes import apply_votes
+
+router = APIRouter(tags=['Import'])
+
+NDJSON_MEDIA_TYPES = {'application/x-ndjson', 'application/jsonl'}
+
+M = TypeVar('M', bound=BaseModel)
+
+
+class ProductImport(BaseModel):
+    external_id: str
+    affiliate_links: list[str]
+
+
+class CommentImport(BaseModel):
+    message: str
+    user_id: PydanticObjectId
+    product_id: PydanticObjectId
+    parent_id: PydanticObjectId | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
+
+
+class VoteImport(BaseModel):
+    action: CommentAction
+    comment_id: PydanticObjectId
+    user_id: PydanticObjectId
+
+
+class ImportItemError(BaseModel):
+    index: int
+    detail: Any
+
+
+class ImportResult(BaseModel):
+    received: int = 0
+    written: int = 0
+    failed: int = 0
+    errors: list[ImportItemError] = []
+
+    def add_error(self, index: int, detail: Any):
+        self.failed += 1
+
+        # Only the first errors are kept, so a bad upload cannot grow the response without bound.
+        if len(self.errors) < settings.IMPORT_MAX_ERRORS:
+            self.errors.append(ImportItemError(index=index, detail=detail))
+
+
+class MalformedBody(Exception):
+    pass
+
+
+async def read_ndjson(request: Request) -> AsyncIterator[Any]:
+    buffer = b''
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+
+        if len(buffer) > settings.IMPORT_MAX_ITEM_BYTES:
+            raise MalformedBody(f'Line is longer than {settings.IMPORT_MAX_ITEM_BYTES} bytes.')
+
+        for line in lines:
+            if line.strip():
+                yield line
+
+    if buffer.strip():
+        yield buffer
+
+
+async def read_json_array(request: Request) -> AsyncIterator[Any]:
+    """ Yields the elements of a JSON array as they arrive, without reading the whole body first. """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    expected = '['
+    done = False
+
+    async def parse(final: bool):
+        nonlocal buffer, expected, done
+
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer or done:
+                return
+
+            if expected in ('[', ','):
+                if buffer[0] == ']' and expected == ',':
+                    done = True
+                    return
+
+                if buffer[0] != expected:
+                    raise MalformedBody(f'Expected {expected!r}.')
+
+                buffer = buffer[1:]
+                expected = 'item'
+                continue
+
+            if buffer[0] == ']':
+                done = True
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer)
+
+            except json.JSONDecodeError:
+                if final:
+                    raise MalformedBody('Invalid JSON.') from None
+                return
+
+            # A number at the very end of the buffer may still be missing digits.
+            if end == len(buffer) and not final:
+                return
+
+            yield item
+            buffer = buffer[end:]
+            expected = ','
+
+    async for chunk in request.stream():
+        buffer += text.decode(chunk)
+
+        async for item in parse(final=False):
+            yield item
+
+        if len(buffer) > settings.IMPORT_MAX_ITEM_BYTES:
+            raise MalformedBody(f'Item is longer than {settings.IMPORT_MAX_ITEM_BYTES} bytes.')
+
+    buffer += text.decode(b'', final=True)
+
+    async for item in parse(final=True):
+        yield item
+
+    if not done:
+        raise MalformedBody('Unterminated JSON array.')
+
+
+async def import_items(
+    request: Request,
+    schema: type[M],
+    write_chunk: Callable[[list[tuple[int, M]], ImportResult], Awaitable[None]],
+) -> ImportResult:
+    """ Validates the uploaded items and hands them to `write_chunk` in chunks of `IMPORT_CHUNK_SIZE`.
+
+        The body is either newline-delimited JSON or a JSON array, and is parsed as it arrives, so
+        only one chunk is held in memory.  Invalid items are reported by their position in the
+        upload and do not stop the others from being written.
+    """
+    result = ImportResult()
+    chunk = []
+
+    if request.headers.get('content-type', '').split(';')[0].strip() in NDJSON_MEDIA_TYPES:
+        items = read_ndjson(request)
+    else:
+        items = read_json_array(request)
+
+    try:
+        async for item in items:
+            index = result.received
+            result.received += 1
+
+            try:
+                if isinstance(item, bytes):
+                    chunk.append((index, schema.model_validate_json(item)))
+                else:
+                    chunk.append((index, schema.model_validate(item)))
+
+            except ValidationError as exc:
+                result.add_error(index, exc.errors(include_url=False, include_context=False))
+
+            if len(chunk) >= settings.IMPORT_CHUNK_SIZE:
+                await write_chunk(chunk, result)
+                chunk = []
+
+    except MalformedBody as exc:
+        # Whatever follows a syntax error cannot be split into items, so the upload stops there.
+        result.add_error(result.received, str(exc))
+
+    if chunk:
+        await write_chunk(chunk, result)
+
+    return result
+
+
+def report_write_errors(exc: BulkWriteError, indexes: list[int], result: ImportResult) -> int:
+    """ Records the failed writes of an unordered bulk write and returns how many there were. """
+    errors = exc.details.get('writeErrors', [])
+
+    for error in errors:
+        result.add_error(indexes[error['index']], error['errmsg'])
+
+    return len(errors)
+
+
+async def write_products(chunk: list[tuple[int, ProductImport]], result: ImportResult):
+    failed = 0
+
+    try:
+        await Product.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {'external_id': product.external_id},
+                    {'$set': {'affiliate_links': product.affiliate_links}},
+                    upsert=True,
+                )
+                for _, product in chunk
+            ],
+            ordered=False,
+        )
+
+    except BulkWriteError as exc:
+        failed = report_write_errors(exc, [index for index, _ in chunk], result)
+
+    result.written += len(chunk) - failed
+
+    if document_cache.enabled:
+        # Upserts that matched an existing product do not report its `_id`, so it is looked up.
+        products = Product.get_motor_collection().find(
+            {'external_id': {'$in': [product.external_id for _, product in chunk]}},
+            {'_id': 1},
+        )
+        await document_cache.invalidate('Product', *[product['_id'] async for product in products])
+
+    await bump(product_scope())
+
+
+async def write_comments(chunk: list[tuple[int, CommentImport]], result: ImportResult):
+    product_ids = {comment.product_id for _, comment in chunk}
+    parent_ids = {comment.parent_id for _, comment in chunk if comment.parent_id is not None}
+
+    products = {
+        product['_id']
+        async for product in Product.get_motor_collection().find({'_id': {'$in': list(product_ids)}}, {'_id': 1})
+    }
+    parents = {
+        parent['_id']: parent
+        async for parent in Comment.get_motor_collection().find(
+            {'_id': {'$in': list(parent_ids)}},
+            {'product_id': 1, 'parent_id': 1},
+        )
+    } if parent_ids else {}
+
+    indexes, documents = [], []
+    for index, comment in chunk:
+        if comment.product_id not in products:
+            result.add_error(index, 'Product not found.')
+            continue
+
+        if comment.parent_id is not None:
+            if (parent := parents.get(comment.parent_id)) is None:
+                result.add_error(index, 'Parent Comment not found.')
+                continue
+
+            if parent['product_id'] != comment.product_id:
+                result.add_error(index, 'Parent Comment belongs to another Product.')
+                continue
+
+        document = Comment(
+            id=ObjectId(),
+            is_reply=comment.parent_id is not None,
+            **comment.model_dump(),
+        )
+        indexes.append(index)
+        documents.append(document)
+
+    if not documents:
+        return
+
+    failed = set()
+    try:
+        await Comment.get_motor_collection().insert_many(
+            [get_dict(document, to_db=True) for document in documents],
+            ordered=False,
+        )
+
+    except BulkWriteError as exc:
+        failed = {error['index'] for error in exc.details.get('writeErrors', [])}
+        report_write_errors(exc, indexes, result)
+
+    inserted = [document for position, document in enumerate(documents) if position not in failed]
+    result.written += len(inserted)
+
+    replies = Counter(document.parent_id for document in inserted if document.parent_id is not None)
+    if replies:
+        await Comment.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {'_id': parent_id},
+                    {'$inc': {'reply_count': count}, '$set': {'updated_at': datetime.now(tz=timezone.utc)}},
+                )
+                for parent_id, count in replies.items()
+            ],
+            ordered=False,
+        )
+        await document_cache.invalidate('Comment', *replies)
+
+    await bump(
+        *[scope for document in inserted for scope in comment_scopes(document)],
+        *[scope for parent_id in replies for scope in comment_scopes(parents[parent_id])],
+    )
+
+
+async def write_votes(chunk: list[tuple[int, VoteImport]], result: ImportResult):
+    comments = {
+        comment['_id']
+        async for comment in Comment.get_motor_collection().find(
+            {'_id': {'$in': list({vote.comment_id for _, vote in chunk})}},
+            {'_id': 1},
+        )
+    }
+
+    # Later votes by the same user on the same comment replace earlier ones, as they would have
+    # one request at a time.
+    votes, positions = {}, {}
+    for index, vote in chunk:
+        if vote.comment_id not in comments:
+            result.add_error(index, 'Comment not found.')
+            continue
+
+        key = (vote.comment_id, vote.user_id)
+        votes.pop(key, None)
+        votes[key] = vote.action
+        positions.setdefault(key, []).append(index)
+
+    failed = 0
+    for key, error in (await apply_votes(votes)).items():
+        for index in positions[key]:
+            result.add_error(index, error['errmsg'])
+            failed += 1
+
+    result.written += sum(len(indexes) for indexes in positions.values()) - failed
+
+
+@router.post('/products/')
+async def import_products(request: Request) -> ImportResult:
+    return await import_items(request, ProductImport, write_products)
+
+
+@router.post('/comments/')
+async def import_comments(request: Request) -> ImportResult:
+    return await import_items(request, CommentImport, write_comments)
+
+
+@router.post('/votes/')
+async def import_votes(request: Request) -> ImportResult:
+    return await import_items(request, VoteImport, write_votes)
@@ -1,30 +1,130 @@
 from http import HTTPStatus
-from typing import Iterable
+from typing import (
+    Annotated,
+    Iterable,
+    Literal,
+)
 
 from beanie.odm.fields import PydanticObjectId
-from fastapi import APIRouter, HTTPException
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from pydantic import BaseModel, Field
+from pymongo.errors import DuplicateKeyError
+from pymongo.read_concern import ReadConcern
 
-from core.models import Product
+from core.cache import document_cache
+from core.db import (
+    get_read_collection,
+    read_exists,
+    read_many,
+    read_one,
+    read_raw,
+    read_raw_one,
+    read_session,
+)
+from core.etag import (
+    bump,
+    conditional_response,
+    product_scope,
+)
+from core.fieldsets import sparse_fields
+from core.live import live_hub
+from core.models import (
+    PRODUCT_FIELDS,
+    Comment,
+    Product,
+    ProductPage,
+    ProductPageComment,
+    PublicUser,
+    Thread,
+    ThreadComment,
+    UserInDB,
+)
+from core.pagination import (
+    keyset_filter,
+    keyset_sort,
+    paginate,
+)
+from core.responses import fast_response
 from core.settings import settings
 
 router = APIRouter(tags=['Products'])
 
 
 @router.get('/')
-async def list_products() -> Iterable[Product]:
-    return await Product.find().to_list()
+async def list_products(
+    fields: Annotated[dict[str, int] | None, Depends(sparse_fields(PRODUCT_FIELDS))],
+    session: Annotated[AsyncIOMotorClientSession, Depends(read_session)],
+    request: Request,
+    response: Response,
+) -> Iterable[Product]:
+    if (not_modified := await conditional_response(request, response, product_scope(), session)) is not None:
+        return not_modified
+
+    if fields is not None or settings.FAST_RESPONSES:
+        products = await read_raw(
+            Product,
+            {},
+            projection=fields or PRODUCT_FIELDS,
+            read_concern=ReadConcern('local'),
+            session=session,
+        )
+        return fast_response(products, response)
+
+    return await read_many(Product, {}, read_concern=ReadConcern('local'), session=session)
 
 
 @router.post('/', status_code=HTTPStatus.CREATED)
 async def create_product(product: Product) -> Product:
-    await product.insert()
+    try:
+        await product.insert()
+
+    except DuplicateKeyError:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail='Product already exists.') from None
+
+    await bump(product_scope())
 
     return product
 
 
 @router.get('/{id}/')
-async def retrieve_product(id: PydanticObjectId) -> Product:
-    if (product := await Product.find_one(Product.id == id)) is None:
+async def retrieve_product(
+    id: PydanticObjectId,
+    fields: Annotated[dict[str, int] | None, Depends(sparse_fields(PRODUCT_FIELDS))],
+    session: Annotated[AsyncIOMotorClientSession, Depends(read_session)],
+    request: Request,
+    response: Response,
+) -> Product:
+    if (not_modified := await conditional_response(request, response, product_scope(), session)) is not None:
+        return not_modified
+
+    if fields is not None:
+        product = await read_raw_one(
+            Product,
+            {'_id': id},
+            projection=fields,
+            read_concern=ReadConcern('majority'),
+            session=session,
+        )
+        if product is None:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Product not found.')
+
+        return fast_response(product, response)
+
+    product = await document_cache.get_or_load(
+        'Product', id, lambda: read_one(Product, {'_id': id}, read_concern=ReadConcern('majority'), primary=True)
+    )
+
+    if product is None:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Product not found.')
 
     return product
@@ -36,3 +136,163 @@ async def delete_product(id: PydanticObjectId):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Product not found.')
 
     await product.delete()
+    await document_cache.invalidate('Product', id)
+    await bump(product_scope())
+
+
+class ThreadQueryParams(BaseModel):
+    limit: int = Field(10, ge=1, le=settings.PAGINATION_MAX_LIMIT)
+    cursor: str | None = None
+    order_by: Literal['created_at', '-created_at'] = '-created_at'
+    depth: int = Field(3, ge=1, le=settings.THREAD_MAX_DEPTH)
+
+
+@router.get('/{id}/thread/')
+async def retrieve_thread(id: PydanticObjectId, query: Annotated[ThreadQueryParams, Query()]) -> Thread:
+    """ Returns a page of the product's root comments with their replies nested up to `depth` levels.
+
+        The whole page comes from a single aggregation.  `THREAD_MAX_NODES` is split evenly between
+        the roots of a page, and each root gets at most its share of replies, shallowest and oldest
+        first; `truncated` tells whether some were left out.
+    """
+    match = {'product_id': id, 'is_reply': False}
+    if query.cursor is not None:
+        match = {'$and': [match, keyset_filter(query.order_by, query.cursor)]}
+
+    fields = {field: 1 for field in ThreadComment.model_fields if field not in ('id', 'children')}
+    budget = max(settings.THREAD_MAX_NODES // query.limit, 1)
+    levels = [f'level{depth}' for depth in range(query.depth)]
+
+    roots = await get_read_collection(Comment, ReadConcern('local')).aggregate(
+        [
+            {'$match': match},
+            {'$sort': dict(keyset_sort(query.order_by))},
+            {'$limit': query.limit + 1},
+            # One lookup per level, each fetching at most one more reply than the root's share, so
+            # a large thread costs no more than a small one.  `$graphLookup` would load it all.
+            *[
+                {
+                    '$lookup': {
+                        'from': Comment.get_collection_name(),
+                        'localField': '_id' if depth == 0 else f'{levels[depth - 1]}._id',
+                        'foreignField': 'parent_id',
+                        'pipeline': [
+                            {'$sort': {'created_at': 1, '_id': 1}},
+                            {'$limit': budget + 1},
+                            {'$project': fields},
+                        ],
+                        'as': level,
+                    }
+                } for depth, level in enumerate(levels)
+            ],
+            {'$set': {'descendants': {'$concatArrays': [f'${level}' for level in levels]}}},
+            {'$project': {**fields, 'descendants': 1}},
+        ]
+    ).to_list(None)
+
+    page = paginate(roots, query.limit, query.order_by)
+    return Thread(**build_thread(page.items, budget), next_cursor=page.next_cursor)
+
+
+def build_thread(roots: list[dict], max_nodes: int) -> dict:
+    """ Nests each root's descendants under their parents in a single pass.
+
+        Descendants come level by level, so a parent is always placed before its children and
+        each root's replies are cut off level by level once `max_nodes` of them are placed.
+    """
+    nodes = {}
+    items = []
+    truncated = False
+
+    for root in roots:
+        descendants = root.pop('descendants', [])
+        nodes[root['_id']] = node = {**root, 'children': []}
+        items.append(node)
+        remaining = max_nodes
+
+        for descendant in descendants:
+            if (parent := nodes.get(descendant.get('parent_id'))) is None:
+                continue
+
+            if remaining <= 0:
+                truncated = True
+                break
+
+            nodes[descendant['_id']] = child = {**descendant, 'children': []}
+            parent['children'].append(child)
+            remaining -= 1
+
+    return {
+        'items': items,
+        'truncated': truncated,
+    }
+
+
+@router.get('/{id}/page/')
+async def retrieve_product_page(
+    id: PydanticObjectId, limit: Annotated[int, Query(ge=1, le=settings.PAGINATION_MAX_LIMIT)] = 20
+) -> ProductPage:
+    """ Returns everything a product page renders: the product and its newest root comments with
+        their authors and vote totals, from a single aggregation.
+
+        The comments' `next_cursor` continues with `GET /comment/?product_id={id}&is_reply=false`.
+    """
+    order_by = '-created_at'
+    comment_fields = {field: 1 for field in ProductPageComment.model_fields if field not in ('id', 'author')}
+    author_fields = {field: 1 for field in PublicUser.model_fields if field != 'id'}
+
+    pages = await get_read_collection(Product, ReadConcern('local')).aggregate(
+        [
+            {'$match': {'_id': id}},
+            {'$project': PRODUCT_FIELDS},
+            {
+                '$lookup': {
+                    'from': Comment.get_collection_name(),
+                    'localField': '_id',
+                    'foreignField': 'product_id',
+                    'pipeline': [
+                        {'$match': {'is_reply': False}},
+                        {'$sort': dict(keyset_sort(order_by))},
+                        {'$limit': limit + 1},
+                        {'$project': comment_fields},
+                        {
+                            '$lookup': {
+                                'from': UserInDB.get_collection_name(),
+                                'localField': 'user_id',
+                                'foreignField': '_id',
+                                'pipeline': [{'$project': author_fields}],
+                                'as': 'author',
+                            }
+                        },
+                        {'$set': {'author': {'$first': '$author'}}},
+                    ],
+                    'as': 'comments',
+                }
+            },
+        ]
+    ).to_list(1)
+
+    if not pages:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Product not found.')
+
+    comments = pages[0].pop('comments')
+
+    return ProductPage(product=Product.model_validate(pages[0]), comments=paginate(comments, limit, order_by))
+
+
+@router.get('/{id}/live/')
+async def live_product(id: PydanticObjectId, last_event_id: Annotated[str | None, Header()] = None):
+    """ Streams the product's activity as Server-Sent Events, in place of polling its comments.
+
+        Events are `comment` for new comments and replies, `comment_deleted`, and `tally` when
+        votes change a comment's counts.  Reconnecting with `Last-Event-ID` replays what was
+        missed; when that is no longer possible a `reset` event asks the client to reload.
+    """
+    if not await read_exists(Product, {'_id': id}, read_concern=ReadConcern('local')):
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Product not found.')
+
+    return StreamingResponse(
+        live_hub.stream(id, last_event_id),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'},
+    )
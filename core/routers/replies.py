@@ -2,50 +2,141 @@ from datetime import datetime, timezone
 from typing import Annotated, Literal
 
 from beanie.odm.fields import PydanticObjectId
-from beanie.operators import In
+from beanie.odm.operators.update.general import Inc
 from fastapi import (
     APIRouter,
+    Depends,
     HTTPException,
     Query,
+    Request,
+    Response,
     status,
 )
-from pydantic import BaseModel
+from motor.motor_asyncio import AsyncIOMotorClientSession
+from pydantic import BaseModel, Field
+from pymongo.read_concern import ReadConcern
 
-from core.models import Comment
+from core.cache import document_cache
+from core.db import (
+    read_exists,
+    read_many,
+    read_raw,
+    read_session,
+)
+from core.etag import (
+    bump,
+    comment_scopes,
+    conditional_response,
+    replies_scope,
+)
+from core.fieldsets import sparse_fields
+from core.live import live_hub
+from core.models import COMMENT_FIELDS, Comment, CommentCreate
+from core.pagination import (
+    Page,
+    keyset_filter,
+    keyset_sort,
+    paginate,
+)
+from core.ranking import resolve_order_by, store_rankings
+from core.responses import fast_response
+from core.settings import settings
 
 router = APIRouter(tags=['Replies'])
 
 
 class CommentQueryParams(BaseModel):
-    limit: int = 10
-    skip: int = 0
-    order_by: Literal['created_at', '-created_at', 'updated_at', '-updated_at'] = '-created_at'
+    limit: int = Field(10, ge=1, le=settings.PAGINATION_MAX_LIMIT)
+    cursor: str | None = None
+    order_by: Literal['created_at', '-created_at', 'updated_at', '-updated_at', 'top', 'hot'] = '-created_at'
 
 
 @router.get('/{parent_id}/')
-async def get_replies(parent_id: PydanticObjectId, query: Annotated[CommentQueryParams, Query()]):
-    if not (parent_comment := await Comment.find_one(Comment.id == parent_id)):
+async def get_replies(
+    parent_id: PydanticObjectId,
+    query: Annotated[CommentQueryParams, Query()],
+    fields: Annotated[dict[str, int] | None, Depends(sparse_fields(COMMENT_FIELDS))],
+    session: Annotated[AsyncIOMotorClientSession, Depends(read_session)],
+    request: Request,
+    response: Response,
+) -> Page[Comment]:
+    if (not_modified := await conditional_response(request, response, replies_scope(parent_id), session)) is not None:
+        return not_modified
+
+    query_params = {'parent_id': parent_id}
+    order_by = resolve_order_by(query.order_by)
+
+    if query.cursor is not None:
+        query_params = {'$and': [query_params, keyset_filter(order_by, query.cursor)]}
+
+    fast = fields is not None or settings.FAST_RESPONSES
+
+    if fast:
+        replies = await read_raw(
+            Comment,
+            query_params,
+            projection=COMMENT_FIELDS if fields is None else {**fields, order_by.lstrip('-'): 1},
+            sort=keyset_sort(order_by),
+            limit=query.limit + 1,
+            read_concern=ReadConcern('local'),
+            session=session,
+        )
+    else:
+        replies = await read_many(
+            Comment,
+            query_params,
+            sort=keyset_sort(order_by),
+            limit=query.limit + 1,
+            read_concern=ReadConcern('local'),
+            session=session,
+        )
+
+    # An empty first page is the only case where the parent has to be looked up.
+    if not replies and query.cursor is None and not await read_exists(
+        Comment, {'_id': parent_id}, read_concern=ReadConcern('local'), session=session
+    ):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parent Comment not found.')
 
-    return (
-        await Comment.find(In(Comment.id, parent_comment.replies))
-        .skip(query.skip)
-        .limit(query.limit)
-        .sort(query.order_by)
-        .to_list()
-    )
+    page = paginate(replies, query.limit, order_by)
+
+    if fast:
+        return fast_response({'items': page.items, 'next_cursor': page.next_cursor}, response)
+
+    return page
 
 
 @router.post('/{parent_id}/', status_code=status.HTTP_201_CREATED)
-async def create_reply(parent_id: PydanticObjectId, comment: Comment) -> Comment:
-    if not (parent_comment := await Comment.find_one(Comment.id == parent_id)):
+async def create_reply(parent_id: PydanticObjectId, data: CommentCreate) -> Comment:
+    collection = Comment.get_motor_collection()
+    parent = await collection.find_one_and_update(
+        {'_id': parent_id, 'product_id': data.product_id},
+        {'$inc': {'reply_count': 1}, '$set': {'updated_at': datetime.now(tz=timezone.utc)}},
+        projection={'product_id': 1, 'parent_id': 1},
+    )
+
+    if parent is None:
+        if await collection.find_one({'_id': parent_id}, {'_id': 1}) is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Parent Comment belongs to another Product.',
+            )
+
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Parent Comment not found.')
 
-    await comment.save()
+    comment = Comment(**data.model_dump(), parent_id=parent_id, is_reply=True)
+
+    try:
+        await comment.insert()
+
+    except Exception:
+        await Comment.find_one(Comment.id == parent_id).update(Inc({Comment.reply_count: -1}))
+        raise
 
-    parent_comment.replies.append(comment.id)
-    parent_comment.updated_at = datetime.now(tz=timezone.utc)
+    finally:
+        await document_cache.invalidate('Comment', parent_id)
 
-    await parent_comment.save()
+    await store_rankings(comment)
+    await bump(*comment_scopes(comment), *comment_scopes(parent))
+    await live_hub.publish(comment.product_id, 'comment', comment.model_dump(by_alias=True, exclude={'revision_id'}))
 
     return comment
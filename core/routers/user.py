@@ -1,32 +1,104 @@
 from http import HTTPStatus
-from typing import Iterable
+from typing import Annotated, Iterable
 
 from beanie.odm.fields import PydanticObjectId
-from fastapi import APIRouter, HTTPException
+from bson.errors import InvalidId
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+)
+from pymongo.read_concern import ReadConcern
 
-from core.models import User, UserInDB
-from core.routers.auth.utils import pwd_context
+from core.cache import document_cache
+from core.db import (
+    read_many,
+    read_one,
+    read_raw,
+    read_raw_one,
+)
+from core.fieldsets import sparse_fields
+from core.loaders import user_loader
+from core.models import (
+    USER_FIELDS,
+    PublicUser,
+    User,
+    UserInDB,
+)
+from core.responses import fast_response
+from core.routers.auth.passwords import password_hasher
+from core.routers.auth.registered_emails import registered_emails
+from core.routers.auth.revocation import revocation_list
+from core.settings import settings
 
 router = APIRouter(tags=['Users'])
 
 
 @router.get('/')
-async def list_users() -> Iterable[User]:
-    return await UserInDB.find(projection_model=User).to_list()
+async def list_users(fields: Annotated[dict[str, int] | None, Depends(sparse_fields(USER_FIELDS))]) -> Iterable[User]:
+    if fields is not None or settings.FAST_RESPONSES:
+        users = await read_raw(UserInDB, {}, projection=fields or USER_FIELDS, read_concern=ReadConcern('local'))
+        return fast_response(users)
+
+    return await read_many(UserInDB, {}, projection_model=User, read_concern=ReadConcern('local'))
 
 
 @router.post('/', status_code=HTTPStatus.CREATED)
 async def create_user(user: UserInDB) -> User:
-    user.password = pwd_context.hash(user.password)
+    user.password = await password_hasher.hash(user.password)
     await user.insert()
-    user = await UserInDB.find_one(UserInDB.id == user.id, projection_model=User)
+    registered_emails.add(user.email)
 
-    return user
+    return User.from_db(user)
+
+
+@router.get('/batch/')
+async def list_users_by_id(ids: Annotated[list[str], Query()]) -> list[PublicUser]:
+    """ Returns the public profiles of the given users, in the order requested.
+
+        Ids can be repeated (`?ids=a&ids=b`) or comma separated (`?ids=a,b`); unknown ids are skipped.
+        Lookups from concurrent requests are merged into a single query.
+    """
+    try:
+        ids = list(dict.fromkeys(PydanticObjectId(id) for value in ids for id in value.split(',') if id))
+
+    except InvalidId:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail='Invalid user id.') from None
+
+    if len(ids) > settings.PAGINATION_MAX_LIMIT:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f'At most {settings.PAGINATION_MAX_LIMIT} users can be requested at once.',
+        )
+
+    return [user for user in await user_loader.load_many(ids) if user is not None]
 
 
 @router.get('/{id}/')
-async def retrieve_user(id: PydanticObjectId) -> User:
-    if (user := await UserInDB.find_one(UserInDB.id == id, projection_model=User)) is None:
+async def retrieve_user(
+    id: PydanticObjectId, fields: Annotated[dict[str, int] | None, Depends(sparse_fields(USER_FIELDS))]
+) -> User:
+    if fields is not None:
+        user = await read_raw_one(UserInDB, {'_id': id}, projection=fields, read_concern=ReadConcern('majority'))
+        if user is None:
+            raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='User not found.')
+
+        return fast_response(user)
+
+    user = await document_cache.get_or_load(
+        'User',
+        id,
+        lambda: read_one(
+            UserInDB,
+            {'_id': id},
+            projection_model=User,
+            read_concern=ReadConcern('majority'),
+            primary=True,
+        ),
+    )
+
+    if user is None:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='User not found.')
 
     return user
@@ -38,3 +110,6 @@ async def delete_user(id: PydanticObjectId):
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='User not found.')
 
     await user.delete()
+    await document_cache.invalidate('User', id)
+    await revocation_list.revoke_user(user.id)
+    registered_emails.remove(user.email)
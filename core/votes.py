@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from beanie.odm.fields import PydanticObjectId
+from bson import ObjectId
+from pymongo import (
+    ReturnDocument,
+    UpdateOne,
+)
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from core import metrics
+from core.cache import document_cache
+from core.constants import CommentAction
+from core.etag import bump, comment_scopes
+from core.live import live_hub
+from core.models import Comment, CommentVote
+from core.ranking import tally_update
+from core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TALLY_FIELDS = {
+    CommentAction.UPVOTE: 'upvotes',
+    CommentAction.DOWNVOTE: 'downvotes',
+}
+
+# The code of the write error a vote gets when a concurrent upsert inserted the same (comment_id, user_id).
+DUPLICATE_KEY_ERROR = 11000
+
+# The fields a vote changes, published to live listeners as a `tally` event.
+RANKED_TALLY_FIELDS = ('upvotes', 'downvotes', 'score', 'top_score', 'hot_score')
+
+
+def tally_delta(before: CommentAction | None, after: CommentAction | None) -> dict[str, int]:
+    """ Returns the change to a comment's tallies when a vote goes from `before` to `after`.
+
+        `None` stands for "no vote", so a new vote has no `before` and a removed one no `after`.
+    """
+    delta = {
+        'upvotes': 0,
+        'downvotes': 0,
+    }
+
+    if before is not None:
+        delta[TALLY_FIELDS[CommentAction(before)]] -= 1
+
+    if after is not None:
+        delta[TALLY_FIELDS[CommentAction(after)]] += 1
+
+    delta['score'] = delta['upvotes'] - delta['downvotes']
+
+    return delta
+
+
+async def publish_tally(comment: dict):
+    await live_hub.publish(
+        comment['product_id'],
+        'tally',
+        {field: comment.get(field) for field in ('_id', 'parent_id', *RANKED_TALLY_FIELDS)},
+    )
+
+
+async def update_tally(comment_id: PydanticObjectId, delta: dict[str, int]):
+    if not any(delta.values()):
+        return
+
+    comment = await Comment.get_motor_collection().find_one_and_update(
+        {'_id': comment_id},
+        tally_update(delta),
+        projection={'product_id': 1, 'parent_id': 1, **dict.fromkeys(RANKED_TALLY_FIELDS, 1)},
+        return_document=ReturnDocument.AFTER,
+    )
+    await document_cache.invalidate('Comment', comment_id)
+
+    if comment is not None:
+        await bump(*comment_scopes(comment))
+        await publish_tally(comment)
+
+
+async def cast_vote(comment_id: PydanticObjectId, user_id: PydanticObjectId, action: CommentAction) -> CommentVote:
+    """ Records the user's vote on a comment, replacing any vote they already cast.
+
+        The vote is upserted on the unique (comment_id, user_id) index, so casting the same vote
+        twice is a no-op.  The previous action is read back from the same round trip to work out
+        the tally change.
+    """
+    vote_id = ObjectId()
+
+    for attempt in range(2):
+        try:
+            previous = await CommentVote.get_motor_collection().find_one_and_update(
+                {'comment_id': comment_id, 'user_id': user_id},
+                {'$set': {'action': action.value}, '$setOnInsert': {'_id': vote_id}},
+                projection={'action': 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            break
+
+        except DuplicateKeyError:
+            # Two concurrent first votes raced on the upsert; the retry updates the winner's vote.
+            if attempt:
+                raise
+
+    await update_tally(comment_id, tally_delta(previous and previous['action'], action))
+
+    return CommentVote(
+        id=previous['_id'] if previous else vote_id,
+        action=action,
+        comment_id=comment_id,
+        user_id=user_id,
+    )
+
+
+async def remove_vote(id: PydanticObjectId) -> CommentVote | None:
+    if (document := await CommentVote.get_motor_collection().find_one_and_delete({'_id': id})) is None:
+        return None
+
+    vote = CommentVote.model_validate(document)
+    await update_tally(vote.comment_id, tally_delta(vote.action, None))
+
+    return vote
+
+
+async def apply_votes(
+    votes: dict[tuple[PydanticObjectId, PydanticObjectId], CommentAction]
+) -> dict[tuple[PydanticObjectId, PydanticObjectId], dict]:
+    """ Writes a batch of votes keyed by (comment_id, user_id) and updates the tallies they affect.
+
+        The previous actions are read in one query and the votes written with one unordered
+        `bulk_write`, then the tally changes of the votes which were written with another.  Returns
+        the write errors of the votes which were not, keyed like `votes`.
+
+        Any other error leaves the batch partly written, with the tallies of the written votes
+        unchanged until `core.jobs.reconcile_vote_tallies` runs.
+    """
+    if not votes:
+        return {}
+
+    users_by_comment = defaultdict(list)
+    for comment_id, user_id in votes:
+        users_by_comment[comment_id].append(user_id)
+
+    previous = {
+        (vote['comment_id'], vote['user_id']): vote['action']
+        async for vote in CommentVote.get_motor_collection().find(
+            {
+                '$or': [
+                    {'comment_id': comment_id, 'user_id': {'$in': user_ids}}
+                    for comment_id, user_ids in users_by_comment.items()
+                ]
+            },
+            {'_id': 0, 'comment_id': 1, 'user_id': 1, 'action': 1},
+        )
+    }
+
+    keys = list(votes)
+    failed = {}
+    try:
+        await CommentVote.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {'comment_id': comment_id, 'user_id': user_id},
+                    {'$set': {'action': CommentAction(votes[comment_id, user_id]).value}},
+                    upsert=True,
+                ) for comment_id, user_id in keys
+            ],
+            ordered=False,
+        )
+
+    except BulkWriteError as exc:
+        failed = {keys[error['index']]: error for error in exc.details.get('writeErrors', [])}
+
+    deltas = defaultdict(lambda: defaultdict(int))
+    for key in keys:
+        if key not in failed:
+            for field, change in tally_delta(previous.get(key), votes[key]).items():
+                deltas[key[0]][field] += change
+
+    changed = [comment_id for comment_id, delta in deltas.items() if any(delta.values())]
+    if changed:
+        await Comment.get_motor_collection().bulk_write(
+            [UpdateOne({'_id': comment_id}, tally_update(deltas[comment_id])) for comment_id in changed],
+            ordered=False,
+        )
+
+    await document_cache.invalidate('Comment', *deltas)
+
+    if changed:
+        comments = await Comment.get_motor_collection().find(
+            {'_id': {'$in': changed}},
+            {'product_id': 1, 'parent_id': 1, **dict.fromkeys(RANKED_TALLY_FIELDS, 1)},
+        ).to_list(None)
+        await bump(*[scope for comment in comments for scope in comment_scopes(comment)])
+
+        for comment in comments:
+            await publish_tally(comment)
+
+    return failed
+
+
+class VoteBufferFull(Exception):
+    pass
+
+
+class VoteBuffer:
+    """ Collects votes in memory and writes them behind the request in batches.
+
+        Repeated votes by the same user on the same comment are coalesced, so only the last one
+        is written.  A flush happens once `flush_size` votes are pending or every `flush_interval`
+        seconds, whichever comes first.  When `max_size` votes are pending, submitters wait for a
+        flush to make room and give up with `VoteBufferFull` after `submit_timeout` seconds.
+
+        A failed flush puts its votes back, behind any submitted since, and the next one waits
+        twice as long as the last, from `flush_interval` up to `max_retry_delay` seconds.  Votes
+        the database rejects one by one are dropped, except those which lost a race to insert the
+        same vote and only need the retry to update it.
+
+        Tallies are computed against the votes read at flush time, so concurrent flushes from
+        several workers can drift them; `core.jobs.reconcile_vote_tallies` corrects that.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        submit_timeout: float,
+        max_retry_delay: float,
+    ):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.submit_timeout = submit_timeout
+        self.max_retry_delay = max_retry_delay
+
+        self._pending: dict[tuple[PydanticObjectId, PydanticObjectId], CommentAction] = {}
+        self._retry_delay = 0.0
+        self._flush_requested = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._closing.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """ Stops the background flushes and drains whatever is still pending.
+
+            Draining gives up after one failed flush, losing the votes left.
+        """
+        if self._task is not None:
+            self._closing.set()
+            self._flush_requested.set()
+            await self._task
+            self._task = None
+
+        while self._pending:
+            if not await self.flush():
+                logger.error(f'Dropped {len(self._pending)} buffered votes on shutdown.')
+                self._pending = {}
+
+    async def submit(self, comment_id: PydanticObjectId, user_id: PydanticObjectId, action: CommentAction):
+        key = (comment_id, user_id)
+        deadline = time.monotonic() + self.submit_timeout
+
+        while key not in self._pending and len(self._pending) >= self.max_size:
+            self._flush_requested.set()
+            self._flushed.clear()
+
+            try:
+                await asyncio.wait_for(self._flushed.wait(), timeout=max(deadline - time.monotonic(), 0))
+
+            except asyncio.TimeoutError:
+                metrics.VOTE_BUFFER_REJECTED.inc()
+                raise VoteBufferFull from None
+
+        self._pending[key] = action
+        metrics.VOTE_BUFFER_PENDING.set(len(self._pending))
+
+        if len(self._pending) >= self.flush_size:
+            self._flush_requested.set()
+
+    async def flush(self) -> bool:
+        """ Writes the pending votes and returns whether the flush succeeded. """
+        votes, self._pending = self._pending, {}
+
+        if not votes:
+            return True
+
+        started = time.perf_counter()
+        try:
+            failed = await apply_votes(votes)
+
+        except Exception:
+            metrics.VOTE_BUFFER_FLUSH_FAILURES.inc()
+            self._retry_delay = min(max(self._retry_delay * 2, self.flush_interval), self.max_retry_delay)
+            logger.exception(f'Could not flush {len(votes)} buffered votes, retrying in {self._retry_delay:.2f}s.')
+            self._requeue(votes)
+            return False
+
+        finally:
+            metrics.VOTE_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            self._flushed.set()
+
+        self._retry_delay = 0.0
+        metrics.VOTE_BUFFER_FLUSH_SIZE.observe(len(votes) - len(failed))
+
+        if raced := {key: votes[key] for key, error in failed.items() if error['code'] == DUPLICATE_KEY_ERROR}:
+            self._requeue(raced)
+
+        if rejected := [error['errmsg'] for error in failed.values() if error['code'] != DUPLICATE_KEY_ERROR]:
+            logger.error(f'Dropped {len(rejected)} buffered votes the database rejected, the first with: {rejected[0]}')
+
+        return True
+
+    def _requeue(self, votes: dict[tuple[PydanticObjectId, PydanticObjectId], CommentAction]):
+        # Votes submitted since the flush started are newer, so they win.
+        self._pending = {**votes, **self._pending}
+        metrics.VOTE_BUFFER_PENDING.set(len(self._pending))
+
+    async def _run(self):
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+
+            except asyncio.TimeoutError:
+                pass
+
+            self._flush_requested.clear()
+
+            if not await self.flush():
+                # Back off before retrying, even if the buffer fills up meanwhile.
+                try:
+                    await asyncio.wait_for(self._closing.wait(), timeout=self._retry_delay)
+
+                except asyncio.TimeoutError:
+                    pass
+
+
+vote_buffer = VoteBuffer(
+    max_size=settings.VOTE_BUFFER_MAX_SIZE,
+    flush_size=settings.VOTE_BUFFER_FLUSH_SIZE,
+    flush_interval=settings.VOTE_BUFFER_FLUSH_INTERVAL_SECONDS,
+    submit_timeout=settings.VOTE_BUFFER_SUBMIT_TIMEOUT_SECONDS,
+    max_retry_delay=settings.VOTE_BUFFER_MAX_RETRY_DELAY_SECONDS,
+)
@@ -0,0 +1,100 @@
+""" Moves the `Comment.replies` arrays into a `parent_id` reference on each reply.
+
+    Parents are processed in batches and their `replies` array is only removed once every
+    reply in it points back at them, so the migration can be interrupted and re-run.  Run it
+    without a transaction to get that behaviour:
+
+        beanie migrate -uri $MONGODB_URL -db vst_realm -p migrations --no-use-transaction
+"""
+from beanie import Document, free_fall_migration
+from pymongo import UpdateMany, UpdateOne
+
+BATCH_SIZE = 500
+
+
+class Comment(Document):
+
+    class Settings:
+        name = 'Comment'
+
+
+class Forward:
+
+    @free_fall_migration(document_models=[Comment])
+    async def move_replies_to_parent_id(self, session):
+        collection = Comment.get_motor_collection()
+
+        while parents := await collection.find(
+            {'replies': {'$exists': True}},
+            {'replies': 1},
+            limit=BATCH_SIZE,
+            session=session,
+        ).to_list(None):
+            reply_ids = [reply_id for parent in parents for reply_id in parent['replies']]
+            existing_ids = {
+                reply['_id']
+                for reply in await collection.find(
+                    {'_id': {'$in': reply_ids}},
+                    {'_id': 1},
+                    session=session,
+                ).to_list(None)
+            }
+
+            reply_updates = [
+                UpdateMany({'_id': {'$in': parent['replies']}}, {'$set': {'parent_id': parent['_id'], 'is_reply': True}})
+                for parent in parents
+                if parent['replies']
+            ]
+            if reply_updates:
+                await collection.bulk_write(reply_updates, ordered=False, session=session)
+
+            await collection.bulk_write(
+                [
+                    UpdateOne(
+                        {'_id': parent['_id']},
+                        {
+                            '$set': {'reply_count': len(existing_ids.intersection(parent['replies']))},
+                            '$unset': {'replies': ''},
+                        },
+                    ) for parent in parents
+                ],
+                ordered=False,
+                session=session,
+            )
+
+        await collection.update_many(
+            {'reply_count': {'$exists': False}},
+            {'$set': {'reply_count': 0}},
+            session=session,
+        )
+
+
+class Backward:
+
+    @free_fall_migration(document_models=[Comment])
+    async def move_parent_id_to_replies(self, session):
+        collection = Comment.get_motor_collection()
+
+        await collection.update_many({}, {'$set': {'replies': []}}, session=session)
+
+        groups = collection.aggregate(
+            [
+                {'$match': {'parent_id': {'$ne': None}}},
+                {'$sort': {'created_at': 1, '_id': 1}},
+                {'$group': {'_id': '$parent_id', 'replies': {'$push': '$_id'}}},
+            ],
+            session=session,
+        )
+
+        batch = []
+        async for group in groups:
+            batch.append(UpdateOne({'_id': group['_id']}, {'$set': {'replies': group['replies']}}))
+
+            if len(batch) >= BATCH_SIZE:
+                await collection.bulk_write(batch, ordered=False, session=session)
+                batch = []
+
+        if batch:
+            await collection.bulk_write(batch, ordered=False, session=session)
+
+        await collection.update_many({}, {'$unset': {'parent_id': '', 'reply_count': ''}}, session=session)
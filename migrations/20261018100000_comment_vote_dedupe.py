@@ -0,0 +1,99 @@
+""" Collapses duplicate votes so the unique `comment_id__user_id__unique_together` index can be built.
+
+    Only the latest of a user's votes on a comment is kept, and the tallies of every voted comment
+    are then recomputed from the votes left.  Run it before starting the version which
+    creates the index, without a transaction, as it can be interrupted and re-run:
+
+        beanie migrate -uri $MONGODB_URL -db vst_realm -p migrations --no-use-transaction
+
+    The deleted votes cannot be restored, so there is no backward migration.
+"""
+from beanie import Document, free_fall_migration
+from pymongo import UpdateOne
+
+from core.ranking import ranking_stages
+
+BATCH_SIZE = 500
+
+
+class Comment(Document):
+
+    class Settings:
+        name = 'Comment'
+
+
+class CommentVote(Document):
+
+    class Settings:
+        name = 'CommentVote'
+
+
+def _count(action: str) -> dict:
+    return {'$sum': {'$cond': [{'$eq': ['$action', action]}, 1, 0]}}
+
+
+class Forward:
+
+    @free_fall_migration(document_models=[Comment, CommentVote])
+    async def collapse_duplicate_votes(self, session):
+        votes = CommentVote.get_motor_collection()
+
+        duplicates = await votes.aggregate(
+            [
+                {'$sort': {'_id': -1}},
+                {
+                    '$group': {
+                        '_id': {'comment_id': '$comment_id', 'user_id': '$user_id'},
+                        'ids': {'$push': '$_id'},
+                    }
+                },
+                {'$match': {'ids.1': {'$exists': True}}},
+            ],
+            allowDiskUse=True,
+            session=session,
+        ).to_list(None)
+
+        stale_ids = [id for duplicate in duplicates for id in duplicate['ids'][1:]]
+        for start in range(0, len(stale_ids), BATCH_SIZE):
+            await votes.delete_many({'_id': {'$in': stale_ids[start:start + BATCH_SIZE]}}, session=session)
+
+        # Every voted comment gets its tallies from the votes left, not only those which had duplicates:
+        # comments written before the tallies were kept have none, and votes would count up from zero.
+        tallies = votes.aggregate(
+            [
+                {
+                    '$group': {
+                        '_id': '$comment_id',
+                        'upvotes': _count('upvote'),
+                        'downvotes': _count('downvote'),
+                    }
+                },
+            ],
+            allowDiskUse=True,
+            session=session,
+        )
+
+        batch = []
+        async for tally in tallies:
+            batch.append(
+                UpdateOne(
+                    {'_id': tally['_id']},
+                    [
+                        {
+                            '$set': {
+                                'upvotes': tally['upvotes'],
+                                'downvotes': tally['downvotes'],
+                                'score': tally['upvotes'] - tally['downvotes'],
+                            }
+                        },
+                        *ranking_stages(),
+                    ],
+                )
+            )
+
+            if len(batch) >= BATCH_SIZE:
+                await Comment.get_motor_collection().bulk_write(batch, ordered=False, session=session)
+                batch = []
+
+        if batch:
+            await Comment.get_motor_collection().bulk_write(batch, ordered=False, session=session)
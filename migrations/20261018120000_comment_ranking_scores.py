@@ -0,0 +1,57 @@
+""" Stores the `top_score` and `hot_score` rankings on every comment.
+
+    Comments are processed in batches of those still without a `top_score`, so the migration can
+    be interrupted and re-run.  Run it without a transaction to get that behaviour:
+
+        beanie migrate -uri $MONGODB_URL -db vst_realm -p migrations --no-use-transaction
+"""
+from beanie import Document, free_fall_migration
+
+from core.ranking import ranking_stages
+
+BATCH_SIZE = 500
+
+
+class Comment(Document):
+
+    class Settings:
+        name = 'Comment'
+
+
+class Forward:
+
+    @free_fall_migration(document_models=[Comment])
+    async def compute_ranking_scores(self, session):
+        collection = Comment.get_motor_collection()
+
+        while comments := await collection.find(
+            {'top_score': {'$exists': False}},
+            {'_id': 1},
+            limit=BATCH_SIZE,
+            session=session,
+        ).to_list(None):
+            await collection.update_many(
+                {'_id': {'$in': [comment['_id'] for comment in comments]}},
+                [
+                    {
+                        '$set': {
+                            'upvotes': {'$ifNull': ['$upvotes', 0]},
+                            'downvotes': {'$ifNull': ['$downvotes', 0]},
+                            'score': {'$ifNull': ['$score', 0]},
+                        }
+                    },
+                    *ranking_stages(),
+                ],
+                session=session,
+            )
+
+
+class Backward:
+
+    @free_fall_migration(document_models=[Comment])
+    async def remove_ranking_scores(self, session):
+        await Comment.get_motor_collection().update_many(
+            {},
+            {'$unset': {'top_score': '', 'hot_score': ''}},
+            session=session,
+        )
@@ -0,0 +1,71 @@
+""" Merges products sharing an `external_id` so the unique `external_id` index can be built.
+
+    The oldest product of each group is kept: the comments of the others are moved to it and
+    their affiliate links added to its own, then the others are deleted.  Run it before starting
+    the version which creates the index, without a transaction, as it can be interrupted and re-run:
+
+        beanie migrate -uri $MONGODB_URL -db vst_realm -p migrations --no-use-transaction
+
+    Merged products cannot be split again, so there is no backward migration.
+"""
+from beanie import Document, free_fall_migration
+
+BATCH_SIZE = 500
+
+
+class Comment(Document):
+
+    class Settings:
+        name = 'Comment'
+
+
+class Product(Document):
+
+    class Settings:
+        name = 'Product'
+
+
+class Forward:
+
+    @free_fall_migration(document_models=[Comment, Product])
+    async def merge_duplicate_products(self, session):
+        products = Product.get_motor_collection()
+
+        duplicates = await products.aggregate(
+            [
+                {'$sort': {'_id': 1}},
+                {
+                    '$group': {
+                        '_id': '$external_id',
+                        'ids': {'$push': '$_id'},
+                        'affiliate_links': {'$push': {'$ifNull': ['$affiliate_links', []]}},
+                    }
+                },
+                {'$match': {'ids.1': {'$exists': True}}},
+            ],
+            allowDiskUse=True,
+            session=session,
+        ).to_list(None)
+
+        for duplicate in duplicates:
+            kept_id, stale_ids = duplicate['ids'][0], duplicate['ids'][1:]
+
+            await Comment.get_motor_collection().update_many(
+                {'product_id': {'$in': stale_ids}},
+                {'$set': {'product_id': kept_id}},
+                session=session,
+            )
+            await products.update_one(
+                {'_id': kept_id},
+                {
+                    '$set': {
+                        'affiliate_links': list(
+                            dict.fromkeys(link for links in duplicate['affiliate_links'] for link in links)
+                        )
+                    }
+                },
+                session=session,
+            )
+
+            for start in range(0, len(stale_ids), BATCH_SIZE):
+                await products.delete_many({'_id': {'$in': stale_ids[start:start + BATCH_SIZE]}}, session=session)
@@ -0,0 +1,65 @@
+import os
+
+import httpx
+import pytest
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from core import db
+from core.db import DOCUMENT_MODELS, read_session
+from core.main import app
+from core.settings import settings
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+@pytest.fixture
+async def database():
+    """ Initializes the models on a fresh in-memory mongomock database, shared by both clients. """
+    from mongomock_motor import AsyncMongoMockClient
+
+    db._write_client = db._read_client = AsyncMongoMockClient()
+    await init_beanie(database=db._write_client[settings.MONGODB_DATABASE], document_models=DOCUMENT_MODELS)
+
+    # mongomock has no sessions; with a single in-memory copy, reads are consistent without them.
+    app.dependency_overrides[read_session] = lambda: None
+
+    try:
+        yield db._write_client[settings.MONGODB_DATABASE]
+
+    finally:
+        app.dependency_overrides.pop(read_session, None)
+        db._write_client = db._read_client = None
+
+
+@pytest.fixture
+async def mongodb():
+    """ Like `database`, but on the MongoDB server at `TEST_MONGODB_URL`, for the tests mongomock cannot run.
+
+        The `<MONGODB_DATABASE>_test` database is dropped before and after each test.
+    """
+    if (url := os.environ.get('TEST_MONGODB_URL')) is None:
+        pytest.skip('TEST_MONGODB_URL is not set.')
+
+    name = f'{settings.MONGODB_DATABASE}_test'
+    database, settings.MONGODB_DATABASE = settings.MONGODB_DATABASE, name
+    db._write_client = db._read_client = AsyncIOMotorClient(url, **db.get_client_options())
+    await db._write_client.drop_database(name)
+    await init_beanie(database=db._write_client[name], document_models=DOCUMENT_MODELS)
+
+    try:
+        yield db._write_client[name]
+
+    finally:
+        await db._write_client.drop_database(name)
+        db.close_db()
+        settings.MONGODB_DATABASE = database
+
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+        yield client
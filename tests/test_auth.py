@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+
+from core import metrics
+from core.models import Account, User, UserInDB
+from core.routers.auth.passwords import pwd_context
+from core.routers.auth.utils import create_access_token
+from core.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_user(name: str, password: str = '') -> User:
+    user = await UserInDB(
+        username=name,
+        given_name=name.title(),
+        family_name='Doe',
+        email=f'{name}@example.com',
+        password=pwd_context.hash(password) if password else '',
+    ).insert()
+
+    return User.from_db(user)
+
+
+def bearer(token: str) -> dict[str, str]:
+    return {'Authorization': f'Bearer {token}'}
+
+
+async def test_logout_revokes_only_the_token_used(database, client):
+    user = await create_user('jane')
+    token, _ = create_access_token({'sub': user.email}, user=user)
+    other, _ = create_access_token({'sub': user.email}, user=user)
+
+    assert (await client.post('/auth/logout/', headers=bearer(token))).status_code == 204
+
+    assert (await client.get('/auth/user/', headers=bearer(token))).status_code == 401
+    assert (await client.get('/auth/user/', headers=bearer(other))).status_code == 200
+
+
+async def test_logout_without_jti_revokes_the_users_tokens(database, client):
+    user = await create_user('john')
+    issued_at = datetime.now(tz=timezone.utc) - timedelta(minutes=1)
+    token = jwt.encode(
+        {'sub': user.email, 'iat': issued_at, 'exp': issued_at + timedelta(hours=1)},
+        settings.JWT_SECRET,
+        algorithm=settings.JWT_ALGORITHM,
+    )
+
+    assert (await client.get('/auth/user/', headers=bearer(token))).status_code == 200
+    assert (await client.post('/auth/logout/', headers=bearer(token))).status_code == 204
+    assert (await client.get('/auth/user/', headers=bearer(token))).status_code == 401
+
+
+async def test_logout_with_an_invalid_token(database, client):
+    assert (await client.post('/auth/logout/', headers=bearer('not-a-token'))).status_code == 401
+
+
+async def log_in(client, email: str) -> str:
+    response = await client.post('/auth/local/login/', data={'username': email, 'password': 'secret'})
+    assert response.status_code == 200
+
+    return response.json()['access_token']
+
+
+async def test_login_upserts_one_account(database, client):
+    user = await create_user('ann', password='secret')
+
+    await log_in(client, user.email)
+    token = await log_in(client, user.email)
+
+    accounts = await Account.find(Account.user_id == user.id).to_list()
+    assert len(accounts) == 1
+    assert accounts[0].access_token == token
+    assert accounts[0].provider == settings.LOCAL_PROVIDER_NAME
+
+
+def login_commands() -> dict[str, float]:
+    return {
+        sample.labels['command']: sample.value
+        for metric in metrics.MONGODB_COMMANDS.collect()
+        for sample in metric.samples
+        if sample.name.endswith('_total') and sample.labels['route'] == '/auth/local/login/'
+    }
+
+
+async def test_login_round_trips(mongodb, client):
+    # mongomock sends no commands to count, so this needs a real server.
+    user = await create_user('max', password='secret')
+
+    for _ in range(2):
+        before = login_commands()
+        await log_in(client, user.email)
+        sent = {command: count - before.get(command, 0) for command, count in login_commands().items()}
+
+        assert {command: count for command, count in sent.items() if count} == {'find': 1, 'update': 1}
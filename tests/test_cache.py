@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from core import db
+from core.cache import (
+    MISSING,
+    DocumentCache,
+    MemoryCacheBackend,
+    document_cache,
+)
+from core.models import Comment
+from core.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+
+def make_cache() -> DocumentCache:
+    return DocumentCache(MemoryCacheBackend(max_entries=2), ttls={})
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = make_cache()
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return {'_id': 1}
+
+    results = await asyncio.gather(*[cache.get_or_load('Comment', 1, load) for _ in range(5)])
+
+    assert loads == [1]
+    assert all(result == {'_id': 1} for result in results)
+
+
+async def test_value_loaded_during_a_write_is_not_kept():
+    cache = make_cache()
+
+    async def load():
+        await cache.invalidate('Comment', 1)
+        return 'before the write'
+
+    assert await cache.get_or_load('Comment', 1, load) == 'before the write'
+    assert await cache.get_or_load('Comment', 1, lambda: asyncio.sleep(0, 'after the write')) == 'after the write'
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = make_cache()
+
+    for id in (1, 2, 1, 3):
+        await cache.get_or_load('Comment', id, lambda: asyncio.sleep(0, 'cached'))
+
+    assert await cache.backend.get('Comment:1') == 'cached'
+    assert await cache.backend.get('Comment:3') == 'cached'
+    assert await cache.backend.get('Comment:2') is MISSING
+
+
+async def test_retrieve_fills_the_cache_from_the_primary(database, client, monkeypatch):
+    # The read client stands for a secondary which has not replicated the edit yet.
+    monkeypatch.setattr(document_cache, 'enabled', True)
+    monkeypatch.setattr(db, '_read_client', AsyncMongoMockClient())
+
+    comment = await Comment(message='edited', user_id=ObjectId(), product_id=ObjectId()).insert()
+    await db._read_client[settings.MONGODB_DATABASE]['Comment'].insert_one(
+        {**comment.model_dump(by_alias=True, exclude={'revision_id'}), 'message': 'original'}
+    )
+
+    try:
+        for _ in range(2):
+            response = await client.get(f'/comment/{comment.id}/')
+            assert response.json()['message'] == 'edited'
+
+    finally:
+        await document_cache.invalidate('Comment', comment.id)
@@ -0,0 +1,85 @@
+import pytest
+from bson import ObjectId
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_comment(client, product_id: ObjectId, **fields):
+    response = await client.post(
+        '/comment/',
+        json={
+            'message': 'comment',
+            'user_id': str(ObjectId()),
+            'product_id': str(product_id),
+            **fields
+        },
+    )
+    assert response.status_code == 201
+
+    return response.json()
+
+
+async def create_reply(client, parent: dict):
+    response = await client.post(
+        f'/replies/{parent["_id"]}/',
+        json={
+            'message': 'reply',
+            'user_id': str(ObjectId()),
+            'product_id': parent['product_id']
+        },
+    )
+    assert response.status_code == 201
+
+    return response.json()
+
+
+async def check_listing(client, url: str, params: dict, write):
+    first = await client.get(url, params=params)
+    etag = first.headers['etag']
+
+    unchanged = await client.get(url, params=params, headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers['etag'] == etag
+
+    await write()
+
+    changed = await client.get(url, params=params, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+
+
+async def test_product_comments_etag(database, client):
+    product_id = ObjectId()
+    await create_comment(client, product_id)
+
+    await check_listing(client, '/comment/', {'product_id': str(product_id)}, lambda: create_comment(client, product_id))
+
+
+async def test_replies_etag(database, client):
+    product_id = ObjectId()
+    parent = await create_comment(client, product_id)
+
+    await check_listing(
+        client,
+        f'/replies/{parent["_id"]}/',
+        {},
+        lambda: create_reply(client, parent),
+    )
+
+
+async def test_etag_depends_on_the_query(database, client):
+    product_id = ObjectId()
+    await create_comment(client, product_id)
+
+    first = await client.get('/comment/', params={'product_id': str(product_id), 'limit': 1})
+    second = await client.get('/comment/', params={'product_id': str(product_id), 'limit': 2})
+
+    assert first.headers['etag'] != second.headers['etag']
+
+
+async def test_listing_reads_in_a_causally_consistent_session(mongodb, client):
+    # mongomock has no sessions, so this is the only test running the listings in one.
+    product_id = ObjectId()
+    await create_comment(client, product_id)
+
+    await check_listing(client, '/comment/', {'product_id': str(product_id)}, lambda: create_comment(client, product_id))
@@ -0,0 +1,109 @@
+import json
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from core.models import Comment, UserInDB
+from core.routers.export import export_documents
+from core.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+EXPORTED_COMMENTS = 1_000_000
+
+
+def comment(id: ObjectId) -> dict:
+    return {
+        '_id': id,
+        'message': 'comment',
+        'user_id': ObjectId(),
+        'product_id': ObjectId(),
+        'created_at': id.generation_time,
+        'is_reply': False,
+        'parent_id': None,
+        'reply_count': 0,
+        'upvotes': 0,
+        'downvotes': 0,
+        'score': 0,
+    }
+
+
+def lines(response) -> list[dict]:
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+async def test_export_streams_every_document_in_id_order(database, client, monkeypatch):
+    monkeypatch.setattr(settings, 'EXPORT_BATCH_SIZE', 3)
+    ids = sorted(ObjectId() for _ in range(10))
+    await database['Comment'].insert_many([comment(id) for id in reversed(ids)])
+
+    exported = lines(await client.get('/export/comments/'))
+
+    assert [document['_id'] for document in exported] == [str(id) for id in ids]
+
+
+async def test_export_resumes_after_the_last_id(database, client):
+    ids = sorted(ObjectId() for _ in range(5))
+    await database['Comment'].insert_many([comment(id) for id in ids])
+
+    exported = lines(await client.get('/export/comments/', params={'after': str(ids[1])}))
+
+    assert [document['_id'] for document in exported] == [str(id) for id in ids[2:]]
+
+
+async def test_export_starts_from_since(database, client):
+    now = datetime.now(tz=timezone.utc).replace(microsecond=0)
+    old, new = ObjectId.from_datetime(now - timedelta(days=2)), ObjectId.from_datetime(now)
+    await database['Comment'].insert_many([comment(old), comment(new)])
+
+    exported = lines(await client.get('/export/comments/', params={'since': (now - timedelta(days=1)).isoformat()}))
+
+    assert [document['_id'] for document in exported] == [str(new)]
+
+
+async def test_user_export_leaves_out_passwords(database, client):
+    await UserInDB(
+        username='user', given_name='Us', family_name='Er', email='user@example.com', password='secret'
+    ).insert()
+
+    exported = lines(await client.get('/export/users/'))
+
+    assert [user['email'] for user in exported] == ['user@example.com']
+    assert 'password' not in exported[0]
+
+
+async def peak_memory(chunks: int | None = None) -> tuple[int, int]:
+    # The generator is driven directly: the test client buffers whole responses, a real server does not.
+    exported = 0
+    tracemalloc.start()
+
+    try:
+        stream = export_documents(Comment, None, None, None)
+        async for chunk in stream:
+            exported += chunk.count('\n')
+            if chunks is not None and (chunks := chunks - 1) == 0:
+                await stream.aclose()
+                break
+
+        return exported, tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+
+async def test_export_memory_stays_flat(mongodb):
+    collection = mongodb['Comment']
+    for _ in range(0, EXPORTED_COMMENTS, 10_000):
+        await collection.insert_many([comment(ObjectId()) for _ in range(10_000)], ordered=False)
+
+    # The first few batches set the baseline: the whole collection must not cost much more than they do.
+    _, baseline = await peak_memory(chunks=5)
+    exported, peak = await peak_memory()
+
+    assert exported == EXPORTED_COMMENTS
+    assert peak < 2 * baseline
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from core.http import close_http_client, start_http_client
+from core.routers.auth import google
+from core.routers.auth.google import GoogleKeys, verify_google_id_token
+from core.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+CLIENT_ID = 'client-id.apps.googleusercontent.com'
+
+
+def make_key(kid: str) -> tuple[str, dict]:
+    pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+
+    return pem, {**jwk.construct(pem, 'RS256').public_key().to_dict(), 'kid': kid, 'use': 'sig'}
+
+
+class StubGoogle:
+    """ A local stand-in for Google's token, certs and userinfo endpoints. """
+
+    def __init__(self):
+        self.keys = dict([make_key('first')])
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def sign(self, kid: str = 'first', **claims) -> str:
+        pem = next(pem for pem, key in self.keys.items() if key['kid'] == kid)
+        claims = {
+            'iss': 'https://accounts.google.com',
+            'aud': CLIENT_ID,
+            'sub': '1234567890',
+            'email': 'jane@example.com',
+            'email_verified': True,
+            'given_name': 'Jane',
+            'family_name': 'Doe',
+            'iat': int(time.time()),
+            'exp': int(time.time()) + 3600,
+            **claims,
+        }
+
+        return jwt.encode(claims, pem, algorithm='RS256', headers={'kid': kid})
+
+    def rotate(self, kid: str):
+        self.keys = dict([make_key(kid)])
+
+    def count(self, path: str) -> int:
+        return sum(request == path for request in self.requests)
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def respond(self, body: dict, headers: dict[str, str] | None = None):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                stub.requests.append(path)
+
+                if path == '/certs':
+                    self.respond({'keys': list(stub.keys.values())}, {'Cache-Control': 'public, max-age=3600'})
+                else:
+                    self.respond({'id': '1234567890', 'email': 'jane@example.com', 'given_name': 'Jane'})
+
+            def do_POST(self):
+                stub.requests.append(urlparse(self.path).path)
+                form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+
+                self.respond(
+                    {
+                        'access_token': f'google-{form["code"][0]}',
+                        'expires_in': 3599,
+                        'token_type': 'Bearer',
+                        'id_token': stub.sign(),
+                    }
+                )
+
+        return Handler
+
+
+@pytest.fixture
+async def stub_google(monkeypatch):
+    stub = StubGoogle()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(settings, 'GOOGLE_CLIENT_ID', CLIENT_ID)
+    monkeypatch.setattr(settings, 'GOOGLE_TOKEN_URL', f'{stub.url}/token')
+    monkeypatch.setattr(settings, 'GOOGLE_CERTS_URL', f'{stub.url}/certs')
+    monkeypatch.setattr(settings, 'GOOGLE_USERINFO_URL', f'{stub.url}/userinfo')
+    monkeypatch.setattr(settings, 'FRONTEND_LOGIN_REDIRECT_URI', 'http://frontend.test/login')
+    monkeypatch.setattr(google, 'google_keys', GoogleKeys(min_refresh_interval=60))
+    start_http_client()
+
+    try:
+        yield stub
+
+    finally:
+        await close_http_client()
+        stub.server.shutdown()
+        stub.server.server_close()
+
+
+async def test_authenticate_trusts_the_id_token(database, client, stub_google):
+    response = await client.get('/auth/google/authenticate/', params={'code': 'abc'})
+
+    assert response.status_code == 307
+    assert response.headers['location'].startswith('http://frontend.test/login?access_token=')
+    assert stub_google.requests == ['/token', '/certs']
+
+    user = await database['User'].find_one({'email': 'jane@example.com'})
+    assert user['given_name'] == 'Jane'
+
+
+async def test_keys_are_cached(stub_google):
+    for _ in range(3):
+        assert (await verify_google_id_token(stub_google.sign(), 'access'))['email'] == 'jane@example.com'
+
+    assert stub_google.count('/certs') == 1
+
+
+async def test_rotated_keys_are_fetched_once(stub_google):
+    google.google_keys.min_refresh_interval = 0
+    await verify_google_id_token(stub_google.sign(), 'access')
+    stub_google.rotate('second')
+
+    for _ in range(3):
+        assert await verify_google_id_token(stub_google.sign('second'), 'access') is not None
+
+    assert stub_google.count('/certs') == 2
+
+
+async def test_invalid_token_with_a_known_key_does_not_refetch(stub_google):
+    await verify_google_id_token(stub_google.sign(), 'access')
+
+    assert await verify_google_id_token(stub_google.sign(aud='someone-else'), 'access') is None
+    assert await verify_google_id_token(stub_google.sign()[:-4] + 'AAAA', 'access') is None
+    assert stub_google.count('/certs') == 1
+
+
+async def test_unknown_keys_refetch_at_most_once_per_interval(stub_google):
+    google.google_keys.min_refresh_interval = 0.5
+    await verify_google_id_token(stub_google.sign(), 'access')
+    await asyncio.sleep(0.5)
+
+    forged = jwt.encode({'sub': 'x'}, make_key('made-up')[0], algorithm='RS256', headers={'kid': 'made-up'})
+    for _ in range(5):
+        assert await verify_google_id_token(forged, 'access') is None
+
+    assert stub_google.count('/certs') == 2
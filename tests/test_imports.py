@@ -0,0 +1,52 @@
+import json
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from core.models import Comment, CommentVote
+
+pytestmark = pytest.mark.anyio
+
+
+def ndjson(items: list[dict]) -> str:
+    return '\n'.join(json.dumps(item) for item in items) + '\n'
+
+
+async def test_vote_import_reports_each_failed_vote(database, client, monkeypatch):
+    comment = await Comment(message='comment', user_id=ObjectId(), product_id=ObjectId()).insert()
+    voter, rejected = str(ObjectId()), str(ObjectId())
+    collection = CommentVote.get_motor_collection()
+    bulk_write = collection.bulk_write
+
+    # Votes are written in the order of their last occurrence, which puts the rejected user's second.
+    async def fail_second(requests, **kwargs):
+        await bulk_write(requests[:1], **kwargs)
+        raise BulkWriteError({'writeErrors': [{'index': 1, 'code': 121, 'errmsg': 'Document failed validation'}]})
+
+    monkeypatch.setattr(collection, 'bulk_write', fail_second)
+
+    response = await client.post(
+        '/import/votes/',
+        content=ndjson(
+            [
+                {'action': 'upvote', 'comment_id': str(comment.id), 'user_id': voter},
+                {'action': 'upvote', 'comment_id': str(comment.id), 'user_id': rejected},
+                {'action': 'downvote', 'comment_id': str(ObjectId()), 'user_id': voter},
+                {'action': 'downvote', 'comment_id': str(comment.id), 'user_id': rejected},
+            ]
+        ),
+        headers={'Content-Type': 'application/x-ndjson'},
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result['received'], result['written'], result['failed']) == (4, 1, 3)
+    assert sorted((error['index'], error['detail']) for error in result['errors']) == [
+        (1, 'Document failed validation'),
+        (2, 'Comment not found.'),
+        (3, 'Document failed validation'),
+    ]
+
+    stored = await Comment.get_motor_collection().find_one({'_id': comment.id})
+    assert (stored['upvotes'], stored['downvotes']) == (1, 0)
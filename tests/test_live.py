@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from core.live import (
+    _DROPPED,
+    HEARTBEAT,
+    RESET,
+    LiveHub,
+    LocalBackplane,
+)
+
+pytestmark = pytest.mark.anyio
+
+PRODUCT = 'product'
+
+
+@pytest.fixture
+async def hub():
+    hub = LiveHub(LocalBackplane(), queue_size=3, replay_size=5, heartbeat=60.0, linger=0.05)
+    yield hub
+
+    if hub._heartbeats is not None:
+        hub._heartbeats.cancel()
+        await asyncio.gather(hub._heartbeats, return_exceptions=True)
+
+
+def frame_id(frame: bytes) -> str:
+    return frame.split(b'\n', 1)[0].removeprefix(b'id: ').decode()
+
+
+def drain(queue: asyncio.Queue) -> list:
+    frames = []
+    while not queue.empty():
+        frames.append(queue.get_nowait())
+
+    return frames
+
+
+async def publish(hub: LiveHub, count: int):
+    for i in range(count):
+        await hub.publish(PRODUCT, 'comment', {'i': i})
+
+
+async def test_events_reach_every_subscriber(hub):
+    first, second = await hub.subscribe(PRODUCT), await hub.subscribe(PRODUCT)
+
+    await publish(hub, 2)
+
+    frames = drain(first.queue)
+    assert frames == drain(second.queue)
+    assert [frame.split(b'\n')[1:3] for frame in frames] == [
+        [b'event: comment', b'data: {"i":0}'],
+        [b'event: comment', b'data: {"i":1}'],
+    ]
+
+
+async def test_slow_subscribers_are_dropped(hub):
+    slow, fast = await hub.subscribe(PRODUCT), await hub.subscribe(PRODUCT)
+
+    for _ in range(hub.queue_size + 1):
+        await publish(hub, 1)
+        drain(fast.queue)
+
+    assert drain(slow.queue) == [_DROPPED]
+    assert hub._channels[PRODUCT].subscribers == {fast}
+
+    await publish(hub, 1)
+    assert slow.queue.empty()
+    assert fast.queue.qsize() == 1
+
+
+async def test_stream_ends_when_dropped(hub):
+    stream = hub.stream(PRODUCT)
+    first = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+
+    await publish(hub, hub.queue_size + 1)
+
+    # The frames queued before the drop are discarded with it; the client resumes from its last event.
+    with pytest.raises(StopAsyncIteration):
+        await first
+
+
+async def test_reconnecting_clients_resume_after_their_last_event(hub):
+    listener = await hub.subscribe(PRODUCT)
+    await publish(hub, 3)
+    ids = [frame_id(frame) for frame in drain(listener.queue)]
+
+    resumed = await hub.subscribe(PRODUCT, last_event_id=ids[0])
+
+    assert [frame_id(frame) for frame in drain(resumed.queue)] == ids[1:]
+
+
+async def test_unknown_last_event_id_resets(hub):
+    await hub.subscribe(PRODUCT)
+    await publish(hub, 1)
+
+    resumed = await hub.subscribe(PRODUCT, last_event_id='not-an-event')
+
+    assert drain(resumed.queue) == [RESET]
+
+
+async def test_gap_larger_than_the_queue_resets(hub):
+    listener = await hub.subscribe(PRODUCT)
+    await publish(hub, 1)
+    last_seen = frame_id(drain(listener.queue)[0])
+
+    # More events than a queue holds were missed, though all of them are still in the replay buffer.
+    for _ in range(hub.queue_size + 1):
+        await publish(hub, 1)
+        drain(listener.queue)
+
+    resumed = await hub.subscribe(PRODUCT, last_event_id=last_seen)
+
+    assert drain(resumed.queue) == [RESET]
+
+
+async def test_events_older_than_the_replay_buffer_reset(hub):
+    listener = await hub.subscribe(PRODUCT)
+    await publish(hub, 1)
+    oldest = frame_id(drain(listener.queue)[0])
+
+    for _ in range(hub.replay_size):
+        await publish(hub, 1)
+        drain(listener.queue)
+
+    resumed = await hub.subscribe(PRODUCT, last_event_id=oldest)
+
+    assert drain(resumed.queue) == [RESET]
+
+
+async def test_channel_lingers_for_reconnects(hub):
+    listener = await hub.subscribe(PRODUCT)
+    await publish(hub, 1)
+    last_seen = frame_id(drain(listener.queue)[0])
+    hub._remove(listener)
+
+    # Events published while nobody listens are still buffered for the client coming back.
+    await publish(hub, 1)
+    resumed = await hub.subscribe(PRODUCT, last_event_id=last_seen)
+
+    assert len(drain(resumed.queue)) == 1
+    assert hub._channels[PRODUCT].linger is None
+
+    await asyncio.sleep(hub.linger * 2)
+    assert PRODUCT in hub._channels
+
+
+async def test_idle_channels_are_closed(hub):
+    listener = await hub.subscribe(PRODUCT)
+    hub._remove(listener)
+
+    assert PRODUCT in hub._channels
+    await asyncio.sleep(hub.linger * 2)
+
+    assert PRODUCT not in hub._channels
+    assert PRODUCT not in hub.backplane._channels
+
+
+async def test_idle_subscribers_get_heartbeats(hub):
+    hub.heartbeat = 0.01
+    idle, behind = await hub.subscribe(PRODUCT), await hub.subscribe(PRODUCT)
+    await publish(hub, 1)
+    drain(idle.queue)
+
+    await asyncio.sleep(0.05)
+
+    # Only empty queues are topped up: a listener with frames waiting is not idle.
+    assert drain(idle.queue) == [HEARTBEAT]
+    assert HEARTBEAT not in drain(behind.queue)
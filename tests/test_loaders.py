@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from core.loaders import BatchLoader, user_loader
+from core.models import UserInDB
+
+pytestmark = pytest.mark.anyio
+
+
+def recording_loader(results: dict) -> tuple[BatchLoader, list[list]]:
+    batches = []
+
+    async def load_batch(keys: list) -> dict:
+        batches.append(keys)
+        return {key: results[key] for key in keys if key in results}
+
+    return BatchLoader('test', load_batch), batches
+
+
+async def test_loads_in_the_same_tick_share_a_batch():
+    loader, batches = recording_loader({'a': 1, 'b': 2})
+
+    results = await asyncio.gather(loader.load('a'), loader.load('b'), loader.load('a'), loader.load_many(['b', 'a']))
+
+    assert results == [1, 2, 1, [2, 1]]
+    assert batches == [['a', 'b']]
+
+
+async def test_later_loads_get_a_new_batch():
+    loader, batches = recording_loader({'a': 1, 'b': 2})
+
+    assert await loader.load('a') == 1
+    assert await loader.load('b') == 2
+    assert batches == [['a'], ['b']]
+
+
+async def test_missing_keys_resolve_to_none():
+    loader, _ = recording_loader({'a': 1})
+
+    assert await loader.load_many(['a', 'missing']) == [1, None]
+
+
+async def test_a_failed_batch_fails_every_caller():
+
+    async def load_batch(keys: list) -> dict:
+        raise RuntimeError('batch failed')
+
+    loader = BatchLoader('test', load_batch)
+
+    results = await asyncio.gather(loader.load('a'), loader.load('b'), loader.load('a'), return_exceptions=True)
+
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_user_loader_returns_public_profiles(database):
+    user = await UserInDB(
+        username='user', given_name='Us', family_name='Er', email='user@example.com', password='secret'
+    ).insert()
+
+    found, missing = await user_loader.load_many([user.id, ObjectId()])
+
+    assert (found.id, found.username) == (user.id, 'user')
+    assert not hasattr(found, 'password')
+    assert missing is None
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from core import metrics
+from core.metrics import (
+    MONGODB_COMMANDS,
+    current_scope,
+    mongo_command_listener,
+    query_shape,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def commands(route: str, command: str) -> float:
+    return MONGODB_COMMANDS.labels(route, command)._value.get()
+
+
+def send_command(request_id: int, command_name: str, command: dict, reply: dict):
+    mongo_command_listener.started(SimpleNamespace(request_id=request_id, command=command))
+    mongo_command_listener.succeeded(
+        SimpleNamespace(request_id=request_id, command_name=command_name, duration_micros=100, reply=reply)
+    )
+
+
+def test_commands_are_counted_under_the_route_template():
+    scope = {'route': SimpleNamespace(path='/comment/{id}/')}
+    before = commands('/comment/{id}/', 'find')
+
+    token = current_scope.set(scope)
+    try:
+        send_command(1, 'find', {'find': 'Comment', 'filter': {'_id': ObjectId()}}, {'cursor': {'firstBatch': [{}]}})
+
+    finally:
+        current_scope.reset(token)
+
+    assert commands('/comment/{id}/', 'find') == before + 1
+
+
+def test_commands_outside_a_request_are_background():
+    before = commands('background', 'insert')
+
+    send_command(2, 'insert', {'insert': 'Comment'}, {'n': 1})
+
+    assert commands('background', 'insert') == before + 1
+
+
+def test_slow_commands_log_the_query_shape(monkeypatch, caplog):
+    monkeypatch.setattr(metrics.settings, 'MONGODB_SLOW_COMMAND_MS', 0)
+
+    send_command(3, 'find', {'filter': {'product_id': ObjectId(), '_id': {'$in': [1, 2]}}}, {})
+
+    assert "{'filter': {'product_id': '?', '_id': {'$in': ['?']}}}" in caplog.text
+
+
+def test_query_shape_keeps_clause_lists():
+    assert query_shape([{'$match': {'a': 1}}, {'$limit': 5}]) == [{'$match': {'a': '?'}}, {'$limit': '?'}]
+
+
+async def test_requests_count_their_commands_under_the_route(mongodb, client):
+    before = commands('/comment/{id}/', 'find')
+
+    response = await client.get(f'/comment/{ObjectId()}/')
+
+    assert response.status_code == 404
+    assert commands('/comment/{id}/', 'find') == before + 1
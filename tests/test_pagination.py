@@ -0,0 +1,158 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from core.constants import CommentAction
+from core.models import Comment, CommentVote
+from core.pagination import (
+    decode_cursor,
+    encode_cursor,
+    keyset_filter,
+    keyset_sort,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_cursor_round_trip():
+    id = ObjectId()
+    created_at = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+
+    value, decoded_id = decode_cursor(encode_cursor(created_at, id))
+
+    # BSON datetimes decode as naive UTC, which is how the driver compares them too.
+    assert value == created_at.replace(tzinfo=None)
+    assert decoded_id == id
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor', encode_cursor('x', ObjectId())[:-2], 'W10'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+
+    assert error.value.status_code == 400
+
+
+def test_keyset_sort_breaks_ties_on_id():
+    assert keyset_sort('-created_at') == [('created_at', -1), ('_id', -1)]
+    assert keyset_sort('updated_at') == [('updated_at', 1), ('_id', 1)]
+
+
+def test_descending_filter_keeps_missing_values_last():
+    id = ObjectId()
+
+    assert keyset_filter('-updated_at', encode_cursor(None, id)) == {'updated_at': None, '_id': {'$lt': id}}
+    assert {'updated_at': None} in keyset_filter('-updated_at', encode_cursor(1, id))['$or']
+
+
+async def seed_comments(product_id: ObjectId, count: int) -> list[Comment]:
+    # Pairs of comments share a timestamp, so the pages have to be cut on `_id` as well.
+    now = datetime.now(tz=timezone.utc)
+    comments = [
+        Comment(
+            id=ObjectId(),
+            message=f'comment {i}',
+            user_id=ObjectId(),
+            product_id=product_id,
+            created_at=now - timedelta(seconds=i // 2),
+            updated_at=None if i % 3 else now - timedelta(seconds=i),
+            is_reply=i % 4 == 0,
+        )
+        for i in range(count)
+    ]
+    await Comment.insert_many(comments)
+
+    return comments
+
+
+async def walk(client, params: dict) -> list[str]:
+    ids, cursor = [], None
+
+    while True:
+        response = await client.get('/comment/', params={**params, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+
+        page = response.json()
+        ids += [item['_id'] for item in page['items']]
+        if (cursor := page['next_cursor']) is None:
+            return ids
+
+
+@pytest.mark.parametrize('order_by', ['-created_at', 'created_at', '-updated_at', 'updated_at'])
+async def test_pages_cover_every_comment_once(database, client, order_by):
+    product_id = ObjectId()
+    comments = await seed_comments(product_id, 23)
+    await seed_comments(ObjectId(), 5)
+
+    ids = await walk(client, {'product_id': str(product_id), 'order_by': order_by, 'limit': 4})
+
+    assert len(ids) == len(set(ids)) == len(comments)
+    assert set(ids) == {str(comment.id) for comment in comments}
+
+
+async def test_pages_follow_the_order(database, client):
+    product_id = ObjectId()
+    comments = await seed_comments(product_id, 10)
+
+    ids = await walk(client, {'product_id': str(product_id), 'limit': 3})
+
+    expected = sorted(comments, key=lambda comment: (comment.created_at, comment.id), reverse=True)
+    assert ids == [str(comment.id) for comment in expected]
+
+
+async def test_is_reply_filter(database, client):
+    product_id = ObjectId()
+    comments = await seed_comments(product_id, 12)
+
+    ids = await walk(client, {'product_id': str(product_id), 'is_reply': 'false', 'limit': 5})
+
+    assert set(ids) == {str(comment.id) for comment in comments if not comment.is_reply}
+
+
+async def test_invalid_cursor_is_rejected(database, client):
+    response = await client.get('/comment/', params={'product_id': str(ObjectId()), 'cursor': 'garbage'})
+
+    assert response.status_code == 400
+
+
+async def test_product_listing_sorts_on_the_index(mongodb):
+    # Without `is_reply`, the listing has to name both of its values to avoid an in-memory sort.
+    product_id = ObjectId()
+    await seed_comments(product_id, 50)
+
+    plan = await mongodb['Comment'].find(
+        {'product_id': product_id, 'is_reply': {'$in': [False, True]}},
+        sort=keyset_sort('-created_at'),
+        limit=21,
+    ).explain()
+
+    assert '"SORT"' not in str(plan['queryPlanner']['winningPlan']).replace("'", '"')
+
+
+def test_id_order_needs_no_tie_breaker():
+    id = ObjectId()
+
+    assert keyset_sort('-_id') == [('_id', -1)]
+    assert keyset_filter('-_id', encode_cursor(id, id)) == {'_id': {'$lt': id}}
+
+
+async def test_vote_listing_is_paginated(database, client):
+    votes = [
+        CommentVote(id=ObjectId(), action=CommentAction.UPVOTE, comment_id=ObjectId(), user_id=ObjectId())
+        for _ in range(7)
+    ]
+    await CommentVote.insert_many(votes)
+
+    ids, cursor = [], None
+    while True:
+        response = await client.get('/comment-vote/', params={'limit': 3, **({'cursor': cursor} if cursor else {})})
+        page = response.json()
+        assert len(page['items']) <= 3
+
+        ids += [item['_id'] for item in page['items']]
+        if (cursor := page['next_cursor']) is None:
+            break
+
+    assert ids == [str(vote.id) for vote in reversed(votes)]
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from core.etag import product_comments_scope, replies_scope
+from core.jobs.refresh_hot_scores import refresh_hot_scores
+from core.models import CollectionVersion, Comment
+from core.ranking import hot_score_expression, ranking_stages
+from core.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+
+def comment(created_at: datetime, score: int, parent_id: ObjectId | None = None) -> dict:
+    return {
+        '_id': ObjectId.from_datetime(created_at),
+        'message': 'comment',
+        'user_id': ObjectId(),
+        'product_id': ObjectId(),
+        'created_at': created_at,
+        'is_reply': parent_id is not None,
+        'parent_id': parent_id,
+        'upvotes': score,
+        'downvotes': 0,
+        'score': score,
+        'hot_score': 0.0,
+    }
+
+
+async def test_hot_score_decays_from_now(database):
+    now = datetime.now(tz=timezone.utc).replace(microsecond=0)
+    await database['Comment'].insert_one(comment(now - timedelta(hours=1), 6))
+
+    await database['Comment'].update_many({}, [{'$set': {'hot_score': hot_score_expression(now)}}])
+
+    stored = await database['Comment'].find_one()
+    assert stored['hot_score'] == pytest.approx(6 / 3 ** settings.HOT_SCORE_GRAVITY)
+
+
+async def test_ranking_stages_score_unvoted_comments_zero(database):
+    await database['Comment'].insert_one(comment(datetime.now(tz=timezone.utc), 0))
+
+    await database['Comment'].update_many({}, ranking_stages())
+
+    stored = await database['Comment'].find_one()
+    assert (stored['top_score'], stored['hot_score']) == (0.0, 0.0)
+
+
+async def test_posted_rankings_are_ignored(database, client):
+    parent = comment(datetime.now(tz=timezone.utc), 0)
+    parent_id = parent['_id']
+    await database['Comment'].insert_one(parent)
+
+    for url in ('/comment/', f'/replies/{parent_id}/'):
+        response = await client.post(
+            url,
+            json={
+                'message': 'comment',
+                'user_id': str(ObjectId()),
+                'product_id': str(parent['product_id']),
+                'top_score': 1.0,
+                'hot_score': 1000.0,
+            },
+        )
+        assert response.status_code == 201
+        assert (response.json()['top_score'], response.json()['hot_score']) == (0.0, 0.0)
+
+        stored = await database['Comment'].find_one({'_id': ObjectId(response.json()['_id'])})
+        assert (stored['top_score'], stored['hot_score']) == (0.0, 0.0)
+
+
+async def test_refresh_bumps_the_listings_of_recent_comments(database):
+    now = datetime.now(tz=timezone.utc)
+    parent_id = ObjectId()
+    recent = comment(now - timedelta(hours=1), 4, parent_id=parent_id)
+    old = comment(now - timedelta(days=settings.HOT_SCORE_WINDOW_DAYS + 1), 4)
+    await database['Comment'].insert_many([recent, old])
+
+    assert await refresh_hot_scores(batch_size=1) == 1
+
+    scores = {stored['_id']: stored['hot_score'] async for stored in Comment.get_motor_collection().find()}
+    assert scores[recent['_id']] > 0
+    assert scores[old['_id']] == 0.0
+
+    versions = {version['scope'] async for version in CollectionVersion.get_motor_collection().find()}
+    assert versions == {product_comments_scope(recent['product_id']), replies_scope(parent_id)}
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from core import ratelimit
+from core.main import app
+from core.ratelimit import MemoryRateLimitBackend, RateLimitMiddleware
+from core.routers.auth.utils import create_access_token
+from core.settings import RateLimit
+
+pytestmark = pytest.mark.anyio
+
+LIMIT = RateLimit(rate=2.0, burst=3)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Stands in for `time.monotonic` in the rate limiter only, so the event loop keeps real time. """
+    clock = SimpleNamespace(now=1_000.0)
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=lambda: clock.now, time=time.time))
+
+    return clock
+
+
+def make_backend(**options) -> MemoryRateLimitBackend:
+    return MemoryRateLimitBackend(**{'shards': 1, 'max_keys': 100, 'idle_seconds': 60.0, **options})
+
+
+async def test_burst_then_retry_after(clock):
+    backend = make_backend()
+
+    assert [await backend.acquire('client', LIMIT) for _ in range(LIMIT.burst)] == [0.0] * LIMIT.burst
+    assert await backend.acquire('client', LIMIT) == pytest.approx(1 / LIMIT.rate)
+
+    # Another client has a bucket of its own.
+    assert await backend.acquire('other', LIMIT) == 0.0
+
+
+async def test_bucket_refills_at_the_rate(clock):
+    backend = make_backend()
+    for _ in range(LIMIT.burst):
+        await backend.acquire('client', LIMIT)
+
+    clock.now += 0.25
+    assert await backend.acquire('client', LIMIT) == pytest.approx(0.25)
+
+    clock.now += 0.25
+    assert await backend.acquire('client', LIMIT) == 0.0
+    assert await backend.acquire('client', LIMIT) > 0
+
+
+async def test_refill_stops_at_the_burst(clock):
+    backend = make_backend()
+    await backend.acquire('client', LIMIT)
+
+    clock.now += 3_600
+    results = [await backend.acquire('client', LIMIT) for _ in range(LIMIT.burst + 1)]
+
+    assert results[:LIMIT.burst] == [0.0] * LIMIT.burst
+    assert results[-1] > 0
+
+
+async def test_shards_evict_the_least_recently_used_over_max_keys(clock):
+    backend = make_backend(max_keys=2)
+
+    for key in ('first', 'second', 'third'):
+        await backend.acquire(key, LIMIT)
+
+    assert list(backend._shards[0]) == ['second', 'third']
+
+
+async def test_shards_evict_idle_buckets(clock):
+    backend = make_backend(idle_seconds=10.0)
+    await backend.acquire('idle', LIMIT)
+
+    clock.now += 11
+    await backend.acquire('active', LIMIT)
+
+    assert list(backend._shards[0]) == ['active']
+
+
+async def test_rejected_requests_get_retry_after(database):
+    limited = RateLimitMiddleware(app, limits={'GET /user/': RateLimit(rate=0.5, burst=2)}, backend=make_backend())
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=limited), base_url='http://test') as client:
+        assert [(await client.get('/user/')).status_code for _ in range(2)] == [200, 200]
+
+        rejected = await client.get('/user/')
+        assert rejected.status_code == 429
+        assert rejected.headers['retry-after'] == '2'
+        assert rejected.json() == {'detail': 'Too many requests.'}
+
+        # Other routes, methods and clients are not limited by this client's bucket.
+        assert (await client.get('/comment/')).status_code == 200
+        assert (await client.delete('/user/')).status_code == 405
+
+        token, _ = create_access_token({'sub': 'user@example.com'})
+        authenticated = await client.get('/user/', headers={'Authorization': f'Bearer {token}'})
+        assert authenticated.status_code == 200
+
+
+async def test_concurrency_cap():
+    entered, release = asyncio.Event(), asyncio.Event()
+    slow = FastAPI()
+
+    @slow.get('/slow/')
+    async def wait():
+        entered.set()
+        await release.wait()
+
+    limited = RateLimitMiddleware(slow, limits={'/slow/': RateLimit(rate=100.0, burst=100, concurrency=1)})
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=limited), base_url='http://test') as client:
+        first = asyncio.ensure_future(client.get('/slow/'))
+        await entered.wait()
+
+        second = await client.get('/slow/')
+        assert second.status_code == 429
+        assert second.headers['retry-after'] == '1'
+
+        release.set()
+        assert (await first).status_code == 200
+        assert (await client.get('/slow/')).status_code == 200
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+from mongomock.collection import Collection
+
+from core.bloom import BloomFilter
+from core.models import UserInDB
+from core.routers.auth.registered_emails import RegisteredEmails, registered_emails
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def ignore_hints(monkeypatch):
+    """ mongomock rejects index hints, which only change how the server runs the query. """
+    find = Collection.find
+
+    def find_without_hint(self, *args, hint=None, **kwargs):
+        return find(self, *args, **kwargs)
+
+    monkeypatch.setattr(Collection, 'find', find_without_hint)
+
+
+def emails(count: int, domain: str = 'example.com') -> list[str]:
+    return [f'user{i}@{domain}' for i in range(count)]
+
+
+async def create_users(*addresses: str, password: str = 'hash'):
+    await UserInDB.get_motor_collection().insert_many(
+        [
+            {'username': email, 'given_name': 'Us', 'family_name': 'Er', 'email': email, 'password': password}
+            for email in addresses
+        ]
+    )
+
+
+def make_registered_emails(**options) -> RegisteredEmails:
+    # A tiny error rate keeps the "certainly absent" assertions from failing by chance.
+    return RegisteredEmails(
+        **{'error_rate': 1e-9, 'min_capacity': 1_000, 'refresh_interval': 60.0, 'rebuild_interval': 3_600.0, **options}
+    )
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(5_000, 0.01)
+    for email in emails(5_000):
+        bloom.add(email)
+
+    assert all(email in bloom for email in emails(5_000))
+
+
+def test_bloom_filter_keeps_to_its_error_rate():
+    bloom = BloomFilter(5_000, 0.01)
+    for email in emails(5_000):
+        bloom.add(email)
+
+    false_positives = sum(email in bloom for email in emails(20_000, domain='elsewhere.com'))
+
+    assert false_positives / 20_000 < 0.02
+    assert bloom.estimated_error_rate() == pytest.approx(0.01, rel=0.5)
+
+
+def test_bloom_filter_counts_new_items_only():
+    bloom = BloomFilter(100, 0.01)
+
+    assert bloom.add('user@example.com')
+    assert not bloom.add('user@example.com')
+    assert bloom.count == 1
+
+
+async def test_everyone_might_exist_before_the_first_build():
+    assert make_registered_emails().might_exist('anyone@example.com')
+
+
+async def test_rebuild_loads_every_user(database, ignore_hints):
+    await create_users(*emails(50))
+    registered = make_registered_emails()
+
+    await registered.rebuild()
+
+    assert all(registered.might_exist(email) for email in emails(50))
+    assert not registered.might_exist('nobody@example.com')
+
+
+async def test_new_users_are_picked_up(database, ignore_hints):
+    registered = make_registered_emails()
+    await registered.rebuild()
+
+    # One user signs up on this worker, the other on another worker and only shows up on refresh.
+    registered.add('local@example.com')
+    await create_users('remote@example.com')
+    assert not registered.might_exist('remote@example.com')
+
+    await registered.refresh()
+
+    assert registered.might_exist('local@example.com')
+    assert registered.might_exist('remote@example.com')
+
+
+async def test_removed_users_are_forgotten_on_rebuild(database, ignore_hints):
+    await create_users('stays@example.com', 'leaves@example.com')
+    registered = make_registered_emails(refresh_interval=0.01)
+    await registered.start()
+
+    try:
+        await UserInDB.get_motor_collection().delete_one({'email': 'leaves@example.com'})
+        registered.remove('leaves@example.com')
+        assert registered.might_exist('leaves@example.com')
+
+        await asyncio.sleep(0.1)
+
+        assert not registered.might_exist('leaves@example.com')
+        assert registered.might_exist('stays@example.com')
+
+    finally:
+        await registered.close()
+
+
+async def test_absent_emails_are_answered_from_memory(database, client, monkeypatch):
+    bloom = BloomFilter(1_000, 1e-9)
+    bloom.add('known@example.com')
+    monkeypatch.setattr(registered_emails, '_filter', bloom)
+
+    async def find_one(*args, **kwargs):
+        raise AssertionError('The database was queried.')
+
+    monkeypatch.setattr(UserInDB.get_motor_collection(), 'find_one', find_one)
+
+    response = await client.get('/auth/exists/', params={'email': 'unknown@example.com'})
+
+    assert response.json() == {'exists': False, 'is_local': False}
+
+
+async def test_possible_matches_are_checked_in_the_database(mongodb, client, monkeypatch):
+    # mongomock can neither take the index hint nor compute `is_local` in a projection.
+    await create_users('local@example.com')
+    await create_users('google@example.com', password='')
+
+    bloom = BloomFilter(1_000, 1e-9)
+    for email in ('local@example.com', 'google@example.com', 'deleted@example.com'):
+        bloom.add(email)
+    monkeypatch.setattr(registered_emails, '_filter', bloom)
+
+    async def exists(email: str) -> dict:
+        return (await client.get('/auth/exists/', params={'email': email})).json()
+
+    assert await exists('local@example.com') == {'exists': True, 'is_local': True}
+    assert await exists('google@example.com') == {'exists': True, 'is_local': False}
+    assert await exists('deleted@example.com') == {'exists': False, 'is_local': False}
+
+
+async def test_without_the_filter_every_email_is_checked_in_the_database(mongodb, client, monkeypatch):
+    await create_users('local@example.com')
+    monkeypatch.setattr(registered_emails, '_filter', None)
+
+    response = await client.get('/auth/exists/', params={'email': 'local@example.com'})
+
+    assert response.json() == {'exists': True, 'is_local': True}
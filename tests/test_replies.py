@@ -0,0 +1,149 @@
+import importlib
+
+import pytest
+from beanie import init_beanie
+from bson import ObjectId
+
+from core.models import Comment
+
+pytestmark = pytest.mark.anyio
+
+parent_reference = importlib.import_module('migrations.20261018090000_comment_parent_reference')
+
+
+async def post_comment(client, product_id: ObjectId, **fields) -> dict:
+    response = await client.post(
+        '/comment/',
+        json={
+            'message': 'comment',
+            'user_id': str(ObjectId()),
+            'product_id': str(product_id),
+            **fields
+        },
+    )
+    assert response.status_code == 201
+
+    return response.json()
+
+
+async def post_reply(client, parent_id, product_id, **fields):
+    return await client.post(
+        f'/replies/{parent_id}/',
+        json={
+            'message': 'reply',
+            'user_id': str(ObjectId()),
+            'product_id': str(product_id),
+            **fields
+        },
+    )
+
+
+async def stored(id) -> dict:
+    return await Comment.get_motor_collection().find_one({'_id': ObjectId(id)})
+
+
+async def test_comments_cannot_be_created_as_replies(database, client):
+    product_id = ObjectId()
+    parent = await post_comment(client, product_id)
+
+    comment = await post_comment(client, product_id, is_reply=True, parent_id=parent['_id'], reply_count=5)
+
+    assert (comment['is_reply'], comment['parent_id'], comment['reply_count']) == (False, None, 0)
+    assert (await stored(parent['_id']))['reply_count'] == 0
+
+
+async def test_create_reply_counts_it_on_the_parent(database, client):
+    product_id = ObjectId()
+    parent = await post_comment(client, product_id)
+
+    response = await post_reply(client, parent['_id'], product_id, reply_count=5)
+
+    assert response.status_code == 201
+    reply = response.json()
+    assert (reply['is_reply'], reply['parent_id'], reply['reply_count']) == (True, parent['_id'], 0)
+    assert (await stored(parent['_id']))['reply_count'] == 1
+
+
+async def test_create_reply_to_a_missing_parent(database, client):
+    response = await post_reply(client, ObjectId(), ObjectId())
+
+    assert response.status_code == 404
+
+
+async def test_create_reply_on_another_product(database, client):
+    parent = await post_comment(client, ObjectId())
+
+    response = await post_reply(client, parent['_id'], ObjectId())
+
+    assert response.status_code == 400
+    assert (await stored(parent['_id']))['reply_count'] == 0
+    assert await Comment.get_motor_collection().count_documents({'parent_id': ObjectId(parent['_id'])}) == 0
+
+
+async def test_failed_reply_insert_gives_the_count_back(database, client, monkeypatch):
+    product_id = ObjectId()
+    parent = await post_comment(client, product_id)
+
+    async def fail(self, *args, **kwargs):
+        raise RuntimeError('insert failed')
+
+    monkeypatch.setattr(Comment, 'insert', fail)
+
+    with pytest.raises(RuntimeError):
+        await post_reply(client, parent['_id'], product_id)
+
+    assert (await stored(parent['_id']))['reply_count'] == 0
+
+
+async def test_replies_are_paged_with_a_cursor(database, client):
+    product_id = ObjectId()
+    parent = await post_comment(client, product_id)
+    created = [(await post_reply(client, parent['_id'], product_id)).json()['_id'] for _ in range(5)]
+
+    ids, cursor = [], None
+    while True:
+        params = {'order_by': 'created_at', 'limit': 2, **({'cursor': cursor} if cursor else {})}
+        response = await client.get(f'/replies/{parent["_id"]}/', params=params)
+        assert response.status_code == 200
+
+        page = response.json()
+        assert len(page['items']) <= 2
+        ids += [item['_id'] for item in page['items']]
+        if (cursor := page['next_cursor']) is None:
+            break
+
+    assert ids == created
+
+
+async def test_replies_of_a_missing_parent(database, client):
+    response = await client.get(f'/replies/{ObjectId()}/')
+
+    assert response.status_code == 404
+
+
+async def test_migration_moves_replies_to_parent_id(database):
+    collection = database['Comment']
+    parent_id, reply_ids, lone_id = ObjectId(), [ObjectId(), ObjectId()], ObjectId()
+    await collection.insert_many(
+        [
+            {'_id': parent_id, 'message': 'parent', 'replies': [*reply_ids, ObjectId()]},
+            *[{'_id': reply_id, 'message': 'reply', 'replies': []} for reply_id in reply_ids],
+            {'_id': lone_id, 'message': 'lone'},
+        ]
+    )
+
+    # The migration runner initializes the migration's own document models the same way.
+    await init_beanie(database=database, document_models=[parent_reference.Comment])
+    migration = parent_reference.Forward()
+    # Interrupted or not, running it again must leave the same result.
+    for _ in range(2):
+        await migration.move_replies_to_parent_id.function(migration, None)
+
+    documents = {document['_id']: document async for document in collection.find()}
+    assert documents[parent_id]['reply_count'] == 2
+    assert all('replies' not in document for document in documents.values())
+    assert all(
+        (documents[reply_id]['parent_id'], documents[reply_id]['is_reply']) == (parent_id, True)
+        for reply_id in reply_ids
+    )
+    assert documents[lone_id]['reply_count'] == 0
@@ -0,0 +1,58 @@
+from bson import ObjectId
+
+from core.routers.product import build_thread
+
+
+def reply(parent: dict) -> dict:
+    return {'_id': ObjectId(), 'parent_id': parent['_id']}
+
+
+def make_root(children: int, grandchildren: int) -> tuple[dict, list[dict]]:
+    root = {'_id': ObjectId(), 'parent_id': None}
+    level1 = [reply(root) for _ in range(children)]
+    level2 = [reply(child) for child in level1 for _ in range(grandchildren)]
+    root['descendants'] = level1 + level2
+
+    return root, level1
+
+
+def test_replies_are_nested_under_their_parents():
+    root, level1 = make_root(children=2, grandchildren=2)
+
+    thread = build_thread([root], max_nodes=10)
+
+    [item] = thread['items']
+    assert [child['_id'] for child in item['children']] == [child['_id'] for child in level1]
+    assert all(len(child['children']) == 2 for child in item['children'])
+    assert not thread['truncated']
+
+
+def test_every_root_gets_its_own_share():
+    roots = [make_root(children=5, grandchildren=0)[0] for _ in range(3)]
+
+    thread = build_thread(roots, max_nodes=2)
+
+    assert [len(item['children']) for item in thread['items']] == [2, 2, 2]
+    assert thread['truncated']
+
+
+def test_the_deepest_levels_are_cut_first():
+    root, _ = make_root(children=2, grandchildren=3)
+
+    thread = build_thread([root], max_nodes=4)
+
+    [item] = thread['items']
+    assert len(item['children']) == 2
+    assert sum(len(child['children']) for child in item['children']) == 2
+    assert thread['truncated']
+
+
+def test_replies_below_a_cut_are_skipped():
+    root, level1 = make_root(children=1, grandchildren=0)
+    orphan = {'_id': ObjectId(), 'parent_id': ObjectId()}
+    root['descendants'].append(orphan)
+
+    thread = build_thread([root], max_nodes=1)
+
+    assert len(thread['items'][0]['children']) == 1
+    assert not thread['truncated']
@@ -0,0 +1,185 @@
+import importlib
+from datetime import datetime, timezone
+
+import pytest
+from beanie import init_beanie
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from core import votes as votes_module
+from core.constants import CommentAction
+from core.models import Comment, CommentVote
+from core.votes import (
+    DUPLICATE_KEY_ERROR,
+    VoteBuffer,
+    apply_votes,
+    tally_delta,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def test_tally_delta():
+    assert tally_delta(None, CommentAction.UPVOTE) == {'upvotes': 1, 'downvotes': 0, 'score': 1}
+    assert tally_delta(CommentAction.UPVOTE, CommentAction.DOWNVOTE) == {'upvotes': -1, 'downvotes': 1, 'score': -2}
+    assert tally_delta(CommentAction.DOWNVOTE, None) == {'upvotes': 0, 'downvotes': -1, 'score': 1}
+
+
+async def create_comment() -> Comment:
+    return await Comment(message='comment', user_id=ObjectId(), product_id=ObjectId()).insert()
+
+
+async def test_apply_votes_updates_the_tallies(database):
+    comment = await create_comment()
+    first, second = ObjectId(), ObjectId()
+
+    assert await apply_votes({(comment.id, user_id): CommentAction.UPVOTE for user_id in (first, second)}) == {}
+    assert await apply_votes({(comment.id, first): CommentAction.DOWNVOTE}) == {}
+
+    stored = await Comment.get_motor_collection().find_one({'_id': comment.id})
+    assert (stored['upvotes'], stored['downvotes'], stored['score']) == (1, 1, 0)
+    assert await CommentVote.get_motor_collection().count_documents({'comment_id': comment.id}) == 2
+
+
+async def test_apply_votes_skips_the_tallies_of_failed_votes(database, monkeypatch):
+    comment = await create_comment()
+    written, rejected = (comment.id, ObjectId()), (comment.id, ObjectId())
+    collection = CommentVote.get_motor_collection()
+    bulk_write = collection.bulk_write
+
+    async def fail_second(requests, **kwargs):
+        await bulk_write(requests[:1], **kwargs)
+        raise BulkWriteError({'writeErrors': [{'index': 1, 'code': 121, 'errmsg': 'Document failed validation'}]})
+
+    monkeypatch.setattr(collection, 'bulk_write', fail_second)
+
+    failed = await apply_votes({written: CommentAction.UPVOTE, rejected: CommentAction.UPVOTE})
+
+    assert list(failed) == [rejected]
+    assert failed[rejected]['errmsg'] == 'Document failed validation'
+    assert (await Comment.get_motor_collection().find_one({'_id': comment.id}))['upvotes'] == 1
+
+
+def make_buffer() -> VoteBuffer:
+    return VoteBuffer(max_size=100, flush_size=10, flush_interval=0.01, submit_timeout=0.1, max_retry_delay=0.04)
+
+
+async def test_failed_flush_requeues_with_backoff(monkeypatch):
+    buffer = make_buffer()
+    calls = []
+
+    async def unavailable(votes):
+        calls.append(dict(votes))
+        raise AutoReconnect('primary stepped down')
+
+    monkeypatch.setattr(votes_module, 'apply_votes', unavailable)
+
+    old, new, other = (ObjectId(), ObjectId()), (ObjectId(), ObjectId()), (ObjectId(), ObjectId())
+    await buffer.submit(*old, CommentAction.UPVOTE)
+    await buffer.submit(*other, CommentAction.UPVOTE)
+
+    delays = []
+    for _ in range(4):
+        assert not await buffer.flush()
+        delays.append(buffer._retry_delay)
+
+    assert delays == [0.01, 0.02, 0.04, 0.04]
+
+    # A vote submitted after the failure replaces the one put back.
+    await buffer.submit(*old, CommentAction.DOWNVOTE)
+    await buffer.submit(*new, CommentAction.UPVOTE)
+
+    async def written(votes):
+        calls.append(dict(votes))
+        return {}
+
+    monkeypatch.setattr(votes_module, 'apply_votes', written)
+
+    assert await buffer.flush()
+    assert calls[-1] == {old: CommentAction.DOWNVOTE, other: CommentAction.UPVOTE, new: CommentAction.UPVOTE}
+    assert buffer._retry_delay == 0
+    assert not buffer._pending
+
+
+async def test_flush_retries_only_votes_which_lost_an_insert_race(monkeypatch):
+    buffer = make_buffer()
+    raced, invalid = (ObjectId(), ObjectId()), (ObjectId(), ObjectId())
+
+    async def partly_written(votes):
+        return {
+            raced: {'code': DUPLICATE_KEY_ERROR, 'errmsg': 'E11000 duplicate key error'},
+            invalid: {'code': 121, 'errmsg': 'Document failed validation'},
+        }
+
+    monkeypatch.setattr(votes_module, 'apply_votes', partly_written)
+
+    await buffer.submit(*raced, CommentAction.UPVOTE)
+    await buffer.submit(*invalid, CommentAction.UPVOTE)
+
+    assert await buffer.flush()
+    assert buffer._pending == {raced: CommentAction.UPVOTE}
+
+
+async def test_close_gives_up_after_a_failed_drain(monkeypatch):
+    buffer = make_buffer()
+
+    async def unavailable(votes):
+        raise AutoReconnect('no primary')
+
+    monkeypatch.setattr(votes_module, 'apply_votes', unavailable)
+
+    buffer.start()
+    await buffer.submit(ObjectId(), ObjectId(), CommentAction.UPVOTE)
+    await buffer.close()
+
+    assert not buffer._pending
+
+
+async def test_posted_tallies_are_ignored(database, client):
+    parent = await create_comment()
+
+    for url in ('/comment/', f'/replies/{parent.id}/'):
+        response = await client.post(
+            url,
+            json={
+                'message': 'comment',
+                'user_id': str(ObjectId()),
+                'product_id': str(parent.product_id),
+                'upvotes': 1000,
+                'downvotes': 0,
+                'score': 1000,
+            },
+        )
+        assert response.status_code == 201
+
+        stored = await Comment.get_motor_collection().find_one({'_id': ObjectId(response.json()['_id'])})
+        assert (stored['upvotes'], stored['downvotes'], stored['score']) == (0, 0, 0)
+
+
+async def test_dedupe_migration_recomputes_every_voted_comment(database):
+    migration = importlib.import_module('migrations.20261018100000_comment_vote_dedupe')
+    await init_beanie(database=database, document_models=[migration.Comment, migration.CommentVote])
+
+    # Neither comment had duplicate votes; the first predates the stored tallies.
+    untallied, tallied, voter = ObjectId(), ObjectId(), ObjectId()
+    await database['Comment'].insert_many(
+        [
+            {'_id': untallied, 'created_at': datetime.now(tz=timezone.utc)},
+            {'_id': tallied, 'created_at': datetime.now(tz=timezone.utc), 'upvotes': 5, 'downvotes': 0, 'score': 5},
+        ]
+    )
+    await database['CommentVote'].insert_many(
+        [
+            {'comment_id': untallied, 'user_id': voter, 'action': 'upvote'},
+            {'comment_id': untallied, 'user_id': ObjectId(), 'action': 'downvote'},
+            {'comment_id': untallied, 'user_id': ObjectId(), 'action': 'upvote'},
+            {'comment_id': tallied, 'user_id': voter, 'action': 'upvote'},
+        ]
+    )
+
+    forward = migration.Forward()
+    await forward.collapse_duplicate_votes.function(forward, None)
+
+    comments = {comment['_id']: comment async for comment in database['Comment'].find()}
+    assert (comments[untallied]['upvotes'], comments[untallied]['downvotes'], comments[untallied]['score']) == (2, 1, 1)
+    assert (comments[tallied]['upvotes'], comments[tallied]['score']) == (1, 1)